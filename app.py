@@ -1,8 +1,31 @@
+import io
 import os
+import time
 import streamlit as st
 import openai
-import docx2txt
 import importlib
+import itertools
+import queue
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from response_cache import ResponseCache, make_key
+from structured_output import build_request, groups, merge_chunks, split_response
+from repair import add_reports, describe, repair_response, repair_share, rules_section
+from chunking import DEFAULT_CHUNK_TOKENS, merge_responses, split_into_chunks
+from question_model import correct_german_chars, parse_questions, validate_questions
+from qti_export import write_qti_package
+from prompt_registry import load_registry
+from model_backend import DEFAULT_LOCAL_BASE, resolve_model
+from tracing import Tracer, trace
+from text_extraction import extract_text
+from job_queue import FINAL_STATES, JobQueue
+from dedup import QuestionIndex
+from run_manifest import RunManifest
+from result_store import ResultStore
+from page_ingestion import (
+    DEFAULT_PAGES_PER_REQUEST, PAGE_EXTENSIONS, batch_pages, inline_pages, is_page_file, missing_dependency, page_content, render_pages
+)
 
 # Import transformation scripts
 try:
@@ -11,25 +34,633 @@ except ImportError:
     st.error("Transformation script not found. Please ensure 'transform_script_1' is available.")
     transform_script_1 = None
 
+MODEL = "gpt-3.5-turbo"
+VISION_MODEL = "gpt-4o-mini"  # Scanned pages and page images need a vision-capable model
+SYSTEM_PROMPT = "You are a helpful assistant that generates educational content."
+INITIAL_PROMPT = "wait for the next interaction of the user."
+MAX_CHUNK_WORKERS = 16
+SEARCH_LIMIT = 20
+SEARCH_FACETS = ("type", "subject", "level")
+TRANSFORM_TEMPLATE = "fib_json"  # Its FIB JSON answers become Inlinechoice and FIB questions
+
+@st.cache_resource
+def get_prompt_registry():
+    # Prompt files are read and composed once per process, not on every rerun
+    return load_registry()
+
+def question_templates(structured=False):
+    # Response i answers registry template i; response 0 is the initial acknowledgement. The
+    # per-type prompts have never sent the SC template (position 0). Structured requests cover
+    # SC as well, as the last response, so every other response keeps its index.
+    templates = get_prompt_registry().templates
+    return templates[1:] + templates[:1] if structured else templates[1:]
+
 def process_text_file(file):
     try:
-        if file.name.lower().endswith('.docx'):
-            return docx2txt.process(file)
-        else:  # For .txt, .md, and other text files
-            return file.getvalue().decode('utf-8')
+        # .docx is streamed from word/document.xml; .txt, .md and other text files are decoded.
+        # Results are memoized by content hash, so reruns with the same upload skip parsing.
+        return extract_text(file, file.name)
     except Exception as e:
         st.error(f"Error processing file: {e}")
         return ""
 
-def correct_german_chars(text):
-    return text.replace('ß', 'ss')
+@st.cache_data(max_entries=8, show_spinner="Rendering pages...")
+def get_pages(data, name):
+    # Rendered pages live in the page cache on disk; only their hashes are kept here
+    return render_pages(io.BytesIO(data), name)
+
+def response_path(index, suffix="", file_prefix="", output_folder="."):
+    return os.path.join(output_folder, f"{file_prefix}_response_{index}{suffix}.txt")
 
 def save_response(text, index, suffix="", file_prefix="", output_folder="."):
-    output_filename = os.path.join(output_folder, f"{file_prefix}_response_{index}{suffix}.txt")
+    output_filename = response_path(index, suffix, file_prefix, output_folder)
     with open(output_filename, 'w', encoding='utf-8') as f:
         f.write(correct_german_chars(text))
     return output_filename
 
+def drop_duplicates(index, text, source, tracer=None, **attributes):
+    # Removes questions already generated for the course before the response is written
+    if index is None:
+        return text, []
+    with trace(tracer, "dedup", **attributes) as span:
+        text, removed = index.filter_response(text, source)
+        span.attributes["removed"] = len(removed)
+    return text, removed
+
+def build_base_messages(content):
+    # Identical for every question type so providers can reuse the cached prefix;
+    # only the final user message (the question-type prompt) differs per call
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+def request_completion(chat_messages, model=MODEL, usage=None, response_format=None, cancel=None):
+    # The model name picks the backend ("local:..." for a local server); calls are queued
+    # behind that backend's rate budget and 429s and 5xx are retried with backoff
+    backend, name = resolve_model(model)
+    response_content, response_usage = backend.scheduler().run(
+        lambda messages: backend.complete(messages, name, response_format), chat_messages, cancel=cancel
+    )
+    if usage is not None:
+        usage["source"] = "API"
+        usage.update(response_usage)
+    return response_content
+
+def stream_completion(chat_messages, model=MODEL, usage=None, cancel=None):
+    # Errors surface when the stream is opened, so only that step needs scheduling
+    backend, name = resolve_model(model)
+    stream_usage = usage if usage is not None else {}
+    texts = backend.scheduler().run(lambda messages: backend.open_stream(messages, name, stream_usage), chat_messages, cancel=cancel)
+    if usage is not None:
+        usage["source"] = "API"
+    yield from texts
+
+def cached_completion(chat_messages, cache=None, request=request_completion, model=MODEL, run=None, position=(1, 0)):
+    # run (a DocumentRun) records the output in the run manifest and counts cache hits as reused;
+    # position is the (response index, chunk index) the output belongs to
+    response_content = None
+    if cache is not None:
+        key = make_key(chat_messages, model)
+        response_content = cache.get(key)
+    reused = response_content is not None
+    if not reused:
+        response_content = request(chat_messages)
+        if cache is not None:
+            cache.put(key, response_content)
+    if run is not None:
+        run.record(*position, chat_messages, model, reused)
+    return response_content
+
+def repair_completion(prompt, model=MODEL, usage=None):
+    # Repairs need no document, only the broken questions and their rules. They bypass the
+    # response cache: a rejected fix would otherwise be replayed in every later round and run.
+    chat_messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+    return request_completion(chat_messages, model=model, usage=usage)
+
+def repair_broken(response_content, template, model=MODEL, tracer=None, **attributes):
+    # Re-requests only the questions that break the template's //rules and splices the fixes back in
+    with trace(tracer, "repair", **attributes) as span:
+        usages = []
+
+        def complete(prompt, usage):
+            usages.append(usage)
+            return repair_completion(prompt, model, usage)
+
+        response_content, report = repair_response(response_content, rules_section(template.text), complete, model)
+        for usage in usages:
+            span.add_usage(usage, model)
+        span.attributes["broken"] = report["broken"]
+        span.attributes["repaired"] = report["repaired"]
+    return response_content, report
+
+@contextmanager
+def request_pool(max_workers, executor=None):
+    # A shared executor (the batch CLI's, across documents) is used as is and left running
+    if executor is not None:
+        yield executor
+        return
+    own = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        yield own
+    except GeneratorExit:
+        # The caller stopped early (a cancelled job): requests not started yet are dropped and
+        # running ones finish in the background instead of holding the caller up
+        own.shutdown(wait=False, cancel_futures=True)
+        raise
+    own.shutdown()
+
+def generate_responses(base_messages, prompts, max_workers=1, cache=None, start=1, tracer=None, document_run=None, model=MODEL, models=None,
+                       executor=None, cancel=None):
+    # Yields (index, content, error, usage) as soon as each prompt finishes.
+    # models optionally gives one model per prompt; the rest use model. Once the cancel
+    # event is set, requests that have not been sent yet fail with scheduler.Cancelled.
+    def run(i, prompt, model, usage):
+        request = lambda chat_messages: request_completion(chat_messages, model=model, usage=usage, cancel=cancel)
+        with trace(tracer, "request", response=i) as span:
+            response_content = cached_completion(
+                base_messages + [{"role": "user", "content": prompt}], cache, request=request, model=model, run=document_run, position=(i, 0)
+            )
+            span.add_usage(usage, model)
+        return response_content
+
+    with request_pool(max_workers, executor) as executor:
+        futures = {}
+        for k, prompt in enumerate(prompts):
+            usage = {}
+            futures[executor.submit(run, start + k, prompt, models[k] if models else model, usage)] = (start + k, usage)
+        for future in as_completed(futures):
+            i, usage = futures[future]
+            try:
+                yield i, future.result(), None, usage
+            except Exception as e:
+                yield i, None, e, usage
+
+def generate_streaming_responses(base_messages, prompts, max_workers=1, cache=None, start=1, file_prefix="", output_folder=".", tracer=None,
+                                 document_run=None, model=MODEL, models=None, executor=None, cancel=None):
+    # Yields ("delta", index, text) while tokens arrive and ("done", index, content, error, usage, filename)
+    # once a prompt finishes. Tokens are appended to <response file>.partial as they arrive, which
+    # replaces the response file only once the response is complete; a failed request leaves the old one.
+    events = queue.Queue()
+
+    def run(i, prompt, model, usage):
+        filename = response_path(i, file_prefix=file_prefix, output_folder=output_folder)
+        partial = filename + ".partial"
+        streamed = False
+        try:
+            with trace(tracer, "request", response=i, stream=True) as span:
+                with open(partial, 'w', encoding='utf-8') as f:
+                    started = time.perf_counter()
+
+                    def emit(text):
+                        if "first_token_seconds" not in span.attributes:
+                            span.attributes["first_token_seconds"] = round(time.perf_counter() - started, 6)
+                        f.write(correct_german_chars(text))
+                        f.flush()
+                        events.put(("delta", i, text))
+
+                    def request(chat_messages):
+                        nonlocal streamed
+                        streamed = True
+                        parts = []
+                        for text in stream_completion(chat_messages, model=model, usage=usage, cancel=cancel):
+                            parts.append(text)
+                            emit(text)
+                        return "".join(parts)
+
+                    response_content = cached_completion(
+                        base_messages + [{"role": "user", "content": prompt}], cache, request=request, model=model,
+                        run=document_run, position=(i, 0)
+                    )
+                    if not streamed:
+                        emit(response_content)  # Cache or manifest hit: show it in one go
+                os.replace(partial, filename)
+                span.add_usage(usage, model)
+            events.put(("done", i, response_content, None, usage, filename))
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            events.put(("done", i, None, e, usage, filename))
+
+    with request_pool(max_workers, executor) as executor:
+        for k, prompt in enumerate(prompts):
+            executor.submit(run, start + k, prompt, models[k] if models else model, {})
+        remaining = len(prompts)
+        while remaining:
+            event = events.get()
+            if event[0] == "done":
+                remaining -= 1
+            yield event
+
+def generate_chunked_responses(chunks, prompts, max_workers=1, cache=None, start=1, tracer=None, model=MODEL, prepare=None, document_run=None,
+                               models=None, executor=None, cancel=None):
+    # Map: every (prompt, chunk) pair runs in parallel. Reduce: once all chunks of a prompt
+    # are back, their questions are merged and deduplicated and (index, content, error, usage) is yielded.
+    # A chunk is text or a list of content parts; prepare(chat_messages) runs just before sending.
+    def run(i, n, chunk, prompt, model, usage):
+        request = lambda chat_messages: request_completion(
+            prepare(chat_messages) if prepare else chat_messages, model=model, usage=usage, cancel=cancel
+        )
+        with trace(tracer, "request", response=i, chunk=n + 1) as span:
+            response_content = cached_completion(
+                build_base_messages(chunk) + [{"role": "user", "content": prompt}], cache, request=request, model=model,
+                run=document_run, position=(i, n)
+            )
+            span.add_usage(usage, model)
+        return response_content
+
+    with request_pool(max_workers, executor) as executor:
+        futures = {}
+        pending = {}
+        for k, prompt in enumerate(prompts):
+            i = start + k
+            pending[i] = len(chunks)
+            for n, chunk in enumerate(chunks):
+                usage = {}
+                futures[executor.submit(run, i, n, chunk, prompt, models[k] if models else model, usage)] = (i, n, usage)
+
+        results = {i: {} for i in pending}
+        errors = {i: [] for i in pending}
+        usages = {i: [] for i in pending}
+        for future in as_completed(futures):
+            i, n, usage = futures[future]
+            usages[i].append(usage)
+            try:
+                results[i][n] = future.result()
+            except Exception as e:
+                errors[i].append(f"chunk {n + 1}: {e}")
+            pending[i] -= 1
+            if pending[i]:
+                continue
+
+            total = {key: sum(u.get(key, 0) for u in usages[i]) for key in ("prompt_tokens", "cached_tokens", "completion_tokens")}
+            if any(u.get("source") for u in usages[i]):
+                total["source"] = "API"
+            error = "; ".join(errors[i]) or None
+            with trace(tracer, "merge", response=i):
+                response_content = merge_responses([results[i][n] for n in sorted(results[i])]) if results[i] else None
+            yield i, response_content, error, total
+            del results[i]
+
+def structured_completion(chunk, names, cache=None, model=MODEL, usage=None, prepare=None, run=None, position=(1, 0), cancel=None):
+    # One JSON request for the question types in names; returns {template name: response text}
+    prompt, response_format = build_request(get_prompt_registry(), names, model)
+
+    def request(chat_messages):
+        text = request_completion(
+            prepare(chat_messages) if prepare else chat_messages, model=model, usage=usage, response_format=response_format, cancel=cancel
+        )
+        split_response(text, names)  # Unusable answers raise here, before they are cached or recorded
+        return text
+
+    text = cached_completion(
+        build_base_messages(chunk) + [{"role": "user", "content": prompt}], cache, request=request, model=model, run=run, position=position
+    )
+    return split_response(text, names)
+
+def generate_structured_responses(chunks, templates, max_workers=1, cache=None, start=1, tracer=None, model=MODEL, models=None, prepare=None,
+                                  document_run=None, calls=1, executor=None, cancel=None):
+    # Every question type in one JSON call per chunk (or two, closed and open types), instead of one
+    # call per type. Yields (index, content, error, usage) per response like generate_responses; the
+    # usage of a call is reported on the first response it covers. Each call uses the model of that type.
+    names = [template.name for template in templates]
+    index = {name: start + k for k, name in enumerate(names)}
+    call_groups = groups(names, calls)
+
+    def run(group, n, chunk, model, usage):
+        with trace(tracer, "request", response=index[group[0]], chunk=n + 1, structured=",".join(group)) as span:
+            responses = structured_completion(
+                chunk, group, cache, model=model, usage=usage, prepare=prepare, run=document_run, position=(index[group[0]], n), cancel=cancel
+            )
+            span.add_usage(usage, model)
+        return responses
+
+    with request_pool(max_workers, executor) as executor:
+        futures = {}
+        for g, group in enumerate(call_groups):
+            group_model = models[names.index(group[0])] if models else model
+            for n, chunk in enumerate(chunks):
+                usage = {}
+                futures[executor.submit(run, group, n, chunk, group_model, usage)] = (g, n, usage)
+
+        pending = {g: len(chunks) for g in range(len(call_groups))}
+        results = {g: {} for g in pending}
+        errors = {g: [] for g in pending}
+        usages = {g: [] for g in pending}
+        for future in as_completed(futures):
+            g, n, usage = futures[future]
+            usages[g].append(usage)
+            try:
+                results[g][n] = future.result()
+            except Exception as e:
+                errors[g].append(f"chunk {n + 1}: {e}" if len(chunks) > 1 else str(e))
+            pending[g] -= 1
+            if pending[g]:
+                continue
+
+            total = {key: sum(u.get(key, 0) for u in usages[g]) for key in ("prompt_tokens", "cached_tokens", "completion_tokens")}
+            if any(u.get("source") for u in usages[g]):
+                total["source"] = "API"
+            error = "; ".join(errors[g]) or None
+            for k, name in enumerate(call_groups[g]):
+                with trace(tracer, "merge", response=index[name]):
+                    response_content = merge_chunks([results[g][n][name] for n in sorted(results[g])]) if results[g] else None
+                yield index[name], response_content, error, total if k == 0 else {}
+            del results[g]
+
+def build_chunks(content="", pages=None, split_long=True, chunk_tokens=DEFAULT_CHUNK_TOKENS, pages_per_request=DEFAULT_PAGES_PER_REQUEST):
+    if pages:
+        # A few pages per vision request; each request's answer is cached by its page hashes
+        return [page_content(batch) for batch in batch_pages(pages, pages_per_request)]
+    return split_into_chunks(content, chunk_tokens) if split_long else [content]
+
+def run_pipeline(chunks, templates, models, file_prefix="manual_input", output_folder=".", cache=None, tracer=None, document_run=None,
+                 pages=False, parallel=True, send_initial=False, structured_calls=None, stream=False, on_delta=None, repair=True,
+                 question_index=None, store=None, run_id=None, questions=None, executor=None, cancel=None):
+    # The "Process" pipeline shared by the page, the job worker and the batch CLI: dispatch, repair,
+    # dedup, save, validate, store and transform. Yields (entry, text) per finished response; entry is
+    # JSON-serializable (it is the job's progress record) and text is the saved response. Parsed
+    # questions are appended to questions; on_delta(index, text) receives streamed tokens.
+    # Setting the cancel event stops the run: unsent requests are dropped and nothing more is yielded.
+    prompts = [template.text for template in templates]
+    models = list(models)
+    types = {i: template.type for i, template in enumerate(templates, 1)}
+    # The initial acknowledgement only costs a round-trip; keep it opt-in
+    if send_initial:
+        prompts = [INITIAL_PROMPT] + prompts
+        models = [MODEL] + models
+        types[0] = "Initial"
+    if tracer is not None:
+        tracer.question_types.update(types)
+    start = 0 if send_initial else 1
+    response_models = dict(enumerate([VISION_MODEL] * len(prompts) if pages else models, start))
+    model = VISION_MODEL if pages else MODEL
+    prepare = inline_pages if pages else None
+    workers = len(prompts) if parallel else 1
+
+    if structured_calls:
+        call_count = len(groups([template.name for template in templates], structured_calls)) * len(chunks)
+        sources = [generate_structured_responses(
+            chunks, templates, max_workers=min(call_count, MAX_CHUNK_WORKERS) if parallel else 1, cache=cache, start=1, tracer=tracer,
+            model=model, models=None if pages else models[-len(templates):], prepare=prepare, document_run=document_run,
+            calls=structured_calls, executor=executor, cancel=cancel
+        )]
+        if send_initial:
+            sources.insert(0, generate_chunked_responses(
+                chunks, [INITIAL_PROMPT], cache=cache, start=0, tracer=tracer, model=model, prepare=prepare, document_run=document_run,
+                executor=executor, cancel=cancel
+            ))
+    elif pages or len(chunks) > 1:
+        sources = [generate_chunked_responses(
+            chunks, prompts, max_workers=min(workers * len(chunks), MAX_CHUNK_WORKERS), cache=cache, start=start, tracer=tracer,
+            model=model, prepare=prepare, document_run=document_run, models=None if pages else models, executor=executor, cancel=cancel
+        )]
+    elif stream:
+        sources = [streamed_results(generate_streaming_responses(
+            build_base_messages(chunks[0]), prompts, max_workers=workers, cache=cache, start=start, file_prefix=file_prefix,
+            output_folder=output_folder, tracer=tracer, document_run=document_run, models=models, executor=executor, cancel=cancel
+        ), on_delta)]
+    else:
+        sources = [generate_responses(
+            build_base_messages(chunks[0]), prompts, max_workers=workers, cache=cache, start=start, tracer=tracer,
+            document_run=document_run, models=models, executor=executor, cancel=cancel
+        )]
+
+    try:
+        for i, response_content, error, usage in itertools.chain(*sources):
+            if cancel is not None and cancel.is_set():
+                break
+            entry = {"index": i, "type": types.get(i, ""), "error": str(error) if error else None}
+            if response_content is not None:
+                if repair and i > 0:
+                    response_content, report = repair_broken(response_content, templates[i - 1], response_models[i], tracer, response=i)
+                    if report["broken"]:
+                        entry["repair"] = report
+                response_content, removed = drop_duplicates(question_index, response_content, f"{file_prefix}_response_{i}", tracer, response=i)
+                entry["duplicates"] = len(removed)
+                with trace(tracer, "save", response=i):
+                    entry["file"] = save_response(response_content, i, file_prefix=file_prefix, output_folder=output_folder)
+                # Catch malformed OLAT output before it reaches the import wizard
+                with trace(tracer, "validate", response=i):
+                    parsed = parse_questions(response_content)
+                    entry["questions"] = len(parsed)
+                    entry["invalid"] = [
+                        f"#{position} {question.type} '{question.title}': " + "; ".join(errors)
+                        for position, question, errors in validate_questions(parsed)
+                    ]
+                if questions is not None:
+                    questions.extend(parsed)
+                if store is not None:
+                    with trace(tracer, "store", response=i):
+                        store.add_response(file_prefix, i, parsed, model=response_models[i], run_id=run_id)
+                if i > 0 and templates[i - 1].name == TRANSFORM_TEMPLATE and transform_script_1:
+                    transform_response(entry, response_content, file_prefix, output_folder, response_models[i], tracer, question_index, store,
+                                       run_id, questions)
+            yield entry, response_content
+    finally:
+        # Closing the generators drops their pending requests instead of waiting for them
+        for source in sources:
+            source.close()
+
+def streamed_results(events, on_delta=None):
+    # Streaming events -> (index, content, error, usage) like the other generators; the file is rewritten on save
+    for event in events:
+        if event[0] == "delta":
+            if on_delta is not None:
+                on_delta(event[1], event[2])
+            continue
+        _, i, response_content, error, usage, filename = event
+        yield i, response_content, error, usage
+
+def transform_response(entry, response_content, file_prefix, output_folder, model, tracer=None, question_index=None, store=None, run_id=None,
+                       questions=None):
+    # FIB JSON -> Inlinechoice and FIB questions, saved, deduplicated and stored as the "_transformed" variant
+    i = entry["index"]
+    skipped = []
+    try:
+        with trace(tracer, "transform", response=i):
+            transformed_text = transform_script_1.transform_output(response_content, skipped)
+        transformed_text, removed = drop_duplicates(question_index, transformed_text, f"{file_prefix}_response_{i}_transformed", tracer, response=i)
+        entry["duplicates"] += len(removed)
+        transformed_questions = parse_questions(transformed_text)
+        if questions is not None:
+            questions.extend(transformed_questions)
+        if store is not None:
+            with trace(tracer, "store", response=i):
+                store.add_response(file_prefix, i, transformed_questions, variant="_transformed", model=model, run_id=run_id)
+        with trace(tracer, "save", response=i):
+            entry["transformed_file"] = save_response(transformed_text, i, suffix="_transformed", file_prefix=file_prefix, output_folder=output_folder)
+    except Exception as e:
+        skipped.append(f"Error applying transformation: {e}")
+    if skipped:
+        entry["transform_errors"] = skipped
+
+def finish_run(entries, questions, tracer, document_run, output_folder, file_prefix):
+    # Run totals, the QTI package and the trace exports; shown on the page and stored as a job's result
+    result = {"output_folder": output_folder, "responses": sorted(entries, key=lambda e: e["index"])}
+    result["duplicates"] = sum(entry.get("duplicates", 0) for entry in result["responses"])
+    repairs = [entry["repair"] for entry in result["responses"] if entry.get("repair")]
+    if repairs:
+        result["repair"] = {}
+        for report in repairs:
+            add_reports(result["repair"], report)
+        generated = tracer.totals("request")
+        result["repair"]["generation_tokens"] = generated["prompt_tokens"] + generated["completion_tokens"]
+    if document_run is not None:
+        result["reused"] = document_run.reused
+        result["generated"] = document_run.generated
+    if questions:
+        result["qti"] = os.path.join(output_folder, f"{file_prefix}_qti21.zip")
+        with trace(tracer, "qti_export"):
+            result["qti_count"] = write_qti_package(questions, result["qti"])
+    if tracer.spans:
+        result["summary"] = tracer.summary()
+        result["totals"] = tracer.totals()
+        # Spans as JSON lines for ad-hoc analysis, metrics for a Prometheus textfile collector
+        for key, name, data in (("trace", f"{file_prefix}_trace.jsonl", tracer.to_jsonl()), ("metrics", f"{file_prefix}_metrics.prom", tracer.to_prometheus())):
+            result[key] = os.path.join(output_folder, name)
+            with open(result[key], 'w', encoding='utf-8') as f:
+                f.write(data)
+    return result
+
+@st.cache_resource
+def get_question_index(course):
+    return QuestionIndex(course)
+
+@st.cache_resource
+def get_run_manifest():
+    return RunManifest()
+
+@st.cache_resource
+def get_result_store():
+    return ResultStore()
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+def tracked_jobs():
+    # Job ids live in the URL, so a refresh or a new tab still finds them
+    return [job_id for job_id in st.query_params.get("jobs", "").split(",") if job_id]
+
+def file_download(label, path, mime="text/plain", key=None):
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            st.download_button(label=label, data=f.read(), file_name=os.path.basename(path), mime=mime, key=key)
+
+def show_entry(entry, key):
+    i = entry["index"]
+    if entry["error"]:
+        st.error(f"Error with OpenAI API (response {i}): {entry['error']}")
+    if entry.get("repair"):
+        st.caption(f"Response {i}: {describe(entry['repair'])}")
+    if entry.get("duplicates"):
+        st.caption(f"Response {i}: {entry['duplicates']} near-duplicate questions dropped")
+    if entry.get("invalid"):
+        st.warning(f"Response {i}: {len(entry['invalid'])} of {entry['questions']} questions break the OLAT rules")
+        with st.expander(f"Rule violations in response {i}"):
+            for message in entry["invalid"]:
+                st.text(message)
+    if entry.get("transform_errors"):
+        st.warning(f"Response {i} transformed: " + "; ".join(entry["transform_errors"]))
+    file_download("Download Initial Response" if i == 0 else f"Download Response {i}", entry.get("file"), key=f"{key}_{i}")
+    file_download(f"Download Transformed Response {i}", entry.get("transformed_file"), key=f"{key}_{i}_transformed")
+
+def show_result(result, label, key):
+    if result.get("reused"):
+        st.caption(f"Run manifest: {result['reused']} of {result['reused'] + result['generated']} chunk/prompt outputs reused")
+    if result.get("repair"):
+        st.info(f"Rule repairs: {describe(result['repair'])}, {repair_share(result['repair'], result['repair']['generation_tokens'])}")
+    if result.get("duplicates"):
+        st.info(f"{result['duplicates']} near-duplicate questions dropped from {label}")
+    if result.get("qti"):
+        file_download(f"Download QTI 2.1 package ({result['qti_count']} questions)", result["qti"], "application/zip", key=f"{key}_qti")
+    if result.get("summary"):
+        st.table(result["summary"])
+        totals = result["totals"]
+        st.caption(
+            f"Prompt tokens: {totals['prompt_tokens']} ({totals['cached_tokens']} served from the provider's prefix cache), "
+            f"completion tokens: {totals['completion_tokens']}, estimated cost: ${totals['cost']:.4f}"
+        )
+        file_download("Download trace (JSON lines)", result.get("trace"), "application/x-ndjson", key=f"{key}_trace")
+        file_download("Download metrics (Prometheus)", result.get("metrics"), key=f"{key}_metrics")
+
+def render_job(job):
+    job_id = job["id"]
+    status = job["status"]
+    st.markdown(f"**{job['label']}**: job `{job_id}`, {status}")
+    progress = job["progress"]
+    if status == "queued":
+        st.caption(f"Position {get_job_queue().position(job_id)} in the queue")
+    elif status == "running" and progress.get("total"):
+        st.progress(progress["done"] / progress["total"], text=f"{progress['done']} of {progress['total']} responses")
+    if job["error"]:
+        st.error(job["error"])
+
+    result = job["result"] or {}
+    for entry in result.get("responses") or progress.get("responses", []):
+        show_entry(entry, job_id)
+    show_result(result, job["label"], job_id)
+
+    if status not in FINAL_STATES and st.button("Cancel", key=f"cancel_{job_id}"):
+        get_job_queue().cancel(job_id)
+        st.rerun()
+
+@st.fragment(run_every=3)
+def live_job(job_id):
+    # Only unfinished jobs poll; once the worker is done the whole page switches to the static view
+    job = get_job_queue().get(job_id)
+    if job["status"] in FINAL_STATES:
+        st.rerun()
+    render_job(job)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def search_facets(query, version):
+    # version is the store's; reruns from unrelated widgets reuse the counts until something is written
+    return {facet: [(value, count) for value, count in get_result_store().facet_counts(facet, query=query) if value] for facet in SEARCH_FACETS}
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def search_bank(query, filters, version):
+    started = time.perf_counter()
+    rows = get_result_store().search(query, SEARCH_LIMIT, **filters)
+    return rows, time.perf_counter() - started
+
+def show_search():
+    # Check whether a topic is already covered before generating more questions for it
+    with st.expander("Search the question bank"):
+        version = get_result_store().version()
+        query = st.text_input("Search words", help='German word forms match ("Zellen" finds "Zelle", "Zellmembran"); "quote" phrases')
+        facets = search_facets(query, version)
+        filters = {}
+        columns = st.columns(3)
+        for column, (facet, key, label) in zip(columns, (("type", "question_types", "Type"), ("subject", "subjects", "Subject"), ("level", "levels", "Level"))):
+            # Facet counts follow the search words, so empty choices never show up
+            counts = dict(facets[facet])
+            filters[key] = column.multiselect(label, list(counts), format_func=lambda value, counts=counts: f"{value} ({counts[value]})", key=f"search_{facet}")
+        if not query and not any(filters.values()):
+            return
+        rows, seconds = search_bank(query, filters, version)
+        st.caption(f"{len(rows)} best matches in {seconds * 1000:.0f} ms")
+        for row in rows:
+            st.markdown(f"**{row['title']}** · {row['question_type']} · {row['subject'] or '-'} · {row['level'] or '-'} · "
+                        f"`{row['document']}_response_{row['response']}{row['variant']}.txt`")
+            st.text(row["question"] or "")
+
+def show_jobs():
+    job_ids = tracked_jobs()
+    if not job_ids:
+        return
+    st.subheader("Background jobs")
+    for job_id in reversed(job_ids):
+        job = get_job_queue().get(job_id)
+        with st.container(border=True):
+            if job is None:
+                st.caption(f"Job {job_id} not found")
+            elif job["status"] in FINAL_STATES:
+                render_job(job)
+            else:
+                live_job(job_id)
+
 def main():
     st.title("OpenAI Text Generator")
 
@@ -41,733 +672,157 @@ def main():
 
     openai.api_key = api_key
 
-    # Pre-saved messages to send to the model
-    messages = [
-        """//steps SC
-1. The user uploads an image file with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 3 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_closed' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_closed.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_closed.txt'
-
-//bloom_levels_closed 
-# Bloom Level: 'Erinnern'
-Question Type: For recall-based tasks
-Design Approach:
-Focus on recognition and recall of facts.
-Use straightforward questions that require identification of correct information.
-Example:
-"How many members are in the Swiss Federal Council? "
-
-# Bloom Level: 'Verstehen'
-Question Type: Questions at this level assess comprehension and interpretation
-Design Approach:
-Emphasize explanation of ideas or concepts.
-Questions should assess comprehension through interpretation or summary.
-Example:
-"Which of the following best describes the role of cantonal governments in Switzerland?"
-
-# Bloom Level: 'Anwenden'
-Question Type: Application-based questions evaluate practical knowledge.
-Design Approach:
-Questions should require the application of knowledge in new situations.
-Include scenarios that necessitate the use of learned concepts in practical contexts.
-Example:
-"If a canton wants to introduce a new educational reform that differs from federal standards, which of the following steps is necessary? "
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 10 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_closed.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules SC ALWAYS 1 correct answer and 2 wrong: Typ\tSC\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nPoints\t1\n1\tcorrect_answer_placeholder_1\n-0.5\tincorrect_answer_placeholder_1\n-0.5\tincorrect_answer_placeholder_2\n-0.5\tincorrect_answer_placeholder_3
-
-//templates_closed.txt
-Typ	SC
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: Gewinner
-Question	Welche Mannschaft gewann 1982 die Fussball Weltmeisterschaft?
-Points	1
-1	Italien
--0.5	Brasilien
--0.5	Südafrika
--0.5	Spanien
-""",        
-        """//steps MC
-1. The user uploads an image or text with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 3 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_closed' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_closed.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_closed.txt'
-
-//bloom_levels_closed 
-# Bloom Level: 'Erinnern'
-Question Type: For recall-based tasks
-Design Approach:
-Focus on recognition and recall of facts.
-Use straightforward questions that require identification of correct information.
-Example:
-"How many members are in the Swiss Federal Council? "
-
-# Bloom Level: 'Verstehen'
-Question Type: Questions at this level assess comprehension and interpretation
-Design Approach:
-Emphasize explanation of ideas or concepts.
-Questions should assess comprehension through interpretation or summary.
-Example:
-"Which of the following best describes the role of cantonal governments in Switzerland?"
-
-# Bloom Level: 'Anwenden'
-Question Type: Application-based questions evaluate practical knowledge.
-Design Approach:
-Questions should require the application of knowledge in new situations.
-Include scenarios that necessitate the use of learned concepts in practical contexts.
-Example:
-"If a canton wants to introduce a new educational reform that differs from federal standards, which of the following steps is necessary? "
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 10 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_closed.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules MC ALWAYS 4 Answers ALWAYS 3 Points
-    - 1 correct: Typ\tMC\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nMax answers\t4\nMin answers\t0\nPoints\t3\n-1\tincorrect_answer_placeholder_1\n-1\tincorrect_answer_placeholder_1\n3\tcorrect_answer_placeholder_1\n-1\tincorrect_answer_placeholder_1
-    - 2 correct: Typ\tMC\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nMax answers\t4\nMin answers\t0\nPoints\t3\n-1\tincorrect_answer_placeholder_1\n-1\tincorrect_answer_placeholder_1\n1.5\tcorrect_answer_placeholder_1\n1.5\tcorrect_answer_placeholder_1
-    - 3 correct: Typ\tMC\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nMax answers\t4\nMin answers\t0\nPoints\t3\n-1\tincorrect_answer_placeholder_1\n1\tcorrect_answer_placeholder_1\n1\tcorrect_answer_placeholder_1\n1\tcorrect_answer_placeholder_1
-    - 4 correct: Typ\tMC\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nMax answers\t4\nMin answers\t0\nPoints\t3\n0.75\tcorrect_answer_placeholder_1\n0.75\tcorrect_answer_placeholder_1\n0.75\tcorrect_answer_placeholder_1\n0.75\tcorrect_answer_placeholder_1
-      
-//templates_closed.txt
-Typ	MC
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: Austragungsort
-Question	In welchen Ländern wurde zwischen dem Jahr 2000 und 2015 eine Fussball Weltmeisterschaft ausgetragen?
-Max answers	4
-Min answers	0
-Points	3
-1	Deutschland
-1	Brasilien
-1	Südafrika
--1	Schweiz
-Typ	MC
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: WM-Titeln
-Question	Welche Ländern haben mindestens eine WM gewonnen?
-Max answers	4
-Min answers	0
-Points	3
-1.5	Deutschland
-1.5	Brasilien
--1	Südafrika
--1	Schweiz
-Typ	MC
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: WM-Titeln
-Question	Welche Ländern haben mindestens drei WM gewonnen?
-Max answers	4
-Min answers	0
-Points	3
-0.75	Deutschland
-0.75	Brasilien
-0.75	Italien
-0.75	Argentinien
-Typ	MC
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: Austragungsort
-Question	Welches Land hat noch nie eine WM gewonnen?
-Max answers	4
-Min answers	0
-Points	3
--1	Deutschland
--1	Brasilien
--1	Südafrika
-3	Schweiz
-        """,
-        """//steps KPRIM
-1. The user uploads an image or text with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 3 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_closed' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_closed.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_closed.txt'
-
-//bloom_levels_closed 
-# Bloom Level: 'Erinnern'
-Question Type: For recall-based tasks
-Design Approach:
-Focus on recognition and recall of facts.
-Use straightforward questions that require identification of correct information.
-Example:
-"How many members are in the Swiss Federal Council? "
-
-# Bloom Level: 'Verstehen'
-Question Type: Questions at this level assess comprehension and interpretation
-Design Approach:
-Emphasize explanation of ideas or concepts.
-Questions should assess comprehension through interpretation or summary.
-Example:
-"Which of the following best describes the role of cantonal governments in Switzerland?"
-
-# Bloom Level: 'Anwenden'
-Question Type: Application-based questions evaluate practical knowledge.
-Design Approach:
-Questions should require the application of knowledge in new situations.
-Include scenarios that necessitate the use of learned concepts in practical contexts.
-Example:
-"If a canton wants to introduce a new educational reform that differs from federal standards, which of the following steps is necessary? "
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 10 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_closed.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules KPRIM ALWAYS 4 Answers, 0 to 4 correct: Typ\tKPRIM\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nPoints\t5\n+\tcorrect_answer_placeholder_1\n-\tincorrect_answer_placeholder_2\n-1\tincorrect_answer_placeholder_1\n{points_according_to_number_correct_answers}\tcorrect_answer_placeholder_1
-
-//templates_closed.txt
-Typ	KPRIM
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: Weltmeister
-Question	Die folgenden Länder haben die Fussball Weltmeistertitel bereits mehr als einmal gewonnen.
-Points	5
-+	Deutschland
--	Schweiz
--	Norwegen
-+	Uruguay
-Typ	KPRIM
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Fussball: Weltmeister
-Question	Die folgenden Länder haben die Fussball Weltmeistertitel noch nie gewonnen.
-Points	5
-+	Irland
-+	Schweiz
-+	Norwegen
--	Uruguay
-        """,
-        """//steps Truefalse
-1. The user uploads an image or text with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 3 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_closed' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_closed.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_closed.txt'
-
-//bloom_levels_closed 
-# Bloom Level: 'Erinnern'
-Question Type: For recall-based tasks
-Design Approach:
-Focus on recognition and recall of facts.
-Use straightforward questions that require identification of correct information.
-Example:
-"How many members are in the Swiss Federal Council? "
-
-# Bloom Level: 'Verstehen'
-Question Type: Questions at this level assess comprehension and interpretation
-Design Approach:
-Emphasize explanation of ideas or concepts.
-Questions should assess comprehension through interpretation or summary.
-Example:
-"Which of the following best describes the role of cantonal governments in Switzerland?"
-
-# Bloom Level: 'Anwenden'
-Question Type: Application-based questions evaluate practical knowledge.
-Design Approach:
-Questions should require the application of knowledge in new situations.
-Include scenarios that necessitate the use of learned concepts in practical contexts.
-Example:
-"If a canton wants to introduce a new educational reform that differs from federal standards, which of the following steps is necessary? "
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 10 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_closed.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules Truefalse ALWAYS 4 Answers, 1 to 4 correct: Typ\tTruefalse\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nPoints\t2\n\tUnanswered\tRight\tWrong\tcorrect_answer_placeholder_1\t0\t0.5\t-0.25\tcorrect_answer_placeholder_1\t0\t0.5\t-0.25\tincorrect_answer_placeholder_1\t0\t-0.25\t0.5t0.5\t-0.25\tincorrect_answer_placeholder_1\t0\t-0.25\t0.5
-- rules Drag&drop: Typ\tDrag&drop\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nPoints\t{Sum_of_correct_answer}\nAlgerien\tKenia\tNamibia\nNairobi\t-0.5\t1\t-0.5\nWindhoek\t-0.5\t-0.5\t1\nAlgier\t1\t-0.5\t-0.5
-
-//templates_closed.txt
-Typ	Truefalse		
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Hauptstädte Europa		
-Question	Sind die folgenden Aussagen richtig oder falsch?		
-Points	2		
-	Unanswered	Right	Wrong
-Paris ist in Frankreich	0	0.5	-0.25
-Bern ist in Schweiz	0	0.5	-0.25
-Stockholm ist in Danemark	0	-0.25	0.5
-Stockholm ist in Schweden	0	0.5	-0.25
-Typ    Truefalse
-Keywords    Seite {page_number}
-Coverage    Lehrmittel Allgemeinbildung
-Subject    /Allgemeinbildung/{subject}
-Level    {bloom_level}
-Title    Kontinente
-Question    Sind die folgenden Aussagen richtig oder falsch?
-Points    2
-    Unanswered    Right    Wrong
-Hongkong ist in Europa    0    -0.25    0.5
-Los Angeles ist in Nordamerika    0    0.5    -0.25
-Buenos Aires ist in Afrika    0    -0.25    0.5
-Berlin ist in Asien    0    -0.25    0.5
-        """,
-        """//steps Drag&drop
-1. The user uploads an image or a text with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 3 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_closed' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_closed.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_closed.txt'
-
-//bloom_levels_closed 
-# Bloom Level: 'Erinnern'
-Question Type: For recall-based tasks
-Design Approach:
-Focus on recognition and recall of facts.
-Use straightforward questions that require identification of correct information.
-Example:
-"How many members are in the Swiss Federal Council? "
-
-# Bloom Level: 'Verstehen'
-Question Type: Questions at this level assess comprehension and interpretation
-Design Approach:
-Emphasize explanation of ideas or concepts.
-Questions should assess comprehension through interpretation or summary.
-Example:
-"Which of the following best describes the role of cantonal governments in Switzerland?"
-
-# Bloom Level: 'Anwenden'
-Question Type: Application-based questions evaluate practical knowledge.
-Design Approach:
-Questions should require the application of knowledge in new situations.
-Include scenarios that necessitate the use of learned concepts in practical contexts.
-Example:
-"If a canton wants to introduce a new educational reform that differs from federal standards, which of the following steps is necessary? "
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 10 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_closed.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules Drag&drop may have 2-4 drop categories and 2 to 10 drag categories: Typ\tDrag&drop\nKeywords\tSeite {page_number}\nCoverage\tLehrmittel Allgemeinbildung\nSubject\t/Allgemeinbildung/{subject}\nLevel\t{bloom_level}\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nPoints\t{Sum_of_correct_answer}\n\tdrop_category1\tdrop_category2\tdrop_category3\ndrag_word_categoory2\t-0.5\t1\t-0.5\ndragword_category3\t-0.5\t-0.5\t1\nDragword_category1\t1\t-0.5\t-0.5
-
-//templates_closed.txt
-Typ	Drag&drop		
-Keywords	Seite {page_number}
-Coverage	Lehrmittel Allgemeinbildung
-Subject	/Allgemeinbildung/{subject}
-Level	{bloom_level}
-Title	Hauptstädte Afrika		
-Question	Ordnen Sie die folgenden Hauptstädte dem jeweiligen Land zu.		
-Points	3		
-	Algerien	Kenia	Namibia
-Nairobi	-0.5	1	-0.5
-Windhoek	-0.5	-0.5	1
-Algier	1	-0.5	-0.5
-        """,
-        """//steps
-1. The user uploads an image or a text or a text with content from a textbook.
-2. read the text and identify key topics to be understood
-3. read the instructions below
-4. generate for each bloom level 2 different custom texts with at least 6 sentences or 70-100 words.
-5. You identify 5 possible blanks according to the 'bloom_levels_closed'. 
-5. You always answer in German or in the Language of the upload
-6. extract {page_number} from the bottom of the image or text.
-7. extract {subject} from the top left or right 5% of the image or text.
-9. if there is a graphical representation you generate one additional question about it, focusing on the testing the understanding of the graphical representation and its data.
-10. ALWAYS follow the guidelines '//JSON Output' for formatting the text.
-
-//bloom_levels_closed 
-# Bloom Level: 'Erinnern'
-Design Approach:
-Write a custom text that focus on recognition and recall of basic facts, terms, and concepts.
-Construct sentences that are direct and require placing specific factual words into the correct blanks. 
-
-# Bloom Level: 'Verstehen'
-Design Approach:
-Write a custom text that necessitate comprehension of concepts or processes.
-Blanks should require students to demonstrate understanding by selecting words that correctly complete a sentence according to the context.
-
-//rules
-- IMPORTANT: the custom texts are full with no blanks
-- IMPORTANT: between each blank there are at least 5 words
-- IMPORTANT: Each custom text has at least 6 sentences
-- IMPORTANT: generate for each identified blank one wrong plausible blank according to //JSON Output.
-- IMPORTANT: the blanks and wrong_substitutes are unique
-
-//JSON Output
-[
-  {
-    "page_number": "{page_number}",
-    "subject": "{subject}",
-    "bloom_level": "{bloom_level}",
-    "text": "Custom Text 1 for Bloom Level Erinnern",
-    "blanks": ["blank1", "blank2", "blank3", "blank4", "blank5"],
-    "wrong_substitutes": [
-      "wrong substitute blank1",
-      "wrong substitute blank2",
-      "wrong substitute blank3",
-      "wrong substitute blank4",
-      "wrong substitute blank5"
-    ]
-  },
-  {
-    "page_number": "{page_number}",
-    "subject": "{subject}",
-    "bloom_level": "{bloom_level}",
-    "text": "Custom Text 2 for Bloom Level Erinnern",
-    "blanks": ["blank1", "blank2", "blank3", "blank4", "blank5"],
-    "wrong_substitutes": [
-      "wrong substitute blank1",
-      "wrong substitute blank2",
-      "wrong substitute blank3",
-      "wrong substitute blank4",
-      "wrong substitute blank5"
-    ]
-  },
-  {
-    "page_number": "{page_number}",
-    "subject": "{subject}",
-    "bloom_level": "{bloom_level}",
-    "text": "Custom Text 3 for Bloom Level Verstehen",
-    "blanks": ["blank1", "blank2", "blank3", "blank4", "blank5"],
-    "wrong_substitutes": [
-      "wrong substitute blank1",
-      "wrong substitute blank2",
-      "wrong substitute blank3",
-      "wrong substitute blank4",
-      "wrong substitute blank5"
-    ]
-  },
-  {
-    "page_number": "{page_number}",
-    "subject": "{subject}",
-    "bloom_level": "{bloom_level}",
-    "text": "Custom Text 4 for Bloom Level Verstehen",
-    "blanks": ["blank1", "blank2", "blank3", "blank4", "blank5"],
-    "wrong_substitutes": [
-      "wrong substitute blank1",
-      "wrong substitute blank2",
-      "wrong substitute blank3",
-      "wrong substitute blank4",
-      "wrong substitute blank5"
-    ]
-  }
-]
-
-single question Example Output :
-[
-  {
-    "page_number": "107",
-    "subject": "Politik Schweiz",
-    "bloom_level": "Erinnern",
-    "text": "Switzerland's direct democracy empowers citizens to participate in decision-making through referendums and initiatives. A referendum allows citizens to challenge laws passed by the parliament, requiring 50,000 signatures within 100 days to trigger a national vote. Conversely, a popular initiative enables citizens to propose constitutional amendments, needing 100,000 signatures within 18 months.",
-    "blanks": ["challenge laws", "50,000 signatures", "100 days", "100,000 signatures", "18 months"],
-    "wrong_substitutes": [
-      "change laws",
-      "10,000 signatures",
-      "1000 days",
-      "200,000 signatures",
-      "12 months"
-    ]
-  }
-]
-""",
-        """//steps FiB
-1. The user uploads an image or a text with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 2 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_open' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_open.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_open.txt'
-
-//bloom_levels_open 
-Bloom Level Remember:
-Question Type: For recall-based tasks
-Design Approach:
-- Create questions that prompt factual recall.
-- Ensure clear and concise wording.
-- provide answer choices.
-Specify the correct answer.
-Example:
-"How many members are there in the Swiss Federal Council? Name the principle that ensures a multi-party representation within the Federal Council."
-
-Bloom Level Understand:
-Question Type: Questions at this level assess comprehension and interpretation
-Design Approach:
-Focus on understanding relationships between concepts.
-Ensure clarity in instructions.
-Example:
-"Summarize the principles of Swiss federalism and how it differs from unitary states. What are the key responsibilities of the cantonal governments, and how do they interact with the federal government?"
-
-Bloom Level Apply:
-Question Type: Application-based questions evaluate practical knowledge
-Design Approach:
-Optimal for scenario-based questions.
-Specify a situation and ask students to apply concepts.
-Use clear criteria for correctness.
-Example:
-“A group of citizens is proposing a national referendum to amend the Swiss Constitution to include environmental protection as a fundamental duty of the state. Describe the process this group must follow to bring their proposal to a national vote.”
-
-Bloom Level Analyze:
-Question Type: For analytical tasks, consider using matching, sorting, or categorization questions. These can be automatically graded based on correct associations.
-Design Approach:
-Provide a set of items (e.g., concepts, definitions, scenarios).
-Ask students to match or categorize them appropriately.
-Use clear criteria to determine correctness (e.g., correct matches).
-Example:
-“Analyze the impact of direct democracy on the legislative process in Switzerland. How does the ability of citizens to call referendums and propose initiatives affect the creation and implementation of laws?”
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 10 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_open.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules FiB: Type\tFIB\nTitle\tgeneral_title_of_the_question\nPoints\t3\nText\tgeneral_question_text_placeholder\n3\tcorrect_answer_placeholder_1\t150
-
-
-//templates_open.txt
-Type	FIB	
-Title	Swiss federalism	
-Points	3	
-Text	Summarize the principles of Swiss federalism and how it differs from unitary states. What are the key responsibilities of the cantonal governments, and how do they interact with the federal government? 	
-3	Swiss federalism divides powers between the federal government and cantons, allowing cantonal autonomy, especially in education, health, and policing. Unlike unitary states with centralized power, this structure supports regional diversity and local decision-making, with coordinated federal-cantonal collaboration on national issues.	150
-""",
-        """//steps Essay
-1. The user uploads an image or a text with content from a textbook.
-2. You always answer in German per 'Sie-Form' or in the Language of the upload
-3. You generate 5 questions for each processed image or text. 
-4. extract {page_number} from the bottom of the image or text.
-5. extract {subject} from the top left or right 5% of the image or text.
-6. You develop materials based on the //instruction and //output
-7. if there is a graphical representation you generate at least 2 questions about it, focusing on the testing the understanding of the graphical representation and its data.
-
-//instruction
-- read the text and identify informations
-- refer to 'bloom_levels_open' for types of question to formulate according to the content of the image or text
-- refer to the 'templates_open.txt' for formatting the questions in your output
-- STRICTLY follow the formatting of 'templates_open.txt'
-
-//bloom_levels_open 
-Bloom Level Analyze:
-Question Type: For analytical tasks, consider using matching, sorting, or categorization questions. These can be automatically graded based on correct associations.
-Design Approach:
-Provide a set of items (e.g., concepts, definitions, scenarios).
-Ask students to match or categorize them appropriately.
-Use clear criteria to determine correctness (e.g., correct matches).
-Example:
-“Analyze the impact of direct democracy on the legislative process in Switzerland. How does the ability of citizens to call referendums and propose initiatives affect the creation and implementation of laws?”
-
-Bloom Level Evaluate:
-Question Type: Evaluative questions assess critical thinking.
-Design Approach:
-Present a scenario, argument, or case study.
-Ask students to evaluate, critique, or make judgments.
-Define clear criteria for correct answers.
-Example:
-"Evaluate the impact of direct democracy on social policy development in Switzerland. Consider specific examples where referendums or initiatives have significantly influenced social policies related to immigration, education, or healthcare. Assess the pros and cons of having such a direct mechanism for policy change "
-
-Bloom Level Create:
-Question Type: For creative tasks, employ open-ended questions, essay prompts, or project-based assignments that allow for originality and innovation.
-Design Approach:
-Encourage synthesis of ideas and concepts learned previously.
-Ask students to develop a unique product, solution, or idea.
-Provide guidelines that allow for creativity while still being assessable.
-Foster originality and encourage exploration of new ideas or perspectives.
-Example:
-"Create a proposal for a new political party in Switzerland that addresses a gap you've identified in the current political landscape. Define the party's core values, target demographic, and main political agenda. "
-
-//output
-- OUTPUT should only include the generated questions
-- ALWAYS generate 8 questions
-- READ the //rules to understand the rules for points and answers.
-- STRICTLY follow the formatting of the 'templates_open.txt'.
-- IMPORTANT: the output is just the questions
-- No additional explanation. ONLY the questions as plain text. never use ':' as a separator.
-
-//rules
-- rules Essay: Type\tESSAY\nTitle\tgeneral_title_of_the_question\nQuestion\tgeneral_question_text_placeholder\nPoints\t5\nMin\t200\nMax\t2000
-
-//templates_open.txt
-Typ	ESSAY
-Title	Political Party
-Question	Create a proposal for a new political party in Switzerland that addresses a gap you've identified in the current political landscape. Define the party's core values, target demographic, and main political agenda. 
-Points	1
-Min	200
-Max	2000
-""",
-    ]
-
     # Input method selection
     input_method = st.radio("Choose input method:", ["File Upload", "Text Input"])
 
     content = ""
+    pages = None
     file_prefix = "manual_input"
+    tracer = Tracer()
 
     if input_method == "File Upload":
-        uploaded_file = st.file_uploader("Choose a file", type=["txt", "docx"])
+        uploaded_file = st.file_uploader("Choose a file", type=["txt", "docx"] + [ext.lstrip(".") for ext in PAGE_EXTENSIONS])
         if uploaded_file:
             file_prefix = os.path.splitext(uploaded_file.name)[0]
-            content = process_text_file(uploaded_file)
+            if is_page_file(uploaded_file.name):
+                problem = missing_dependency(uploaded_file.name)
+                if problem:
+                    st.error(problem)
+                    return
+                with trace(tracer, "render", file=uploaded_file.name) as span:
+                    pages = get_pages(uploaded_file.getvalue(), uploaded_file.name)
+                    span.attributes["pages"] = len(pages)
+                pages_per_request = st.number_input("Pages per request", min_value=1, max_value=10, value=DEFAULT_PAGES_PER_REQUEST)
+            else:
+                with trace(tracer, "extract", file=uploaded_file.name):
+                    content = process_text_file(uploaded_file)
     else:
         content = st.text_area("Enter your text here:")
 
+    run_concurrently = st.checkbox("Run question types in parallel", value=True)
+    use_cache = st.checkbox(
+        "Reuse cached responses for unchanged text and prompts", value=True,
+        help="Only chunks and prompts whose inputs changed since the last run are sent again; every run is recorded in output/manifest.sqlite"
+    )
+    stream_output = st.checkbox("Stream responses as they are generated", value=True)
+    split_long = st.checkbox("Split long documents into chunks", value=True)
+    structured = st.checkbox(
+        "Generate all question types in one structured (JSON) request per chunk", value=False,
+        help="Sends the document once instead of once per question type; points are filled in from the rules. Responses are not streamed."
+    )
+    structured_calls = st.radio(
+        "Structured requests per chunk", [1, 2], horizontal=True, disabled=not structured,
+        help="Two requests split closed and open question types, for models with a small output limit"
+    )
+    chunk_tokens = st.number_input("Maximum tokens per chunk", min_value=500, max_value=12000, value=DEFAULT_CHUNK_TOKENS, step=500)
+    send_initial = st.checkbox("Send initial acknowledgement request (response 0)", value=False)
+    repair = st.checkbox(
+        "Repair questions that break the OLAT rules", value=True,
+        help="Only the broken questions and their rules are sent again, not the document"
+    )
+    deduplicate = st.checkbox("Drop questions that nearly duplicate ones already generated for the course", value=True)
+    course = st.text_input("Course", value="default", disabled=not deduplicate, help="Each course keeps its own index of generated questions")
+    templates = question_templates(structured)
+    with st.expander("Models per question type"):
+        st.caption(
+            f"`local:<model>` sends that question type to the local OpenAI-compatible server at {DEFAULT_LOCAL_BASE} "
+            "(set LOCAL_LLM_BASE), e.g. llama.cpp or vLLM. Scanned pages always use the vision model."
+        )
+        models = [st.text_input(template.type, value=template.model or MODEL, key=f"model_{template.name}") for template in templates]
+    workers = get_job_queue().live_workers()
+    background = st.checkbox(
+        f"Run as a background job ({workers} worker processes online; start more with `python worker.py`)",
+        value=workers > 0,
+        help="The job keeps running when the page is refreshed or closed; results appear below."
+    )
+
+    show_search()
+
     if st.button("Process"):
-        if not content:
+        if not content and not pages:
             st.warning("Please provide input before processing.")
             return
 
+        if background:
+            params = {
+                "file_prefix": file_prefix,
+                "content": content,
+                "pages": [[page.number, page.hash] for page in pages] if pages else None,
+                "pages_per_request": pages_per_request if pages else None,
+                "parallel": run_concurrently,
+                "use_cache": use_cache,
+                "split_long": split_long,
+                "structured_calls": structured_calls if structured else None,
+                "chunk_tokens": chunk_tokens,
+                "send_initial": send_initial,
+                "models": models,
+                "course": course if deduplicate else None,
+                "repair": repair
+            }
+            job_id = get_job_queue().submit(file_prefix, params, secret=api_key)
+            st.query_params["jobs"] = ",".join(tracked_jobs() + [job_id])
+            if not workers:
+                st.warning("No worker is running; the job waits in the queue until `python worker.py` is started.")
+            show_jobs()
+            return
+
         output_folder = "output"
         os.makedirs(output_folder, exist_ok=True)
 
-        # Initial message
-        initial_messages = [
-            {"role": "system", "content": "You are a helpful assistant that generates educational content."},
-            {"role": "user", "content": content + "\nwait for the next interaction of the user."}
-        ]
-
-        try:
-            initial_response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=initial_messages
-            )
-        except Exception as e:
-            st.error(f"Error with OpenAI API: {e}")
-            return
-
-        initial_content = initial_response.choices[0].message['content']
-        initial_filename = save_response(initial_content, 0, file_prefix=file_prefix, output_folder=output_folder)
-        st.download_button(
-            label=f"Download Initial Response",
-            data=initial_content,
-            file_name=os.path.basename(initial_filename),
-            mime="text/plain"
+        chunks = build_chunks(content, pages, split_long, chunk_tokens, pages_per_request if pages else DEFAULT_PAGES_PER_REQUEST)
+        cache = ResponseCache() if use_cache else None
+        run_id = uuid.uuid4().hex[:12]
+        # Every run is recorded; unchanged (chunk, prompt, model) outputs come from the response cache
+        document_run = get_run_manifest().document(file_prefix, len(chunks))
+        if structured:
+            call_count = len(groups([template.name for template in templates], structured_calls)) * len(chunks)
+            st.info(f"Structured output: {call_count} of {len(templates) * len(chunks)} requests, the document is sent once per request.")
+        elif pages:
+            st.info(f"{len(pages)} pages in {len(chunks)} requests per question type; questions are merged per type once all pages are done.")
+        elif len(chunks) > 1:
+            st.info(f"Document split into {len(chunks)} chunks; questions are merged per type once all chunks are done.")
+
+        placeholders = {}
+        buffers = {}
+        stream = stream_output and not (structured or pages or len(chunks) > 1)
+        if stream:
+            for i in range(0 if send_initial else 1, len(templates) + 1):
+                with st.expander("Initial Response" if i == 0 else f"Response {i}", expanded=True):
+                    placeholders[i] = st.empty()
+                buffers[i] = ""
+
+        def show_delta(i, text):
+            buffers[i] += text
+            placeholders[i].text(buffers[i])
+
+        entries = []
+        run_questions = []
+        results = run_pipeline(
+            chunks, templates, models, file_prefix, output_folder, cache=cache, tracer=tracer, document_run=document_run, pages=bool(pages),
+            parallel=run_concurrently, send_initial=send_initial, structured_calls=structured_calls if structured else None, stream=stream,
+            on_delta=show_delta, repair=repair, question_index=get_question_index(course) if deduplicate else None,
+            store=get_result_store(), run_id=run_id, questions=run_questions
         )
-
-        # Process each pre-saved message
-        for i, message in enumerate(messages[1:], 1):  # Skip the system message
-            chat_messages = initial_messages + [message]
-            try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=chat_messages
-                )
-                response_content = response.choices[0].message['content']
-                filename = save_response(response_content, i, file_prefix=file_prefix, output_folder=output_folder)
-                st.download_button(
-                    label=f"Download Response {i}",
-                    data=response_content,
-                    file_name=os.path.basename(filename),
-                    mime="text/plain"
-                )
-
-                # Apply transformation if configured
-                if i == 6 and transform_script_1:  # Assuming we want to transform the 6th response
-                    try:
-                        transformed_text = transform_script_1.transform_output(response_content)
-                        transformed_filename = save_response(transformed_text, i, suffix="_transformed", file_prefix=file_prefix, output_folder=output_folder)
-                        st.download_button(
-                            label=f"Download Transformed Response {i}",
-                            data=transformed_text,
-                            file_name=os.path.basename(transformed_filename),
-                            mime="text/plain"
-                        )
-                    except Exception as e:
-                        st.error(f"Error applying transformation: {e}")
-
-            except Exception as e:
-                st.error(f"Error with OpenAI API: {e}")
+        for entry, response_content in results:
+            entries.append(entry)
+            if entry["index"] in placeholders and response_content is not None:
+                placeholders[entry["index"]].text(response_content)  # Repairs and dropped duplicates show up here
+            show_entry(entry, run_id)
+
+        show_result(finish_run(entries, run_questions, tracer, document_run, output_folder, file_prefix), file_prefix, run_id)
+        if tracer.spans and not send_initial:
+            # The old layout sent system prompt + document once more just to get an acknowledgement
+            skipped = len(SYSTEM_PROMPT + content) // 4
+            st.caption(f"Skipped initial request: about {skipped} prompt tokens and one round-trip saved")
+
+        if cache is not None:
+            stats = cache.stats()
+            st.caption(f"Response cache: {stats['hits']} hits, {stats['misses']} misses")
+            cache.close()
 
         st.success("Processing complete!")
 
+    show_jobs()
+
 if __name__ == "__main__":
     main()
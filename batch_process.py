@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from app import MODEL, get_prompt_registry, process_text_file, question_templates, run_pipeline
+from response_cache import DEFAULT_CACHE_PATH, ResponseCache
+from chunking import DEFAULT_CHUNK_TOKENS, split_into_chunks
+from scheduler import configure_scheduler
+from qti_export import iter_file_questions, write_qti_package
+from dedup import QuestionIndex
+from model_backend import BACKEND_TYPES, DEFAULT_BACKEND, DEFAULT_LOCAL_BASE, configure_backends
+from run_manifest import RunManifest
+from result_store import ResultStore
+from repair import add_reports, describe
+
+SUPPORTED_EXTENSIONS = (".docx", ".txt", ".md")
+STATE_FILENAME = ".batch_state.jsonl"
+
+def find_documents(input_dir):
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(root, name)
+
+def document_key(path, input_dir):
+    stat = os.stat(path)
+    return f"{os.path.relpath(path, input_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def load_finished(output_folder):
+    state_path = os.path.join(output_folder, STATE_FILENAME)
+    if not os.path.exists(state_path):
+        return set()
+    finished = set()
+    with open(state_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                continue  # Ignore a line truncated by a crash
+    return finished
+
+def mark_finished(output_folder, key, lock):
+    with lock, open(os.path.join(output_folder, STATE_FILENAME), 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"key": key, "finished_at": time.time()}) + "\n")
+
+def process_document(path, input_dir, output_folder, prompt_pool, cache=None, chunk_tokens=DEFAULT_CHUNK_TOKENS, question_index=None, manifest=None, models=None, store=None,
+                     structured_calls=None, repair=True):
+    with open(path, 'rb') as f:
+        content = process_text_file(f)
+    if not content:
+        raise ValueError("no text extracted")
+
+    file_prefix = os.path.splitext(os.path.relpath(path, input_dir))[0].replace(os.sep, "__")
+    chunks = split_into_chunks(content, chunk_tokens)
+    document_run = manifest.document(file_prefix, len(chunks)) if manifest else None
+    models = models or {}
+    templates = question_templates(bool(structured_calls))
+    errors = []
+    duplicates = 0
+    repairs = {}
+    # Requests of all documents share prompt_pool; manifest and cache hits never reach the scheduler
+    results = run_pipeline(
+        chunks, templates, [models.get(template.name) or template.model or MODEL for template in templates], file_prefix, output_folder,
+        cache=cache, document_run=document_run, structured_calls=structured_calls, repair=repair, question_index=question_index, store=store,
+        run_id=uuid.uuid4().hex[:12], executor=prompt_pool
+    )
+    for entry, _ in results:
+        i = entry["index"]
+        if entry["error"]:
+            errors.append(f"response {i}: {entry['error']}")
+        duplicates += entry.get("duplicates", 0)
+        add_reports(repairs, entry.get("repair", {}))
+        if entry.get("invalid"):
+            print(f"    {file_prefix} response {i}: {len(entry['invalid'])} questions break the OLAT rules", file=sys.stderr, flush=True)
+        if entry.get("transform_errors"):
+            print(f"    {file_prefix} response {i} transformed: " + "; ".join(entry["transform_errors"]), file=sys.stderr, flush=True)
+    reused = document_run.reused if document_run else 0
+    return len(templates) - len(errors), len(templates), errors, duplicates, reused, repairs
+
+def run_batch(input_dir, output_folder="output", max_workers=8, max_files=4, requests_per_minute=60, tokens_per_minute=90000, cache=None, chunk_tokens=DEFAULT_CHUNK_TOKENS, question_index=None, models=None,
+              structured_calls=None, repair=True):
+    os.makedirs(output_folder, exist_ok=True)
+    finished = load_finished(output_folder)
+    pending = [(path, document_key(path, input_dir)) for path in find_documents(input_dir)]
+    pending = [(path, key) for path, key in pending if key not in finished]
+    total = len(pending)
+    print(f"{len(finished)} documents already finished, {total} to process", flush=True)
+
+    # Every (chunk, prompt) output is recorded; unchanged ones come from the response cache
+    manifest = RunManifest(os.path.join(output_folder, "manifest.sqlite"))
+    store = ResultStore(os.path.join(output_folder, "questions.sqlite"))
+    scheduler = configure_scheduler(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    state_lock = threading.Lock()
+    progress = {"done": 0, "failed": 0, "duplicates": 0}
+    repairs = {}
+
+    def run_document(path, key):
+        start = time.monotonic()
+        rel_path = os.path.relpath(path, input_dir)
+        try:
+            ok, count, errors, duplicates, reused, repaired = process_document(
+                path, input_dir, output_folder, prompt_pool, cache, chunk_tokens, question_index, manifest, models, store,
+                structured_calls, repair
+            )
+        except Exception as e:
+            ok, count, errors, duplicates, reused, repaired = 0, len(question_templates(bool(structured_calls))), [str(e)], 0, 0, {}
+        with state_lock:
+            progress["done"] += 1
+            progress["duplicates"] += duplicates
+            add_reports(repairs, repaired)
+            if errors:
+                progress["failed"] += 1
+            done = progress["done"]
+        if not errors:
+            mark_finished(output_folder, key, state_lock)
+        notes = f", {reused} unchanged chunk outputs reused" if reused else ""
+        notes += f", {duplicates} near-duplicate questions dropped" if duplicates else ""
+        notes += f", {repaired['repaired']} of {repaired['broken']} broken questions repaired" if repaired.get("broken") else ""
+        print(f"[{done}/{total}] {rel_path}: {ok}/{count} prompts in {time.monotonic() - start:.1f}s{notes}", flush=True)
+        for error in errors:
+            print(f"    error: {error}", file=sys.stderr, flush=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as prompt_pool, \
+            ThreadPoolExecutor(max_workers=max_files) as file_pool:
+        for path, key in pending:
+            file_pool.submit(run_document, path, key)
+
+    print(f"Batch complete: {progress['done'] - progress['failed']} succeeded, {progress['failed']} failed", flush=True)
+    if question_index is not None:
+        print(f"Near-duplicates: {progress['duplicates']} dropped, {question_index.count()} questions in course '{question_index.course}'", flush=True)
+    if repairs.get("broken"):
+        print(f"Rule repairs: {describe(repairs)}", flush=True)
+    stats = scheduler.stats
+    print(f"API requests: {stats['requests']} ({stats['retries']} retried, {stats['failures']} failed, "
+          f"{stats['waited_seconds']:.0f}s waiting for rate budget)", flush=True)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses", flush=True)
+    return progress["failed"] == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate OLAT questions for every document in a folder.")
+    parser.add_argument("input_dir", help="Folder containing .docx/.txt/.md chapters")
+    parser.add_argument("--output", default="output", help="Output folder (default: output)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent API requests across all files")
+    parser.add_argument("--max-files", type=int, default=4, help="Documents processed at the same time")
+    parser.add_argument("--rpm", type=int, default=60, help="Requests-per-minute budget")
+    parser.add_argument("--tpm", type=int, default=90000, help="Tokens-per-minute budget")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="Split documents into chunks of at most this many tokens")
+    parser.add_argument("--course", default="default", help="Course whose earlier questions count as duplicates")
+    parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate questions")
+    parser.add_argument("--structured", type=int, choices=(1, 2), metavar="CALLS",
+                        help="Generate all question types in 1 or 2 JSON requests per chunk instead of one request per type")
+    parser.add_argument("--no-repair", action="store_true", help="Keep questions that break the OLAT rules instead of re-requesting them")
+    parser.add_argument("--qti", help="Also bundle every response in the output folder into this QTI 2.1 ZIP")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached responses")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite response cache location")
+    parser.add_argument("--model", action="append", default=[], metavar="TEMPLATE=MODEL",
+                        help="Model for one prompt template, e.g. essay=gpt-4o or mc=local:qwen2.5-7b-instruct (repeatable)")
+    parser.add_argument("--backend", choices=sorted(BACKEND_TYPES), default=DEFAULT_BACKEND,
+                        help="Client for models without a backend prefix: the openai SDK or a pooled aiohttp client")
+    parser.add_argument("--local-base", default=DEFAULT_LOCAL_BASE, help="OpenAI-compatible local server for 'local:<model>' names")
+    parser.add_argument("--api-base", default=os.environ.get("OPENAI_API_BASE"), help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key (default: $OPENAI_API_KEY)")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+    openai.api_key = args.api_key
+    if args.api_base:
+        openai.api_base = args.api_base
+
+    configure_backends(default=args.backend, local_base=args.local_base)
+    models = {}
+    for spec in args.model:
+        name, separator, model = spec.partition("=")
+        if not separator or name not in get_prompt_registry().by_name:
+            parser.error(f"--model expects TEMPLATE=MODEL with a template from prompts/manifest.json, got '{spec}'")
+        models[name] = model
+
+    cache = None if args.no_cache else ResponseCache(args.cache_path)
+    question_index = None if args.no_dedup else QuestionIndex(args.course)
+    ok = run_batch(args.input_dir, args.output, args.workers, args.max_files, args.rpm, args.tpm, cache, args.chunk_tokens, question_index, models, args.structured, not args.no_repair)
+    if args.qti:
+        paths = [
+            os.path.join(args.output, name) for name in sorted(os.listdir(args.output))
+            if name.endswith(".txt")
+        ]
+        count = write_qti_package(iter_file_questions(paths), args.qti)
+        print(f"Wrote {count} questions to {args.qti}", flush=True)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transform_script_1 import convert_json_to_text_format, locate_blanks, split_at_spans
+
+WORDS = ["Bundesrat", "Kanton", "Gemeinde", "Initiative", "Referendum", "Parlament", "Verfassung", "Stimmvolk"]
+
+def make_item(num_blanks, words_between=8):
+    blanks = [f"Begriff{n}" for n in range(num_blanks)]
+    words = []
+    for blank in blanks:
+        words.extend(random.choice(WORDS) for _ in range(words_between))
+        words.append(blank)
+    words.extend(random.choice(WORDS) for _ in range(words_between))
+    return {
+        "page_number": "42",
+        "subject": "Politik",
+        "bloom_level": "Erinnern",
+        "text": " ".join(words) + ".",
+        "blanks": blanks,
+        "wrong_substitutes": [f"Falsch{n}" for n in range(num_blanks)]
+    }
+
+def measure(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def substitute(items):
+    for item in items:
+        split_at_spans(item["text"], locate_blanks(item["text"], item["blanks"]))
+
+def main():
+    random.seed(0)
+
+    print("Scaling in items (5 blanks each)")
+    print(f"{'items':>8} {'total ms':>10} {'us/item':>10}")
+    for count in (100, 1000, 5000, 20000):
+        items = [make_item(5) for _ in range(count)]
+        elapsed = measure(convert_json_to_text_format, items)
+        print(f"{count:>8} {elapsed * 1000:>10.1f} {elapsed / count * 1e6:>10.1f}")
+
+    print()
+    # The Inlinechoice format repeats every option on every blank line, so the output itself
+    # grows with blanks squared; this part times only the blank substitution
+    print("Blank substitution, scaling in blanks per item (text grows with blanks)")
+    print(f"{'blanks':>8} {'total ms':>10} {'us/blank':>10}")
+    for num_blanks in (10, 100, 1000, 10000):
+        items = [make_item(num_blanks) for _ in range(10)]
+        elapsed = measure(substitute, items)
+        print(f"{num_blanks:>8} {elapsed * 1000:>10.1f} {elapsed / (num_blanks * 10) * 1e6:>10.1f}")
+
+if __name__ == "__main__":
+    main()
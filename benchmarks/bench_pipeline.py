@@ -0,0 +1,389 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import logging
+import zipfile
+import argparse
+import resource
+import tempfile
+import threading
+import tracemalloc
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai
+from openai.openai_object import OpenAIObject
+
+import app
+from chunking import split_into_chunks
+from scheduler import configure_scheduler
+from model_backend import configure_backends, get_backend
+from fake_openai_server import FakeOpenAIState, start_server
+
+# Benchmarks the app.py pipeline end to end without calling a real model:
+# process_text_file -> prompt dispatch -> save_response -> transform_output.
+# The model is replaced either by the local HTTP server in fake_openai_server.py
+# (--backend server, exercises the openai client and network stack) or by an
+# in-process stand-in for openai.ChatCompletion.create (--backend inproc).
+# --client http sends the server requests through the pooled aiohttp backend instead
+# of the openai SDK, so both clients are compared through the same pipeline.
+
+WORDS = ["Bundesrat", "Kanton", "Gemeinde", "Initiative", "Referendum", "Parlament", "Verfassung",
+         "Stimmvolk", "Föderalismus", "Gewaltenteilung", "Abstimmung", "Gesetz", "Strasse", "Grösse"]
+STAGES = ("extract", "request", "response", "save", "transform", "document")
+# The response the pipeline transforms: the one answering the FIB-JSON prompt
+TRANSFORM_INDEX = app.get_prompt_registry().position(app.TRANSFORM_TEMPLATE)
+
+def make_document(num_words, rng):
+    paragraphs = []
+    written = 0
+    section = 1
+    while written < num_words:
+        paragraphs.append(f"{section}. Kapitel {rng.choice(WORDS)}")
+        for _ in range(5):
+            length = rng.randint(40, 120)
+            paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(length)) + ".")
+            written += length
+        section += 1
+    return "\n\n".join(paragraphs)
+
+def make_docx(text):
+    # The smallest package Word readers accept: content types plus word/document.xml
+    body = "".join(f"<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>" for p in text.split("\n\n"))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        ))
+        docx.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        ))
+    return buffer.getvalue()
+
+def synthetic_olat(question_type, count=10):
+    blocks = []
+    for n in range(count):
+        blocks.append("\n".join([
+            f"Typ\t{question_type}",
+            "Keywords\tSeite 42",
+            "Subject\t/Allgemeinbildung/Politik",
+            "Level\tVerstehen",
+            f"Title\tFöderalismus {n + 1}",
+            "Question\tWelche Aussagen zum Schweizer Föderalismus treffen zu?",
+            "Max answers\t4",
+            "Min answers\t0",
+            "Points\t3",
+            "1.5\tDie Kantone haben eigene Verfassungen.",
+            "1.5\tDie Gemeinden erheben Steuern.",
+            "-1\tDer Bundesrat wählt die Kantonsregierungen.",
+            "-1\tEs gibt keine Volksabstimmungen."
+        ]))
+    return "\n\n".join(blocks)
+
+def synthetic_fib(count=10):
+    # The plain FIB prompt answers in OLAT text, one gap line per blank
+    blocks = []
+    for n in range(count):
+        blocks.append("\n".join([
+            "Type\tFIB",
+            "Keywords\tSeite 42",
+            "Subject\t/Allgemeinbildung/Politik",
+            "Level\tErinnern",
+            f"Title\tBundesrat {n + 1}",
+            "Points\t3",
+            "Text\tDer",
+            "1\tBundesrat\t20",
+            "Text\tbesteht aus sieben Mitgliedern, die von der",
+            "1\tBundesversammlung\t20",
+            "Text\tgewählt werden. Das",
+            "1\tReferendum\t20",
+            "Text\terlaubt dem Stimmvolk, über Gesetze abzustimmen."
+        ]))
+    return "\n\n".join(blocks)
+
+def synthetic_fib_json(count=10):
+    items = []
+    for n in range(count):
+        items.append({
+            "page_number": "42",
+            "subject": "Politik",
+            "bloom_level": "Erinnern",
+            "text": f"Der Bundesrat besteht aus sieben Mitgliedern, die von der Bundesversammlung gewählt werden ({n + 1}). "
+                    "Das Referendum erlaubt dem Stimmvolk, über Gesetze abzustimmen.",
+            "blanks": ["Bundesrat", "Bundesversammlung", "Referendum"],
+            "wrong_substitutes": ["Nationalrat", "Ständerat", "Initiative"]
+        })
+    return "```json\n" + json.dumps(items, ensure_ascii=False, indent=2) + "\n```"
+
+def load_recordings(registry, recordings_dir=None):
+    # Maps each prompt text to the response replayed for it. Recorded responses are read
+    # from <recordings_dir>/<template name>.txt; missing ones are synthesised.
+    recordings = {}
+    for template in registry:
+        path = os.path.join(recordings_dir, f"{template.name}.txt") if recordings_dir else None
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                recordings[template.text] = f.read()
+        elif template.name == app.TRANSFORM_TEMPLATE:
+            recordings[template.text] = synthetic_fib_json()
+        elif template.type == "FIB":
+            recordings[template.text] = synthetic_fib()
+        else:
+            recordings[template.text] = synthetic_olat(template.type)
+    return recordings
+
+class StageTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def percentile(self, stage, fraction):
+        values = sorted(self.samples[stage])
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+class ServerBackend:
+    # Real HTTP round trips through the openai client against the local fake server
+    def __init__(self, state):
+        self.state = state
+        self.server = None
+        self.saved_base = None
+
+    def install(self):
+        self.server, base_url = start_server(self.state)
+        self.saved_base = openai.api_base
+        openai.api_base = base_url
+        openai.api_key = openai.api_key or "benchmark"
+        return openai.ChatCompletion.create
+
+    def close(self):
+        openai.api_base = self.saved_base
+        self.server.shutdown()
+        self.server.server_close()
+
+class InProcessBackend:
+    # Same latency, error and replay behaviour without sockets, isolating the pipeline's own cost
+    def __init__(self, state):
+        self.state = state
+
+    def install(self):
+        def create(model, messages, **kwargs):
+            status = self.state.decide()
+            if status == 429:
+                raise openai.error.RateLimitError("Rate limit reached", http_status=429,
+                                                  headers={"retry-after": f"{self.state.retry_after:g}"})
+            if status == 500:
+                raise openai.error.APIError("Internal error", http_status=500)
+            text = self.state.completion_text(messages)
+            time.sleep(self.state.delay())
+            prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+            return OpenAIObject.construct_from({
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4}
+            })
+        return create
+
+    def close(self):
+        pass
+
+BACKENDS = {"server": ServerBackend, "inproc": InProcessBackend}
+
+def timed_create(create, timer):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return create(*args, **kwargs)
+        finally:
+            timer.add("request", time.perf_counter() - start)
+    return wrapper
+
+def run_document(data, name, prompts, args, output_folder, timer):
+    started = time.perf_counter()
+    upload = io.BytesIO(data)
+    upload.name = name
+    content = app.process_text_file(upload)
+    timer.add("extract", time.perf_counter() - started)
+
+    file_prefix = os.path.splitext(name)[0]
+    chunks = split_into_chunks(content, args.chunk_tokens) if args.chunk_tokens else [content]
+    dispatched = time.perf_counter()
+    if len(chunks) > 1:
+        results = app.generate_chunked_responses(chunks, prompts, max_workers=min(args.workers * len(chunks), app.MAX_CHUNK_WORKERS))
+    else:
+        results = app.generate_responses(app.build_base_messages(content), prompts, max_workers=args.workers)
+
+    errors = 0
+    for i, response_content, error, usage in results:
+        timer.add("response", time.perf_counter() - dispatched)
+        if error:
+            errors += 1
+        if response_content is None:
+            continue
+        start = time.perf_counter()
+        app.save_response(response_content, i, file_prefix=file_prefix, output_folder=output_folder)
+        timer.add("save", time.perf_counter() - start)
+        if i == TRANSFORM_INDEX:
+            start = time.perf_counter()
+            transformed_text = app.transform_script_1.transform_output(response_content)
+            app.save_response(transformed_text, i, suffix="_transformed", file_prefix=file_prefix, output_folder=output_folder)
+            timer.add("transform", time.perf_counter() - start)
+    timer.add("document", time.perf_counter() - started)
+    return len(content), errors
+
+def run_size(num_words, prompts, args, rng, timer):
+    documents = []
+    for n in range(args.docs):
+        text = make_document(num_words, rng)
+        if args.format == "docx":
+            documents.append((make_docx(text), f"bench_{num_words}_{n}.docx"))
+        else:
+            documents.append((text.encode('utf-8'), f"bench_{num_words}_{n}.txt"))
+
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    chars = errors = 0
+    with tempfile.TemporaryDirectory() as output_folder:
+        started = time.perf_counter()
+        for data, name in documents:
+            doc_chars, doc_errors = run_document(data, name, prompts, args, output_folder, timer)
+            chars += doc_chars
+            errors += doc_errors
+        elapsed = time.perf_counter() - started
+
+    result = {
+        "words": num_words,
+        "documents": len(documents),
+        "chars": chars,
+        "seconds": elapsed,
+        "docs_per_second": len(documents) / elapsed,
+        "prompts_per_second": len(documents) * len(prompts) / elapsed,
+        "errors": errors,
+        "peak_mb": tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else None,
+        "stages": {}
+    }
+    for stage in STAGES:
+        p50, p95 = timer.percentile(stage, 0.5), timer.percentile(stage, 0.95)
+        if p50 is not None:
+            result["stages"][stage] = {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "count": len(timer.samples[stage])}
+    return result
+
+def print_results(results):
+    print(f"{'words':>8} {'docs':>5} {'seconds':>8} {'docs/s':>7} {'prompts/s':>9} {'errors':>6} {'peak MB':>8}")
+    for r in results:
+        peak = f"{r['peak_mb']:.1f}" if r["peak_mb"] is not None else "-"
+        print(f"{r['words']:>8} {r['documents']:>5} {r['seconds']:>8.2f} {r['docs_per_second']:>7.2f} "
+              f"{r['prompts_per_second']:>9.2f} {r['errors']:>6} {peak:>8}")
+    print()
+    print(f"{'words':>8} {'stage':>10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in results:
+        for stage, s in r["stages"].items():
+            print(f"{r['words']:>8} {stage:>10} {s['count']:>6} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f}")
+
+def compare(results, baseline, tolerance):
+    # Flags sizes whose throughput dropped or whose stage p95 grew by more than the tolerance
+    previous = {r["words"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(r["words"])
+        if not old:
+            continue
+        if r["prompts_per_second"] < old["prompts_per_second"] * (1 - tolerance):
+            regressions.append(f"{r['words']} words: {old['prompts_per_second']:.2f} -> {r['prompts_per_second']:.2f} prompts/s")
+        for stage, s in r["stages"].items():
+            before = old["stages"].get(stage)
+            if before and s["p95_ms"] > before["p95_ms"] * (1 + tolerance) and s["p95_ms"] - before["p95_ms"] > 1:
+                regressions.append(f"{r['words']} words, {stage}: p95 {before['p95_ms']:.1f} -> {s['p95_ms']:.1f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against a mock model backend.")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="server")
+    parser.add_argument("--client", choices=("openai", "http"), default="openai", help="Model client used against --backend server")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated document sizes in words")
+    parser.add_argument("--docs", type=int, default=3, help="Documents per size")
+    parser.add_argument("--format", choices=("docx", "txt"), default="docx")
+    parser.add_argument("--workers", type=int, default=7, help="Parallel prompts per document")
+    parser.add_argument("--chunk-tokens", type=int, default=0, help="Split documents into chunks of this many tokens (0 disables)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls failing with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--recordings", help="Folder of <template name>.txt responses to replay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip per-size peak memory tracking")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before failing")
+    args = parser.parse_args()
+    if args.client == "http" and args.backend != "server":
+        parser.error("--client http needs --backend server")
+
+    # Worker threads have no Streamlit script context; the warning is expected here
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+    rng = random.Random(args.seed)
+    registry = app.get_prompt_registry()
+    prompts = registry.texts()[1:]
+    recordings = load_recordings(registry, args.recordings)
+    state = FakeOpenAIState(
+        args.latency, args.jitter, args.error_rate, args.rate_limit_rate, retry_after=args.retry_after,
+        seed=args.seed, responder=lambda messages: recordings.get(messages[-1]["content"], "")
+    )
+    configure_scheduler(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9, base_delay=0.05, max_delay=1.0)
+
+    backend = BACKENDS[args.backend](state)
+    original_create = openai.ChatCompletion.create
+    configure_backends(default=args.client)
+    client = get_backend()
+    results = []
+    try:
+        create = backend.install()
+        if not args.no_tracemalloc:
+            tracemalloc.start()
+        for num_words in (int(size) for size in args.sizes.split(",")):
+            timer = StageTimer()
+            if args.client == "http":
+                client.complete = timed_create(type(client).complete.__get__(client), timer)
+            else:
+                openai.ChatCompletion.create = timed_create(create, timer)
+            results.append(run_size(num_words, prompts, args, rng, timer))
+    finally:
+        openai.ChatCompletion.create = original_create
+        tracemalloc.stop()
+        client.close()
+        backend.close()
+
+    print_results(results)
+    print(f"\nBackend: {args.backend}, client: {args.client}, calls: {json.dumps(state.counts)}, "
+          f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
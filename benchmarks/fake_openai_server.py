@@ -0,0 +1,154 @@
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the OpenAI chat completions endpoint. Point the app at it with
+# OPENAI_API_BASE=http://127.0.0.1:8765/v1 (or batch_process.py --api-base ...).
+
+class FakeOpenAIState:
+    def __init__(self, latency=0.2, jitter=0.1, error_rate=0.0, rate_limit_rate=0.0,
+                 requests_per_minute=None, retry_after=1.0, responses=None, seed=None, responder=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.retry_after = retry_after
+        self.responses = responses or []
+        self.responder = responder  # Optional callable(messages) -> text, e.g. replaying recordings per prompt
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.counts = {"requests": 0, "completed": 0, "rate_limited": 0, "errors": 0}
+
+    def decide(self):
+        # Returns an HTTP status for the next request
+        with self.lock:
+            self.counts["requests"] += 1
+            now = time.monotonic()
+            while self.window and now - self.window[0] >= 60:
+                self.window.popleft()
+            if self.requests_per_minute and len(self.window) >= self.requests_per_minute:
+                self.counts["rate_limited"] += 1
+                return 429
+            self.window.append(now)
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return 429
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return 500
+            self.counts["completed"] += 1
+            return 200
+
+    def delay(self):
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def completion_text(self, messages):
+        if self.responder:
+            return self.responder(messages)
+        if self.responses:
+            with self.lock:
+                return self.random.choice(self.responses)
+        return f"Echo: {messages[-1]['content'][:80]}" if messages else ""
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self.send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+            status = state.decide()
+            if status == 429:
+                return self.send_json(
+                    429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                    {"Retry-After": f"{state.retry_after:g}"}
+                )
+            if status == 500:
+                return self.send_json(500, {"error": {"message": "Internal error", "type": "server_error"}})
+
+            messages = request.get("messages", [])
+            text = state.completion_text(messages)
+            time.sleep(state.delay())
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+            completion_tokens = len(text) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+            model = request.get("model", "fake")
+
+            if not request.get("stream"):
+                return self.send_json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for start in range(0, len(text), 16):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": text[start:start + 16]}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            final = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+            self.close_connection = True
+
+    return Handler
+
+def start_server(state, host="127.0.0.1", port=0):
+    # Starts the server on a background thread; returns (server, base_url)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API for local testing.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--rpm", type=int, default=None, help="Return 429 once this many requests arrived within a minute")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--responses", help="JSON file with a list of completion texts to replay")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding='utf-8') as f:
+            responses = json.load(f)
+    state = FakeOpenAIState(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.rpm, args.retry_after, responses)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(state))
+    print(f"Fake OpenAI API on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(state.counts))
+
+if __name__ == "__main__":
+    main()
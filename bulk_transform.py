@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import random
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from prompt_registry import load_registry
+from question_model import correct_german_chars
+from transform_script_1 import COVERAGE, SUBJECT_ROOT, transform_file
+
+# Answers of the FIB-JSON prompt; the plain FIB prompt's response files hold OLAT text
+DEFAULT_PATTERNS = (f"*_response_{load_registry().position('fib_json')}.txt", "*.json")
+LOG_FILENAME = "conversion_log.jsonl"
+
+def find_responses(input_dir, patterns=DEFAULT_PATTERNS):
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                yield os.path.join(root, name)
+
+def output_paths(path, input_dir, output_dir, split):
+    # Mirrors the input tree; the combined file uses the app's "_transformed" naming
+    base = os.path.join(output_dir, os.path.splitext(os.path.relpath(path, input_dir))[0])
+    if split:
+        return base + "_inlinechoice.txt", base + "_fib.txt"
+    return base + "_transformed.txt", None
+
+def convert_file(task):
+    # Runs in a worker process. Outputs are written under temporary names and renamed at the end,
+    # so an interrupted run never leaves half a file; problems go to <output>.errors.log.
+    # Text is folded like the app's _transformed files, so both give the same output.
+    path, output_path, fib_path, seed, header = task
+    started = time.perf_counter()
+    # Inlinechoice option order is shuffled; seeding per file makes re-conversions reproducible
+    random.seed(hashlib.sha256(f"{seed}:{os.path.basename(path)}".encode()).digest())
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    log_path = output_path + ".errors.log"
+    errors = []
+    count = 0
+    try:
+        count = transform_file(path, output_path + ".tmp", errors, fib_path + ".tmp" if fib_path else None, correct_german_chars, **header)
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    for target in (output_path, fib_path):
+        if target and os.path.exists(target + ".tmp"):
+            # An empty array is a valid answer; nothing converted otherwise leaves only the error log
+            if count or not errors:
+                os.replace(target + ".tmp", target)
+            else:
+                os.remove(target + ".tmp")
+    if errors:
+        with open(log_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(errors) + "\n")
+    elif os.path.exists(log_path):
+        os.remove(log_path)  # Left over from an earlier failed conversion
+    return {
+        "file": path,
+        "output": output_path,
+        "items": count,
+        "errors": len(errors),
+        "error_log": log_path if errors else None,
+        "seconds": round(time.perf_counter() - started, 6)
+    }
+
+def run_bulk(input_dir, output_dir, processes=None, patterns=DEFAULT_PATTERNS, split=False, seed=0, header=None):
+    processes = processes or os.cpu_count() or 1
+    header = header or {}
+    paths = list(find_responses(input_dir, patterns))
+    tasks = [(path, *output_paths(path, input_dir, output_dir, split), seed, header) for path in paths]
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Converting {len(tasks)} responses with {processes} processes", flush=True)
+
+    started = time.perf_counter()
+    totals = {"files": 0, "items": 0, "failed": 0, "with_errors": 0}
+    # Responses are small, so tasks travel in batches to keep inter-process overhead low
+    chunksize = max(1, min(64, len(tasks) // (processes * 4)))
+    with ProcessPoolExecutor(max_workers=processes) as executor, \
+            open(os.path.join(output_dir, LOG_FILENAME), 'w', encoding='utf-8') as log:
+        for result in executor.map(convert_file, tasks, chunksize=chunksize):
+            log.write(json.dumps(result, ensure_ascii=False) + "\n")
+            totals["files"] += 1
+            totals["items"] += result["items"]
+            if result["errors"]:
+                totals["with_errors" if result["items"] else "failed"] += 1
+                print(f"    {os.path.relpath(result['file'], input_dir)}: {result['errors']} problems, see {result['error_log']}", file=sys.stderr, flush=True)
+    elapsed = time.perf_counter() - started
+    totals["seconds"] = elapsed
+    print(f"{totals['files']} files, {totals['items']} items in {elapsed:.1f}s "
+          f"({totals['files'] / elapsed if elapsed else 0:.0f} files/s); "
+          f"{totals['with_errors']} partly converted, {totals['failed']} failed", flush=True)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-convert a folder of archived FIB JSON responses to FIB and Inlinechoice questions.")
+    parser.add_argument("input_dir", help="Folder searched recursively for JSON responses")
+    parser.add_argument("output_dir", help="Converted files mirror the input folder structure here")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    parser.add_argument("--pattern", action="append", help=f"File name pattern, repeatable (default: {', '.join(DEFAULT_PATTERNS)})")
+    parser.add_argument("--split", action="store_true", help="Write Inlinechoice and FIB blocks to separate files")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the Inlinechoice option order")
+    parser.add_argument("--coverage", default=COVERAGE, help="OLAT Coverage header")
+    parser.add_argument("--subject-root", default=SUBJECT_ROOT, help="Prefix of the OLAT Subject header")
+    args = parser.parse_args()
+
+    totals = run_bulk(
+        args.input_dir, args.output_dir, args.processes, tuple(args.pattern or DEFAULT_PATTERNS), args.split, args.seed,
+        {"coverage": args.coverage, "subject_root": args.subject_root}
+    )
+    sys.exit(1 if totals["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
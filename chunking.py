@@ -0,0 +1,119 @@
+import re
+import json
+
+from transform_script_1 import clean_json_string
+
+DEFAULT_CHUNK_TOKENS = 6000
+
+# A page ends at a bare page number ("12", "Seite 12", "- 12 -") or a form feed;
+# a markdown-style heading starts a new section
+PAGE_MARKER = re.compile(r"^\s*(?:Seite\s+|S\.\s*|-\s*)?\d{1,4}(?:\s*-)?\s*$", re.IGNORECASE)
+HEADING = re.compile(r"^#{1,6}\s+\S")
+QUESTION_START = re.compile(r"^(?:Typ|Type)[\t ]", re.MULTILINE)
+PAGE_LINE = re.compile(r"^Keywords[\t ].*$", re.MULTILINE)
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+def split_sections(text):
+    sections = []
+    current = []
+
+    def flush():
+        if any(line.strip() for line in current):
+            sections.append("\n".join(current).strip("\n"))
+        current.clear()
+
+    for line in text.replace("\f", "\n\f\n").splitlines():
+        if line == "\f":
+            flush()
+            continue
+        if HEADING.match(line) and current:
+            flush()
+        current.append(line)
+        if PAGE_MARKER.match(line):
+            flush()
+    flush()
+    return sections
+
+def split_oversized(section, max_tokens):
+    max_chars = max_tokens * 4
+    pieces = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", section):
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_into_chunks(text, max_tokens=DEFAULT_CHUNK_TOKENS):
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for section in split_sections(text):
+        for piece in split_oversized(section, max_tokens) if estimate_tokens(section) > max_tokens else [section]:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+def split_questions(response):
+    starts = [match.start() for match in QUESTION_START.finditer(response)]
+    if not starts:
+        return [response.strip()] if response.strip() else []
+    starts.append(len(response))
+    return [response[a:b].strip() for a, b in zip(starts, starts[1:])]
+
+def question_key(block):
+    # Same question generated from two chunks usually differs only in the Keywords/page line.
+    # The stem alone is not enough: Truefalse and Drag&drop questions share generic stems.
+    return normalize(PAGE_LINE.sub("", block))
+
+def merge_json_responses(responses):
+    merged = []
+    seen = set()
+    for response in responses:
+        for item in json.loads(clean_json_string(response)):
+            key = normalize(item.get("text", "")) if isinstance(item, dict) else normalize(json.dumps(item))
+            if key not in seen:
+                seen.add(key)
+                merged.append(item)
+    return json.dumps(merged, ensure_ascii=False, indent=2)
+
+def merge_responses(responses):
+    if len(responses) == 1:
+        return responses[0]
+    if all(response.strip().lstrip("`").removeprefix("json").lstrip().startswith("[") for response in responses):
+        try:
+            return merge_json_responses(responses)
+        except ValueError:
+            pass  # Fall back to merging the raw text
+
+    merged = []
+    seen = set()
+    for response in responses:
+        for block in split_questions(response):
+            key = question_key(block)
+            if key not in seen:
+                seen.add(key)
+                merged.append(block)
+    return "\n".join(merged)
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from chunking import split_questions
+from question_model import ChoiceQuestion, DragDropQuestion, EssayQuestion, Gap, GapQuestion, TrueFalseQuestion, parse_questions
+
+DEFAULT_DEDUP_DIR = os.path.join(".cache", "dedup")
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+BANDS = 16  # 16 bands of 8 rows: ~95% recall at 0.8 similarity, few candidates below 0.6
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+SEED = 1
+PRIME = (1 << 61) - 1
+# SC, MC and KPRIM answer the same kind of prompt; FIB and its Inlinechoice twin are deliberate variants
+FAMILIES = {"SC": "choice", "MC": "choice", "KPRIM": "choice"}
+NON_WORD = re.compile(r"[^\w]+")
+
+_rng = np.random.RandomState(SEED)
+_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+def question_text(question):
+    # What makes two questions the same: stem and answers, not title, keywords or page
+    parts = [question.question]
+    if isinstance(question, ChoiceQuestion):
+        parts += sorted(answer.text for answer in question.answers)
+    elif isinstance(question, TrueFalseQuestion):
+        parts += sorted(statement.text for statement in question.statements)
+    elif isinstance(question, DragDropQuestion):
+        parts += sorted(item.text for item in question.items)
+    elif isinstance(question, GapQuestion):
+        parts += [part.answer if isinstance(part, Gap) else part for part in question.parts]
+    elif isinstance(question, EssayQuestion) and not question.question:
+        parts.append(question.title)
+    return normalize(" ".join(parts))
+
+def normalize(text):
+    return " ".join(NON_WORD.sub(" ", text.lower().replace("ß", "ss")).split())
+
+def signature(text):
+    # MinHash over character shingles, all permutations at once
+    if len(text) <= SHINGLE:
+        shingles = {text}
+    else:
+        shingles = {text[n:n + SHINGLE] for n in range(len(text) - SHINGLE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return (((hashes[:, None] * _A + _B) % PRIME) & 0xFFFFFFFF).min(axis=0).astype(np.uint32)
+
+def bucket_keys(family, sig):
+    # One key per band; family and band number are part of the key so one indexed IN finds all candidates
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8, person=f"{family}:{band}".encode()[:16])
+        keys.append(int.from_bytes(digest.digest(), "big", signed=True))
+    return keys
+
+def course_path(course, dedup_dir=DEFAULT_DEDUP_DIR):
+    safe = re.sub(r"[^\w.-]+", "_", course.strip()) or "default"
+    return os.path.join(dedup_dir, f"{safe}.sqlite")
+
+class QuestionIndex:
+    # Near-duplicate index of every question kept for one course, persisted in SQLite.
+    # Lookups touch BANDS index entries instead of scanning all stored questions.
+    def __init__(self, course, dedup_dir=DEFAULT_DEDUP_DIR, threshold=DEFAULT_THRESHOLD):
+        os.makedirs(dedup_dir, exist_ok=True)
+        self.course = course
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(course_path(course, dedup_dir), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, family TEXT NOT NULL, signature BLOB NOT NULL, "
+            "source TEXT NOT NULL, text TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key INTEGER NOT NULL, item_id INTEGER NOT NULL, "
+            "PRIMARY KEY (key, item_id)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_source ON items (source)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_item ON buckets (item_id)")
+        self.conn.commit()
+
+    def _match(self, family, sig, keys):
+        placeholders = ",".join("?" * len(keys))
+        rows = self.conn.execute(
+            f"SELECT id, signature, source, text FROM items WHERE id IN "
+            f"(SELECT DISTINCT item_id FROM buckets WHERE key IN ({placeholders})) AND family = ?",
+            keys + [family]
+        ).fetchall()
+        best = None
+        for item_id, blob, source, text in rows:
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == sig))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (item_id, similarity, source, text)
+        return best
+
+    def check_and_add(self, question, source):
+        # Returns the stored (id, similarity, source, text) this question duplicates, or None after storing it
+        text = question_text(question)
+        if not text:
+            return None
+        family = FAMILIES.get(question.type, question.type)
+        sig = signature(text)
+        keys = bucket_keys(family, sig)
+        with self.lock:
+            match = self._match(family, sig, keys)
+            if match is not None:
+                return match
+            cursor = self.conn.execute(
+                "INSERT INTO items (family, signature, source, text, created_at) VALUES (?, ?, ?, ?, ?)",
+                (family, sig.tobytes(), source, text, time.time())
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO buckets (key, item_id) VALUES (?, ?)", [(key, cursor.lastrowid) for key in keys])
+            self.conn.commit()
+        return None
+
+    def forget(self, source):
+        # A regenerated file replaces its earlier version instead of duplicating it
+        with self.lock:
+            self.conn.execute("DELETE FROM buckets WHERE item_id IN (SELECT id FROM items WHERE source = ?)", (source,))
+            self.conn.execute("DELETE FROM items WHERE source = ?", (source,))
+            self.conn.commit()
+
+    def filter_response(self, response, source):
+        # Drops question blocks that duplicate anything already kept for the course, including
+        # earlier blocks of the same response. Unparseable text is left untouched.
+        self.forget(source)
+        kept = []
+        removed = []
+        blocks = split_questions(response)
+        if len(blocks) == 1 and not parse_questions(blocks[0]):
+            return response, removed
+        for block in blocks:
+            questions = parse_questions(block)
+            match = self.check_and_add(questions[0], source) if questions else None
+            if match is None:
+                kept.append(block)
+            else:
+                removed.append((questions[0].title, match[2], match[1]))
+        if not removed:
+            return response, removed
+        return "\n\n".join(kept) + "\n", removed
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed or query a course's near-duplicate question index.")
+    parser.add_argument("course", help="Course name; each course has its own index")
+    parser.add_argument("files", nargs="+", help="OLAT question .txt files to add")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Similarity above which questions count as duplicates")
+    parser.add_argument("--dedup-dir", default=DEFAULT_DEDUP_DIR, help="Folder holding the course indexes")
+    parser.add_argument("--write", action="store_true", help="Rewrite the files without their duplicates")
+    args = parser.parse_args()
+
+    index = QuestionIndex(args.course, args.dedup_dir, args.threshold)
+    total = 0
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            response = f.read()
+        kept, removed = index.filter_response(response, os.path.basename(path))
+        total += len(removed)
+        print(f"{path}: {len(removed)} near-duplicates")
+        for title, source, similarity in removed:
+            print(f"    '{title}' ~ {source} ({similarity:.0%})")
+        if args.write and removed:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(kept)
+    print(f"{total} near-duplicates, {index.count()} questions in course '{args.course}'")
+    index.close()
+
+if __name__ == "__main__":
+    main()
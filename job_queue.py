@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+DEFAULT_QUEUE_PATH = os.path.join(".cache", "jobs.sqlite")
+STALE_AFTER_SECONDS = 60  # A running job without a heartbeat for this long is handed to another worker
+MAX_ATTEMPTS = 3
+FINAL_STATES = ("done", "failed", "cancelled")
+
+class JobQueue:
+    # Jobs live in SQLite so they outlive Streamlit reruns, browser refreshes and worker restarts.
+    # Every process opens its own JobQueue; SQLite serialises the writers.
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, label TEXT NOT NULL, params TEXT NOT NULL, "
+            "secret TEXT, progress TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+
+    def submit(self, label, params, secret=None):
+        # secret (the API key) is kept out of params and wiped once the job ends
+        job_id = uuid.uuid4().hex[:12]
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, label, params, secret, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, label, json.dumps(params, ensure_ascii=False), secret, time.time())
+            )
+        return job_id
+
+    def claim(self, worker_id):
+        # Atomically takes the oldest queued job, first requeueing jobs whose worker died
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                    "error = CASE WHEN attempts >= ? THEN 'worker stopped responding' ELSE error END, "
+                    "secret = CASE WHEN attempts >= ? THEN NULL ELSE secret END, "
+                    "finished_at = CASE WHEN attempts >= ? THEN ? ELSE finished_at END, "
+                    "worker = NULL WHERE status = 'running' AND heartbeat < ?",
+                    (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, now, now - STALE_AFTER_SECONDS)
+                )
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "started_at = ?, heartbeat = ? WHERE id = ?",
+                        (worker_id, now, now, row["id"])
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row is not None else None
+
+    def heartbeat(self, job_id=None, worker_id=None):
+        now = time.time()
+        with self.lock:
+            if job_id is not None:
+                self.conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (now, job_id))
+            if worker_id is not None:
+                self.conn.execute("INSERT OR REPLACE INTO workers (id, heartbeat) VALUES (?, ?)", (worker_id, now))
+
+    def live_workers(self, within=STALE_AFTER_SECONDS):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM workers WHERE heartbeat >= ?", (time.time() - within,)).fetchone()[0]
+
+    def update_progress(self, job_id, progress):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ?",
+                (json.dumps(progress, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def finish(self, job_id, result, error=None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, secret = NULL, finished_at = ? WHERE id = ?",
+                ("failed" if error else "done", json.dumps(result, ensure_ascii=False), error, time.time(), job_id)
+            )
+
+    def cancel(self, job_id):
+        # Queued jobs are cancelled at once; a running job stops at its next checkpoint
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', secret = NULL, finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+    def mark_cancelled(self, job_id, result):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', result = ?, secret = NULL, finished_at = ? WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def cancel_requested(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def position(self, job_id):
+        # 1 means next in line
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <= (SELECT created_at FROM jobs WHERE id = ?)",
+                (job_id,)
+            ).fetchone()[0]
+
+    def _job(self, row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["progress"] = json.loads(job["progress"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
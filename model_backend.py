@@ -0,0 +1,238 @@
+import os
+import json
+import asyncio
+import threading
+
+import aiohttp
+import openai
+
+from scheduler import RequestScheduler, get_scheduler
+
+DEFAULT_BACKEND = os.environ.get("OLAT_BACKEND", "openai")
+DEFAULT_LOCAL_BASE = os.environ.get("LOCAL_LLM_BASE", "http://localhost:8080/v1")
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_LOCAL_CONNECTIONS = int(os.environ.get("LOCAL_LLM_CONNECTIONS", 4))  # CPU servers run only a few slots
+KEEPALIVE_SECONDS = 60
+READ_TIMEOUT_SECONDS = 600
+
+def extract_usage(response):
+    usage = response.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "cached_tokens": details.get("cached_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0)
+    }
+
+class BackendError(Exception):
+    # Carries the HTTP status and headers so the scheduler can decide on retries and Retry-After
+    def __init__(self, message, http_status=None, headers=None):
+        super().__init__(message)
+        self.http_status = http_status
+        self.headers = headers or {}
+
+class OpenAIBackend:
+    # The legacy openai SDK with its module-level api_key/api_base; one HTTP session per call
+    name = "openai"
+
+    def scheduler(self):
+        return get_scheduler()
+
+    def complete(self, chat_messages, model, response_format=None):
+        # response_format: JSON mode or a JSON schema for structured output; None for free text
+        options = {"response_format": response_format} if response_format else {}
+        response = openai.ChatCompletion.create(model=model, messages=chat_messages, **options)
+        return response.choices[0].message['content'], extract_usage(response)
+
+    def open_stream(self, chat_messages, model, usage):
+        # Errors surface when the stream is opened, so this part runs eagerly
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=chat_messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        def texts():
+            for chunk in response:
+                if chunk.get("usage"):
+                    usage.update(extract_usage(chunk))
+                if chunk.get("choices"):
+                    text = chunk.choices[0].delta.get("content")
+                    if text:
+                        yield text
+        return texts()
+
+    def close(self):
+        pass
+
+class HTTPBackend:
+    # Any OpenAI-compatible /chat/completions endpoint over one pooled aiohttp session with keep-alive.
+    # The session lives on a private event loop thread; sync callers (the thread pools in app.py)
+    # block on it, async callers use acomplete() directly. base_url/api_key of None read the
+    # process-global openai.api_base/api_key at request time, like OpenAIBackend; they are not
+    # isolated per session or job, so pass api_key explicitly where that matters.
+    name = "http"
+
+    def __init__(self, base_url=None, api_key=None, max_connections=DEFAULT_MAX_CONNECTIONS, keepalive_seconds=KEEPALIVE_SECONDS,
+                 read_timeout=READ_TIMEOUT_SECONDS):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self.read_timeout = read_timeout
+        self.loop = None
+        self.session = None
+        self.lock = threading.Lock()
+
+    def scheduler(self):
+        return get_scheduler()
+
+    def _run(self, coroutine):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self._serve, args=(self.loop,), name=f"{self.name}-backend", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _serve(self, loop):
+        # close() stops the loop; it is closed here, on its own thread, once it has stopped
+        loop.run_forever()
+        loop.close()
+
+    def _session(self):
+        # Only called on the loop thread
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_seconds),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=self.read_timeout)
+            )
+        return self.session
+
+    def _headers(self):
+        api_key = openai.api_key if self.api_key is None else self.api_key
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    async def _post(self, payload):
+        url = (self.base_url or openai.api_base).rstrip("/") + "/chat/completions"
+        try:
+            response = await self._session().post(url, json=payload, headers=self._headers())
+        except aiohttp.ClientConnectionError as e:
+            raise ConnectionError(f"{self.name} backend: {e}") from e
+        if response.status >= 400:
+            body = await response.text()
+            headers = {key.lower(): value for key, value in response.headers.items()}
+            response.release()
+            try:
+                message = json.loads(body)["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = body[:200]
+            raise BackendError(f"HTTP {response.status}: {message}", response.status, headers)
+        return response
+
+    async def acomplete(self, chat_messages, model, response_format=None):
+        payload = {"model": model, "messages": chat_messages}
+        if response_format:
+            payload["response_format"] = response_format
+        response = await self._post(payload)
+        async with response:
+            data = await response.json()
+        return data["choices"][0]["message"]["content"], extract_usage(data)
+
+    def complete(self, chat_messages, model, response_format=None):
+        return self._run(self.acomplete(chat_messages, model, response_format))
+
+    def open_stream(self, chat_messages, model, usage):
+        response = self._run(self._post({
+            "model": model,
+            "messages": chat_messages,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }))
+
+        def texts():
+            # Server-sent events, one "data: {...}" line per chunk
+            try:
+                while True:
+                    line = self._run(response.content.readline())
+                    if not line:
+                        break
+                    line = line.decode('utf-8').strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage.update(extract_usage(chunk))
+                    if chunk.get("choices"):
+                        text = (chunk["choices"][0].get("delta") or {}).get("content")
+                        if text:
+                            yield text
+            finally:
+                # close() may already have stopped the loop; the session went down with the connection
+                loop = self.loop
+                if loop is not None:
+                    loop.call_soon_threadsafe(response.release)
+        return texts()
+
+    def close(self):
+        if self.loop is None:
+            return
+        if self.session is not None:
+            self._run(self.session.close())
+            self.session = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+class LocalBackend(HTTPBackend):
+    # A local OpenAI-compatible server such as llama.cpp's llama-server or vLLM. It has no
+    # account quota, so it gets its own unmetered scheduler that still retries 503s while
+    # the server is busy, and never receives the OpenAI key.
+    name = "local"
+
+    def __init__(self, base_url=DEFAULT_LOCAL_BASE, api_key=None, max_connections=DEFAULT_LOCAL_CONNECTIONS, **kwargs):
+        super().__init__(base_url, api_key or os.environ.get("LOCAL_LLM_API_KEY", ""), max_connections, **kwargs)
+        self._scheduler = RequestScheduler(requests_per_minute=None, tokens_per_minute=None)
+
+    def scheduler(self):
+        return self._scheduler
+
+BACKEND_TYPES = {"openai": OpenAIBackend, "http": HTTPBackend, "local": LocalBackend}
+_backends = {}
+_default_backend = DEFAULT_BACKEND
+_backends_lock = threading.Lock()
+
+def get_backend(name=None):
+    # One instance per name and process, so every session and worker thread shares the same pool
+    name = name or _default_backend
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKEND_TYPES[name]()
+        return _backends[name]
+
+def register_backend(name, backend):
+    with _backends_lock:
+        previous = _backends.get(name)
+        _backends[name] = backend
+    if previous is not None and previous is not backend:
+        previous.close()
+    return backend
+
+def configure_backends(default=None, local_base=None, local_connections=None):
+    global _default_backend
+    if default:
+        if default not in BACKEND_TYPES and default not in _backends:
+            raise ValueError(f"unknown backend '{default}', expected one of {', '.join(sorted(BACKEND_TYPES))}")
+        _default_backend = default
+    if local_base or local_connections:
+        register_backend("local", LocalBackend(local_base or DEFAULT_LOCAL_BASE, max_connections=local_connections or DEFAULT_LOCAL_CONNECTIONS))
+
+def resolve_model(model):
+    # "local:qwen2.5-7b-instruct" routes to the local backend; names without a known backend
+    # prefix (including fine-tunes like "ft:gpt-4o-mini:org::id") use the default backend
+    prefix, separator, name = model.partition(":")
+    if separator and (prefix in BACKEND_TYPES or prefix in _backends):
+        return get_backend(prefix), name
+    return get_backend(), model
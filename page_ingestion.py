@@ -0,0 +1,150 @@
+import io
+import os
+import base64
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Optional: scanned PDFs need pypdfium2, page images need Pillow
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+PAGE_EXTENSIONS = (".pdf",) + IMAGE_EXTENSIONS
+DEFAULT_PAGE_CACHE = os.path.join(".cache", "pages")
+PAGE_URL_PREFIX = "page-cache://"
+DEFAULT_MAX_SIDE = 1600  # Vision models downscale larger images anyway
+DEFAULT_RENDER_DPI = 150
+DEFAULT_PAGES_PER_REQUEST = 3
+JPEG_QUALITY = 80
+
+class Page:
+    __slots__ = ("number", "hash")
+
+    def __init__(self, number, page_hash):
+        self.number = number
+        self.hash = page_hash
+
+    def __repr__(self):
+        return f"Page({self.number}, {self.hash[:12]})"
+
+def is_page_file(name):
+    return name.lower().endswith(PAGE_EXTENSIONS)
+
+def missing_dependency(name):
+    if name.lower().endswith(".pdf") and pypdfium2 is None:
+        return "PDF support needs the 'pypdfium2' package"
+    if Image is None:
+        return "Image support needs the 'Pillow' package"
+    return None
+
+def store_page(image, cache_dir, max_side):
+    # Downscales, encodes as JPEG and stores under its content hash; returns the hash
+    image.thumbnail((max_side, max_side))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    data = buffer.getvalue()
+    page_hash = hashlib.sha256(data).hexdigest()
+    path = page_path(page_hash, cache_dir)
+    if not os.path.exists(path):
+        # Write then rename so a concurrent reader never sees half a file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return page_hash
+
+def render_pdf_page(pdf_path, index, dpi, max_side, cache_dir):
+    # Runs in a worker process; only the hash travels back, the pixels stay on disk
+    pdf = pypdfium2.PdfDocument(pdf_path)
+    try:
+        page = pdf[index]
+        width, height = page.get_size()
+        scale = min(dpi / 72, max_side / max(width, height))
+        image = page.render(scale=scale).to_pil()
+        page.close()
+    finally:
+        pdf.close()
+    return store_page(image, cache_dir, max_side)
+
+def render_image(image_path, max_side, cache_dir):
+    with Image.open(image_path) as image:
+        image.load()
+        return store_page(image, cache_dir, max_side)
+
+def page_path(page_hash, cache_dir=DEFAULT_PAGE_CACHE):
+    return os.path.join(cache_dir, f"{page_hash}.jpg")
+
+def render_pages(file, name, cache_dir=DEFAULT_PAGE_CACHE, max_side=DEFAULT_MAX_SIDE, dpi=DEFAULT_RENDER_DPI, max_workers=None):
+    # Renders every page of a PDF (or a single image) in a process pool. At most two tasks
+    # per worker are in flight, so memory stays bounded however long the book is.
+    os.makedirs(cache_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    suffix = os.path.splitext(name)[1].lower()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, f"upload{suffix}")
+        file.seek(0)
+        with open(source, 'wb') as f:
+            shutil.copyfileobj(file, f)
+
+        if suffix != ".pdf":
+            return [Page(1, render_image(source, max_side, cache_dir))]
+
+        pdf = pypdfium2.PdfDocument(source)
+        count = len(pdf)
+        pdf.close()
+
+        hashes = {}
+        # spawn, not fork: the Streamlit server process is multi-threaded
+        with ProcessPoolExecutor(max_workers=min(max_workers, count) or 1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending = {}
+            next_index = 0
+            while next_index < count or pending:
+                while next_index < count and len(pending) < max_workers * 2:
+                    future = executor.submit(render_pdf_page, source, next_index, dpi, max_side, cache_dir)
+                    pending[future] = next_index
+                    next_index += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    hashes[pending.pop(future)] = future.result()
+        return [Page(index + 1, hashes[index]) for index in range(count)]
+
+def batch_pages(pages, pages_per_request=DEFAULT_PAGES_PER_REQUEST):
+    return [pages[n:n + pages_per_request] for n in range(0, len(pages), pages_per_request)]
+
+def page_content(batch):
+    # Message content for a batch of pages. Images are referenced by hash, so response
+    # cache keys depend on the page contents and not on the base64 payload.
+    numbers = f"{batch[0].number}-{batch[-1].number}" if len(batch) > 1 else f"{batch[0].number}"
+    parts = [{"type": "text", "text": f"Textbook pages {numbers} (PDF page order):"}]
+    for page in batch:
+        parts.append({"type": "image_url", "image_url": {"url": PAGE_URL_PREFIX + page.hash}})
+    return parts
+
+def inline_pages(chat_messages, cache_dir=DEFAULT_PAGE_CACHE):
+    # Replaces page references with data URLs right before a request is sent
+    inlined = []
+    for message in chat_messages:
+        if not isinstance(message["content"], list):
+            inlined.append(message)
+            continue
+        parts = []
+        for part in message["content"]:
+            url = part.get("image_url", {}).get("url", "")
+            if part.get("type") == "image_url" and url.startswith(PAGE_URL_PREFIX):
+                with open(page_path(url[len(PAGE_URL_PREFIX):], cache_dir), 'rb') as f:
+                    data = base64.b64encode(f.read()).decode('ascii')
+                part = {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{data}"}}
+            parts.append(part)
+        inlined.append({**message, "content": parts})
+    return inlined
@@ -0,0 +1,78 @@
+import os
+import re
+import json
+import hashlib
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+INCLUDE = re.compile(r"^@include[ \t]+(\S+)[ \t]*$", re.MULTILINE)
+
+class PromptTemplate:
+    __slots__ = ("name", "type", "text", "hash", "model")
+
+    def __init__(self, name, question_type, text, model=None):
+        self.name = name
+        self.type = question_type
+        self.text = text
+        self.model = model  # None: the app's default model
+        # Stable across processes and machines, unlike hash()
+        self.hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        return f"PromptTemplate({self.name!r}, {self.type!r}, {self.hash[:12]})"
+
+class PromptRegistry:
+    def __init__(self, version, templates, structured=None, fragments_dir=None):
+        self.version = version
+        self.templates = templates
+        self.by_name = {template.name: template for template in templates}
+        self.structured = structured  # Shared instructions of the all-types-in-one-call mode
+        self.fragments_dir = fragments_dir
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def __iter__(self):
+        return iter(self.templates)
+
+    def __len__(self):
+        return len(self.templates)
+
+    def position(self, name):
+        # The app numbers response files by this position ({prefix}_response_{position}.txt)
+        return self.templates.index(self.by_name[name])
+
+    def texts(self):
+        return [template.text for template in self.templates]
+
+    def fragment(self, name):
+        return compose(f"@include {name}", self.fragments_dir, {})
+
+def compose(text, fragments_dir, loaded, stack=()):
+    # Replaces every "@include name" line with prompts/fragments/name.txt, recursively
+    def include(match):
+        name = match.group(1)
+        if name in stack:
+            raise ValueError(f"circular prompt include: {' -> '.join(stack + (name,))}")
+        if name not in loaded:
+            with open(os.path.join(fragments_dir, f"{name}.txt"), encoding='utf-8') as f:
+                loaded[name] = compose(f.read(), fragments_dir, loaded, stack + (name,))
+        return loaded[name].rstrip("\n")
+
+    return INCLUDE.sub(include, text)
+
+def load_registry(prompts_dir=PROMPTS_DIR):
+    with open(os.path.join(prompts_dir, "manifest.json"), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    fragments_dir = os.path.join(prompts_dir, "fragments")
+    loaded = {}
+    templates = []
+    for entry in manifest["templates"]:
+        with open(os.path.join(prompts_dir, entry["file"]), encoding='utf-8') as f:
+            text = compose(f.read(), fragments_dir, loaded)
+        templates.append(PromptTemplate(entry["name"], entry["type"], text, entry.get("model")))
+    structured = None
+    if manifest.get("structured"):
+        with open(os.path.join(prompts_dir, manifest["structured"]), encoding='utf-8') as f:
+            structured = compose(f.read(), fragments_dir, loaded)
+    return PromptRegistry(manifest["version"], templates, structured, fragments_dir)
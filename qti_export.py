@@ -0,0 +1,242 @@
+import os
+import sys
+import uuid
+import zipfile
+import argparse
+import tempfile
+from xml.sax.saxutils import escape, quoteattr
+
+from question_model import (
+    ChoiceQuestion, DragDropQuestion, EssayQuestion, Gap, GapQuestion, TrueFalseQuestion,
+    format_number, parse_questions
+)
+
+QTI_NAMESPACE = (
+    'xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.imsglobal.org/xsd/imsqti_v2p1 http://www.imsglobal.org/xsd/qti/qtiv2p1/imsqti_v2p1p1.xsd"'
+)
+MANIFEST_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<manifest xmlns="http://www.imsglobal.org/xsd/imscp_v1p1" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.imsglobal.org/xsd/imscp_v1p1 http://www.imsglobal.org/xsd/qti/qtiv2p1/qtiv2p1_imscpv1p2_v1p0.xsd" '
+    'identifier={identifier}>\n'
+    '  <metadata><schema>QTIv2.1 Package</schema><schemaversion>1.0.0</schemaversion></metadata>\n'
+    '  <organizations/>\n'
+    '  <resources>\n'
+)
+MANIFEST_FOOTER = '  </resources>\n</manifest>\n'
+
+def text(value):
+    return escape(str(value))
+
+def response_declaration(identifier, cardinality, base_type, correct, mapping, default=0):
+    lines = [f'  <responseDeclaration identifier="{identifier}" cardinality="{cardinality}" baseType="{base_type}">']
+    if correct:
+        lines.append('    <correctResponse>')
+        lines.extend(f'      <value>{text(value)}</value>' for value in correct)
+        lines.append('    </correctResponse>')
+    if mapping:
+        lines.append(f'    <mapping defaultValue="{format_number(default)}">')
+        lines.extend(f'      <mapEntry mapKey={quoteattr(key)} mappedValue="{format_number(value)}"/>' for key, value in mapping)
+        lines.append('    </mapping>')
+    lines.append('  </responseDeclaration>')
+    return lines
+
+def prompt_block(question):
+    return [f'    <p>{text(question.question)}</p>'] if question.question else []
+
+def choice_item(question):
+    correct = [f"choice_{n}" for n, a in enumerate(question.answers) if a.points > 0]
+    if question.type == "KPRIM":
+        return match_item(
+            question,
+            [(f"choice_{n}", a.text) for n, a in enumerate(question.answers)],
+            [("right", "richtig"), ("wrong", "falsch")],
+            [(f"choice_{n}", "right" if a.points > 0 else "wrong", question.points / len(question.answers)) for n, a in enumerate(question.answers)],
+            max_associations=len(question.answers)
+        )
+    single = question.type == "SC"
+    declarations = response_declaration(
+        "RESPONSE", "single" if single else "multiple", "identifier",
+        correct, [(f"choice_{n}", a.points) for n, a in enumerate(question.answers)]
+    )
+    max_choices = 1 if single else (question.max_answers or len(question.answers))
+    body = prompt_block(question) + [
+        f'    <choiceInteraction responseIdentifier="RESPONSE" shuffle="true" maxChoices="{max_choices}" minChoices="{question.min_answers or 0}">'
+    ]
+    body.extend(f'      <simpleChoice identifier="choice_{n}">{text(a.text)}</simpleChoice>' for n, a in enumerate(question.answers))
+    body.append('    </choiceInteraction>')
+    return declarations, body, ["RESPONSE"]
+
+def match_item(question, rows, columns, pairs, max_associations):
+    # rows are matched against columns; pairs are (row, column, points) directed pairs
+    declarations = response_declaration(
+        "RESPONSE", "multiple", "directedPair",
+        [f"{row} {column}" for row, column, points in pairs if points > 0],
+        [(f"{row} {column}", points) for row, column, points in pairs]
+    )
+    body = prompt_block(question) + [
+        f'    <matchInteraction responseIdentifier="RESPONSE" shuffle="false" maxAssociations="{max_associations}">',
+        '      <simpleMatchSet>'
+    ]
+    body.extend(f'        <simpleAssociableChoice identifier="{row}" matchMax="1">{text(label)}</simpleAssociableChoice>' for row, label in rows)
+    body.extend(['      </simpleMatchSet>', '      <simpleMatchSet>'])
+    body.extend(f'        <simpleAssociableChoice identifier="{column}" matchMax="{len(rows)}">{text(label)}</simpleAssociableChoice>' for column, label in columns)
+    body.extend(['      </simpleMatchSet>', '    </matchInteraction>'])
+    return declarations, body, ["RESPONSE"]
+
+def truefalse_item(question):
+    rows = [(f"statement_{n}", s.text) for n, s in enumerate(question.statements)]
+    pairs = []
+    for n, s in enumerate(question.statements):
+        pairs.append((f"statement_{n}", "right", s.right))
+        pairs.append((f"statement_{n}", "wrong", s.wrong))
+    return match_item(question, rows, [("right", "richtig"), ("wrong", "falsch")], pairs, len(rows))
+
+def dragdrop_item(question):
+    rows = [(f"item_{n}", item.text) for n, item in enumerate(question.items)]
+    columns = [(f"category_{m}", category) for m, category in enumerate(question.categories)]
+    pairs = [
+        (f"item_{n}", f"category_{m}", score)
+        for n, item in enumerate(question.items)
+        for m, score in enumerate(item.scores)
+    ]
+    return match_item(question, rows, columns, pairs, len(rows))
+
+def gap_item(question):
+    declarations = []
+    identifiers = []
+    body = prompt_block(question) + ['    <p>']
+    for part in question.parts:
+        if not isinstance(part, Gap):
+            body.append(f'      {text(part)}')
+            continue
+        identifier = f"RESPONSE_{len(identifiers) + 1}"
+        identifiers.append(identifier)
+        if question.type == "Inlinechoice":
+            options = [option for option in part.options.split("|") if option]
+            keys = {option: f"option_{n}" for n, option in enumerate(options)}
+            correct_key = keys.get(part.answer, "")
+            declarations += response_declaration(identifier, "single", "identifier", [correct_key], [(correct_key, part.points)])
+            body.append(f'      <inlineChoiceInteraction responseIdentifier="{identifier}" shuffle="false">')
+            body.extend(f'        <inlineChoice identifier="{key}">{text(option)}</inlineChoice>' for option, key in keys.items())
+            body.append('      </inlineChoiceInteraction>')
+        else:
+            declarations += response_declaration(identifier, "single", "string", [part.answer], [(part.answer, part.points)])
+            length = f' expectedLength="{text(part.size)}"' if part.size.isdigit() else ""
+            body.append(f'      <textEntryInteraction responseIdentifier="{identifier}"{length}/>')
+    body.append('    </p>')
+    return declarations, body, identifiers
+
+def essay_item(question):
+    declarations = [
+        '  <responseDeclaration identifier="RESPONSE" cardinality="single" baseType="string"/>'
+    ]
+    length = f' expectedLength="{question.max_chars}"' if question.max_chars else ""
+    body = [
+        '    <extendedTextInteraction responseIdentifier="RESPONSE"' + length + '>',
+        f'      <prompt>{text(question.question)}</prompt>',
+        '    </extendedTextInteraction>'
+    ]
+    return declarations, body, []
+
+def build_item(question, identifier):
+    if isinstance(question, ChoiceQuestion):
+        declarations, body, responses = choice_item(question)
+    elif isinstance(question, TrueFalseQuestion):
+        declarations, body, responses = truefalse_item(question)
+    elif isinstance(question, DragDropQuestion):
+        declarations, body, responses = dragdrop_item(question)
+    elif isinstance(question, GapQuestion):
+        declarations, body, responses = gap_item(question)
+    elif isinstance(question, EssayQuestion):
+        declarations, body, responses = essay_item(question)
+    else:
+        raise ValueError(f"unsupported question type '{question.type}'")
+
+    title = question.title or question.type
+    label = " | ".join(part for part in (question.subject, question.level, question.keywords) if part)
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<assessmentItem {QTI_NAMESPACE} identifier="{identifier}" title={quoteattr(title)} label={quoteattr(label)} adaptive="false" timeDependent="false">',
+        *declarations,
+        '  <outcomeDeclaration identifier="SCORE" cardinality="single" baseType="float"><defaultValue><value>0</value></defaultValue></outcomeDeclaration>',
+        f'  <outcomeDeclaration identifier="MAXSCORE" cardinality="single" baseType="float"><defaultValue><value>{format_number(question.points)}</value></defaultValue></outcomeDeclaration>',
+        '  <itemBody>',
+        *body,
+        '  </itemBody>'
+    ]
+    if responses:
+        # Score is the sum of all mapped responses, capped at MAXSCORE
+        lines.append('  <responseProcessing>')
+        lines.append('    <setOutcomeValue identifier="SCORE"><sum>')
+        lines.extend(f'      <mapResponse identifier="{response}"/>' for response in responses)
+        lines.append('    </sum></setOutcomeValue>')
+        lines.append('    <responseCondition><responseIf><gt><variable identifier="SCORE"/><variable identifier="MAXSCORE"/></gt>'
+                     '<setOutcomeValue identifier="SCORE"><variable identifier="MAXSCORE"/></setOutcomeValue></responseIf></responseCondition>')
+        lines.append('  </responseProcessing>')
+    lines.append('</assessmentItem>')
+    return "\n".join(lines) + "\n"
+
+def write_qti_package(questions, output_path, skipped=None):
+    # Items are written to the ZIP one by one; the manifest is spooled to a temporary
+    # file and appended last, so memory use does not grow with the number of questions
+    count = 0
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as package, \
+            tempfile.TemporaryFile('w+', encoding='utf-8') as manifest:
+        manifest.write(MANIFEST_HEADER.format(identifier=quoteattr(f"bank_{uuid.uuid4().hex}")))
+        for question in questions:
+            identifier = f"item_{count + 1:06d}_{uuid.uuid4().hex[:8]}"
+            href = f"items/{identifier}.xml"
+            try:
+                xml = build_item(question, identifier)
+            except Exception as e:
+                if skipped is not None:
+                    skipped.append(f"{question.type} '{question.title}': {e}")
+                continue
+            package.writestr(href, xml)
+            manifest.write(
+                f'    <resource identifier="{identifier}" type="imsqti_item_xmlv2p1" href="{href}">'
+                f'<file href="{href}"/></resource>\n'
+            )
+            count += 1
+        manifest.write(MANIFEST_FOOTER)
+        manifest.seek(0)
+        with package.open("imsmanifest.xml", 'w') as f:
+            while True:
+                chunk = manifest.read(65536)
+                if not chunk:
+                    break
+                f.write(chunk.encode('utf-8'))
+    return count
+
+def iter_file_questions(paths):
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            yield from parse_questions(f.read())
+
+def main():
+    parser = argparse.ArgumentParser(description="Bundle generated OLAT questions into a QTI 2.1 item bank ZIP.")
+    parser.add_argument("inputs", nargs="+", help="Response .txt files or folders containing them")
+    parser.add_argument("-o", "--output", default="question_bank_qti21.zip", help="ZIP file to write")
+    args = parser.parse_args()
+
+    paths = []
+    for entry in args.inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(".txt"))
+        else:
+            paths.append(entry)
+
+    skipped = []
+    count = write_qti_package(iter_file_questions(paths), args.output, skipped)
+    print(f"Wrote {count} items from {len(paths)} files to {args.output}")
+    for message in skipped:
+        print(f"    skipped {message}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import re
+import sys
+from dataclasses import dataclass, field
+
+# Lines are tab separated; the templates also contain runs of spaces instead of tabs
+FIELD_SEPARATOR = re.compile(r"\t| {2,}")
+HEADER_FIELDS = {
+    "Keywords": "keywords",
+    "Coverage": "coverage",
+    "Subject": "subject",
+    "Level": "level",
+    "Title": "title",
+    "Question": "question",
+}
+INTEGER_FIELDS = {
+    "Max answers": "max_answers",
+    "Min answers": "min_answers",
+    "Min": "min_chars",
+    "Max": "max_chars",
+}
+TYPE_ALIASES = {
+    "SC": "SC",
+    "MC": "MC",
+    "KPRIM": "KPRIM",
+    "TRUEFALSE": "Truefalse",
+    "DRAG&DROP": "Drag&drop",
+    "FIB": "FIB",
+    "INLINECHOICE": "Inlinechoice",
+    "ESSAY": "ESSAY",
+}
+EPSILON = 1e-9
+
+def correct_german_chars(text):
+    # Response files are written without ß
+    return text.replace('ß', 'ss')
+
+def format_number(value):
+    return f"{value:g}"
+
+def parse_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float(value.strip().replace(",", "."))
+
+def close(a, b):
+    return abs(a - b) < EPSILON
+
+@dataclass(slots=True)
+class Answer:
+    points: float
+    text: str
+
+@dataclass(slots=True)
+class Statement:
+    text: str
+    unanswered: float
+    right: float
+    wrong: float
+
+@dataclass(slots=True)
+class DragItem:
+    text: str
+    scores: list
+
+@dataclass(slots=True)
+class Gap:
+    points: float
+    answer: str
+    size: str = ""
+    options: str = ""
+
+@dataclass(slots=True)
+class Question:
+    type: str
+    type_key: str = "Typ"
+    keywords: str = ""
+    coverage: str = ""
+    subject: str = ""
+    level: str = ""
+    title: str = ""
+    question: str = ""
+    points: float = 0.0
+    problems: list = field(default_factory=list)
+
+    def header_lines(self):
+        lines = [f"{self.type_key}\t{self.type}"]
+        for key, attr in HEADER_FIELDS.items():
+            value = getattr(self, attr)
+            if value:
+                lines.append(f"{key}\t{value}")
+        return lines
+
+    def add_line(self, fields):
+        self.problems.append(f"unexpected line: {chr(9).join(fields)}")
+
+    def serialize(self):
+        return "\n".join(self.header_lines() + [f"Points\t{format_number(self.points)}"])
+
+    def validate(self):
+        errors = list(self.problems)
+        if not self.title:
+            errors.append("missing Title")
+        return errors
+
+@dataclass(slots=True)
+class ChoiceQuestion(Question):
+    answers: list = field(default_factory=list)
+    max_answers: int = None
+    min_answers: int = None
+
+    def add_line(self, fields):
+        if len(fields) < 2:
+            return Question.add_line(self, fields)
+        marker = fields[0]
+        if self.type == "KPRIM" and marker in ("+", "-"):
+            self.answers.append(Answer(1.0 if marker == "+" else -1.0, fields[1]))
+            return
+        try:
+            self.answers.append(Answer(parse_number(marker), fields[1]))
+        except ValueError:
+            Question.add_line(self, fields)
+
+    def serialize(self):
+        lines = self.header_lines()
+        if self.max_answers is not None:
+            lines.append(f"Max answers\t{self.max_answers}")
+        if self.min_answers is not None:
+            lines.append(f"Min answers\t{self.min_answers}")
+        lines.append(f"Points\t{format_number(self.points)}")
+        for answer in self.answers:
+            if self.type == "KPRIM":
+                lines.append(f"{'+' if answer.points > 0 else '-'}\t{answer.text}")
+            else:
+                lines.append(f"{format_number(answer.points)}\t{answer.text}")
+        return "\n".join(lines)
+
+    def validate(self):
+        errors = Question.validate(self)
+        correct = [a.points for a in self.answers if a.points > 0]
+        wrong = [a.points for a in self.answers if a.points <= 0]
+        if self.type == "SC":
+            if not close(self.points, 1):
+                errors.append(f"SC must be worth 1 point, got {format_number(self.points)}")
+            if len(correct) != 1 or not close(correct[0], 1):
+                errors.append("SC needs exactly one correct answer worth 1")
+            if not 2 <= len(wrong) <= 3 or any(not close(p, -0.5) for p in wrong):
+                errors.append("SC needs 2-3 wrong answers worth -0.5")
+        elif self.type == "MC":
+            if not close(self.points, 3):
+                errors.append(f"MC must be worth 3 points, got {format_number(self.points)}")
+            if len(self.answers) != 4:
+                errors.append(f"MC needs 4 answers, got {len(self.answers)}")
+            if self.max_answers != 4 or self.min_answers != 0:
+                errors.append("MC needs Max answers 4 and Min answers 0")
+            if not correct:
+                errors.append("MC needs at least one correct answer")
+            elif not close(sum(correct), 3) or any(not close(p, 3 / len(correct)) for p in correct):
+                errors.append(f"MC correct answers must split 3 points evenly, got {[format_number(p) for p in correct]}")
+            if any(not close(p, -1) for p in wrong):
+                errors.append("MC wrong answers must be worth -1")
+        elif self.type == "KPRIM":
+            if not close(self.points, 5):
+                errors.append(f"KPRIM must be worth 5 points, got {format_number(self.points)}")
+            if len(self.answers) != 4:
+                errors.append(f"KPRIM needs 4 answers, got {len(self.answers)}")
+        return errors
+
+@dataclass(slots=True)
+class TrueFalseQuestion(Question):
+    columns: list = field(default_factory=list)
+    statements: list = field(default_factory=list)
+
+    def add_line(self, fields):
+        if not fields[0].strip() and not self.columns:
+            self.columns = [f.strip() for f in fields[1:]]
+            return
+        try:
+            self.statements.append(Statement(fields[0], *(parse_number(f) for f in fields[1:4])))
+        except (TypeError, ValueError):
+            Question.add_line(self, fields)
+
+    def serialize(self):
+        lines = self.header_lines()
+        lines.append(f"Points\t{format_number(self.points)}")
+        lines.append("\t" + "\t".join(self.columns or ["Unanswered", "Right", "Wrong"]))
+        for s in self.statements:
+            lines.append(f"{s.text}\t{format_number(s.unanswered)}\t{format_number(s.right)}\t{format_number(s.wrong)}")
+        return "\n".join(lines)
+
+    def validate(self):
+        errors = Question.validate(self)
+        if not close(self.points, 2):
+            errors.append(f"Truefalse must be worth 2 points, got {format_number(self.points)}")
+        if len(self.statements) != 4:
+            errors.append(f"Truefalse needs 4 statements, got {len(self.statements)}")
+        for s in self.statements:
+            scores = (s.right, s.wrong)
+            if not close(s.unanswered, 0) or not (close(scores[0], 0.5) and close(scores[1], -0.25) or close(scores[0], -0.25) and close(scores[1], 0.5)):
+                errors.append(f"Truefalse statement '{s.text}' must score 0/0.5/-0.25 or 0/-0.25/0.5")
+        return errors
+
+@dataclass(slots=True)
+class DragDropQuestion(Question):
+    categories: list = field(default_factory=list)
+    items: list = field(default_factory=list)
+
+    def add_line(self, fields):
+        if not fields[0].strip() and not self.categories:
+            self.categories = [f.strip() for f in fields[1:] if f.strip()]
+            return
+        try:
+            self.items.append(DragItem(fields[0], [parse_number(f) for f in fields[1:] if f.strip()]))
+        except ValueError:
+            Question.add_line(self, fields)
+
+    def serialize(self):
+        lines = self.header_lines()
+        lines.append(f"Points\t{format_number(self.points)}")
+        lines.append("\t" + "\t".join(self.categories))
+        for item in self.items:
+            lines.append(item.text + "\t" + "\t".join(format_number(s) for s in item.scores))
+        return "\n".join(lines)
+
+    def validate(self):
+        errors = Question.validate(self)
+        if not 2 <= len(self.categories) <= 4:
+            errors.append(f"Drag&drop needs 2-4 drop categories, got {len(self.categories)}")
+        if not 2 <= len(self.items) <= 10:
+            errors.append(f"Drag&drop needs 2-10 drag items, got {len(self.items)}")
+        total = 0.0
+        for item in self.items:
+            if len(item.scores) != len(self.categories):
+                errors.append(f"Drag&drop item '{item.text}' has {len(item.scores)} scores for {len(self.categories)} categories")
+            positive = [s for s in item.scores if s > 0]
+            if len(positive) != 1:
+                errors.append(f"Drag&drop item '{item.text}' needs exactly one correct category")
+            total += sum(positive)
+        if not close(self.points, total):
+            errors.append(f"Drag&drop Points {format_number(self.points)} differ from the sum of correct scores {format_number(total)}")
+        return errors
+
+@dataclass(slots=True)
+class GapQuestion(Question):
+    # FIB and Inlinechoice: text segments (str) interleaved with Gap entries
+    parts: list = field(default_factory=list)
+
+    def add_line(self, fields):
+        if fields[0] == "Text":
+            self.parts.append(fields[1] if len(fields) > 1 else "")
+            return
+        try:
+            points = parse_number(fields[0])
+        except ValueError:
+            return Question.add_line(self, fields)
+        if self.type == "Inlinechoice" and len(fields) >= 3:
+            self.parts.append(Gap(points, fields[2], options=fields[1]))
+        elif len(fields) >= 2:
+            self.parts.append(Gap(points, fields[1], size=fields[2] if len(fields) > 2 else ""))
+        else:
+            Question.add_line(self, fields)
+
+    @property
+    def gaps(self):
+        return [part for part in self.parts if isinstance(part, Gap)]
+
+    def serialize(self):
+        lines = self.header_lines()
+        lines.append(f"Points\t{format_number(self.points)}")
+        for part in self.parts:
+            if not isinstance(part, Gap):
+                lines.append(f"Text\t{part}")
+            elif self.type == "Inlinechoice":
+                lines.append(f"{format_number(part.points)}\t{part.options}\t{part.answer}\t|")
+            else:
+                lines.append(f"{format_number(part.points)}\t{part.answer}" + (f"\t{part.size}" if part.size else ""))
+        return "\n".join(lines)
+
+    def validate(self):
+        errors = Question.validate(self)
+        gaps = self.gaps
+        if not gaps:
+            errors.append(f"{self.type} needs at least one gap")
+        total = sum(gap.points for gap in gaps)
+        if not close(self.points, total):
+            errors.append(f"{self.type} Points {format_number(self.points)} differ from the sum of gap points {format_number(total)}")
+        if self.type == "Inlinechoice":
+            for gap in gaps:
+                if gap.answer not in gap.options.split("|"):
+                    errors.append(f"Inlinechoice answer '{gap.answer}' is not among its options")
+        return errors
+
+@dataclass(slots=True)
+class EssayQuestion(Question):
+    min_chars: int = None
+    max_chars: int = None
+
+    def serialize(self):
+        lines = self.header_lines()
+        lines.append(f"Points\t{format_number(self.points)}")
+        if self.min_chars is not None:
+            lines.append(f"Min\t{self.min_chars}")
+        if self.max_chars is not None:
+            lines.append(f"Max\t{self.max_chars}")
+        return "\n".join(lines)
+
+    def validate(self):
+        errors = Question.validate(self)
+        if not self.question:
+            errors.append("Essay needs a Question")
+        if self.points <= 0:
+            errors.append("Essay must be worth more than 0 points")
+        if self.min_chars is not None and self.max_chars is not None and self.min_chars >= self.max_chars:
+            errors.append("Essay Min must be lower than Max")
+        return errors
+
+QUESTION_CLASSES = {
+    "SC": ChoiceQuestion,
+    "MC": ChoiceQuestion,
+    "KPRIM": ChoiceQuestion,
+    "Truefalse": TrueFalseQuestion,
+    "Drag&drop": DragDropQuestion,
+    "FIB": GapQuestion,
+    "Inlinechoice": GapQuestion,
+    "ESSAY": EssayQuestion,
+}
+
+def parse_questions(text):
+    questions = []
+    current = None
+    header_fields = HEADER_FIELDS
+    integer_fields = INTEGER_FIELDS
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line == "---":
+            continue
+        fields = line.split("\t") if "\t" in line else FIELD_SEPARATOR.split(line)
+        key = fields[0]
+        value = fields[1].strip() if len(fields) > 1 else ""
+
+        if key == "Typ" or key == "Type":
+            question_type = TYPE_ALIASES.get(value.upper(), value)
+            cls = QUESTION_CLASSES.get(question_type, Question)
+            current = cls(question_type, type_key=key)
+            if cls is Question:
+                current.problems.append(f"unknown question type '{value}'")
+            questions.append(current)
+        elif current is None:
+            continue  # Prose before the first question
+        elif key in header_fields:
+            setattr(current, header_fields[key], value)
+        else:
+            try:
+                if key == "Points":
+                    current.points = parse_number(value)
+                elif key in integer_fields and hasattr(current, integer_fields[key]):
+                    setattr(current, integer_fields[key], int(parse_number(value)))
+                else:
+                    current.add_line(fields)
+            except ValueError:
+                current.problems.append(f"invalid number in line: {line.strip()}")
+    return questions
+
+def validate_questions(questions):
+    # Returns (position, question, errors) for every question that breaks its //rules
+    report = []
+    for position, question in enumerate(questions, 1):
+        errors = question.validate()
+        if errors:
+            report.append((position, question, errors))
+    return report
+
+def serialize_questions(questions):
+    return "\n".join(question.serialize() for question in questions) + "\n"
+
+def main():
+    failed = 0
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8') as f:
+            questions = parse_questions(f.read())
+        report = validate_questions(questions)
+        print(f"{path}: {len(questions)} questions, {len(report)} invalid")
+        for position, question, errors in report:
+            for error in errors:
+                print(f"    #{position} {question.type} '{question.title}': {error}")
+        failed += len(report)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
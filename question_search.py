@@ -0,0 +1,95 @@
+import re
+import unicodedata
+
+# German Snowball stemmer (snowballstem.org/algorithms/german) on folded text. Text is folded the way
+# correct_german_chars writes the files (ß -> ss) and umlauts and other accents lose their marks,
+# so "Füße", "Füsse" and "fusse" all end up as the same index term.
+VOWELS = frozenset("aeiouy")
+S_ENDING = frozenset("bdfghklmnrt")
+ST_ENDING = S_ENDING - {"r"}
+WORD = re.compile(r"\w+")
+QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+def fold(text):
+    text = text.lower().replace("ß", "ss")
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def _region(word, start):
+    # Everything after the first non-vowel that follows a vowel, searched from start
+    for n in range(start + 1, len(word)):
+        if word[n] not in VOWELS and word[n - 1] in VOWELS:
+            return n + 1
+    return len(word)
+
+def _ends(word, suffix, region):
+    return word.endswith(suffix) and len(word) - len(suffix) >= region
+
+def stem(word):
+    # word must already be folded
+    chars = list(word)
+    for n in range(1, len(chars) - 1):
+        # u and y between vowels act as consonants
+        if chars[n] in "uy" and chars[n - 1] in VOWELS and chars[n + 1] in VOWELS:
+            chars[n] = chars[n].upper()
+    word = "".join(chars)
+    r1 = _region(word, 0)
+    r2 = _region(word, r1)
+    r1 = max(r1, 3)
+
+    for suffix in ("ern", "em", "er", "en", "es", "e", "s"):
+        if word.endswith(suffix):
+            if suffix == "s" and (len(word) < 2 or word[-2] not in S_ENDING):
+                break
+            if _ends(word, suffix, r1):
+                word = word[:-len(suffix)]
+                if suffix in ("e", "en", "es") and word.endswith("niss"):
+                    word = word[:-1]
+            break
+
+    for suffix in ("est", "en", "er", "st"):
+        if word.endswith(suffix):
+            if suffix == "st" and (len(word) < 6 or word[-3] not in ST_ENDING):
+                break
+            if _ends(word, suffix, r1):
+                word = word[:-len(suffix)]
+            break
+
+    for suffix in ("isch", "lich", "heit", "keit", "end", "ung", "ig", "ik"):
+        if not word.endswith(suffix):
+            continue
+        if not _ends(word, suffix, r2):
+            break
+        if suffix in ("ig", "ik", "isch"):
+            if word[-len(suffix) - 1:-len(suffix)] != "e":
+                word = word[:-len(suffix)]
+            break
+        word = word[:-len(suffix)]
+        if suffix in ("end", "ung"):
+            if _ends(word, "ig", r2) and not word.endswith("eig"):
+                word = word[:-2]
+        elif suffix in ("lich", "heit"):
+            for preceding in ("er", "en"):
+                if _ends(word, preceding, r1):
+                    word = word[:-2]
+                    break
+        else:
+            for preceding in ("lich", "ig"):
+                if _ends(word, preceding, r2):
+                    word = word[:-len(preceding)]
+                    break
+        break
+    return word.lower()
+
+def search_terms(text):
+    # What goes into the full-text index: folded, stemmed words separated by spaces
+    return " ".join(stem(word) for word in WORD.findall(fold(text or "")))
+
+def match_query(query):
+    # User input -> FTS5 MATCH expression. Words are ANDed prefix terms, so "Zelle" also finds
+    # compounds like "Zellmembran"; "quoted words" must appear as a phrase. None if nothing is left.
+    parts = []
+    for phrase, word in QUERY_PART.findall(query or ""):
+        terms = search_terms(phrase or word)
+        if terms:
+            parts.append(f'"{terms}"*')
+    return " ".join(parts) or None
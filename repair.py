@@ -0,0 +1,138 @@
+import os
+import re
+import sys
+import argparse
+
+from chunking import split_questions
+from question_model import parse_questions
+from tracing import estimate_cost
+
+RULES_SECTION = re.compile(r"^//rules[^\n]*\n(.*?)(?=^//|\Z)", re.MULTILINE | re.DOTALL)
+RESPONSE_INDEX = re.compile(r"_response_(\d+)\.txt$")
+DEFAULT_ROUNDS = 2
+USAGE_KEYS = ("prompt_tokens", "cached_tokens", "completion_tokens")
+REPAIR_INSTRUCTION = """//task
+The OLAT questions under //questions break the //rules of their question type; the problems are listed above each question.
+- Fix only what the problems name; keep the language, title, wording and meaning of each question
+- Answer with the corrected questions in the same order and the same tab-separated format
+- No additional explanation. ONLY the questions as plain text. never use ':' as a separator."""
+
+def rules_section(template_text):
+    # The //rules part of a question-type prompt, the only context a repair needs
+    match = RULES_SECTION.search(template_text)
+    return match.group(1).strip() if match else ""
+
+def find_broken(blocks):
+    # (position, errors) for every block holding one question that breaks its rules
+    broken = []
+    for position, block in enumerate(blocks):
+        questions = parse_questions(block)
+        if len(questions) == 1:
+            errors = questions[0].validate()
+            if errors:
+                broken.append((position, errors))
+    return broken
+
+def repair_prompt(blocks, broken, rules):
+    parts = [REPAIR_INSTRUCTION, "//rules\n" + rules, "//questions"]
+    for n, (position, errors) in enumerate(broken, 1):
+        parts.append(f"# Question {n}, problems: " + "; ".join(errors) + "\n" + blocks[position])
+    return "\n\n".join(parts)
+
+def accepted(original, fixed):
+    # A fix counts only if it is one question of the same type that now passes every rule
+    before, after = parse_questions(original), parse_questions(fixed)
+    return len(after) == 1 and after[0].type == before[0].type and not after[0].validate()
+
+def pair_fixes(blocks, broken, fixes):
+    # By position when the reply has one question per broken one, otherwise by title
+    if len(fixes) == len(broken):
+        return fixes
+    by_title = {}
+    for fix in fixes:
+        questions = parse_questions(fix)
+        if questions:
+            by_title.setdefault(questions[0].title, fix)
+    return [by_title.get(parse_questions(blocks[position])[0].title) for position, _ in broken]
+
+def repair_response(text, rules, complete, model=None, rounds=DEFAULT_ROUNDS):
+    # complete(prompt, usage) sends one repair prompt and fills usage. Only broken questions are sent,
+    # together with their problems and the type's //rules; accepted fixes replace them in place and
+    # the rest go round again. Returns (text, report); text is unchanged unless something was fixed.
+    blocks = split_questions(text)
+    broken = find_broken(blocks)
+    report = {"broken": len(broken), "repaired": 0, "requests": 0, "cost": 0.0, **{key: 0 for key in USAGE_KEYS}}
+    for _ in range(rounds):
+        if not broken:
+            break
+        usage = {}
+        reply = complete(repair_prompt(blocks, broken, rules), usage)
+        # Only calls that reached the API count; usage has no source for a replayed reply
+        if usage.get("source"):
+            report["requests"] += 1
+        for key in USAGE_KEYS:
+            report[key] += usage.get(key, 0)
+        if usage.get("source") and model:
+            report["cost"] += estimate_cost(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("cached_tokens", 0)) or 0.0
+        remaining = []
+        for (position, errors), fix in zip(broken, pair_fixes(blocks, broken, split_questions(reply))):
+            if fix and accepted(blocks[position], fix):
+                blocks[position] = fix
+            else:
+                remaining.append((position, errors))
+        broken = remaining
+    report["repaired"] = report["broken"] - len(broken)
+    if report["repaired"]:
+        text = "\n\n".join(blocks) + "\n"
+    return text, report
+
+def add_reports(total, report):
+    for key, value in report.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+def describe(report):
+    rate = report["repaired"] / report["broken"] if report["broken"] else 1.0
+    return (f"repaired {report['repaired']} of {report['broken']} broken questions ({rate:.0%}) in {report['requests']} requests, "
+            f"{report['prompt_tokens']} prompt + {report['completion_tokens']} completion tokens, ${report['cost']:.4f}")
+
+def repair_share(report, generation_tokens):
+    # Repair tokens relative to what generating the responses cost
+    share = (report["prompt_tokens"] + report["completion_tokens"]) / max(1, generation_tokens)
+    return f"{share:.0%} of the tokens spent on generating"
+
+def main():
+    # app imports this module, so the pipeline pieces are only loaded for the command line
+    import openai
+    from app import MODEL, correct_german_chars, question_templates, repair_completion
+
+    parser = argparse.ArgumentParser(description="Repair questions that break the OLAT rules in existing response files.")
+    parser.add_argument("files", nargs="+", help="{prefix}_response_{i}.txt files; i picks the question-type rules")
+    parser.add_argument("--model", default=MODEL, help="Model for the repair requests")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="Repair attempts per broken question")
+    parser.add_argument("--dry-run", action="store_true", help="Report the repairs without rewriting the files")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key (default: $OPENAI_API_KEY)")
+    args = parser.parse_args()
+    openai.api_key = args.api_key
+
+    templates = question_templates(structured=True)  # Covers every response index, SC included
+    total = {}
+    for path in args.files:
+        match = RESPONSE_INDEX.search(path)
+        if not match or not 0 < int(match.group(1)) <= len(templates):
+            print(f"{path}: not a question response file, skipped", file=sys.stderr)
+            continue
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        rules = rules_section(templates[int(match.group(1)) - 1].text)
+        repaired, report = repair_response(text, rules, lambda prompt, usage: repair_completion(prompt, args.model, usage), args.model, args.rounds)
+        add_reports(total, report)
+        print(f"{path}: {describe(report)}")
+        if report["repaired"] and not args.dry_run:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(correct_german_chars(repaired))
+    if total:
+        print(f"Total: {describe(total)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import os
+import re
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+
+from dedup import question_text
+from question_model import parse_questions, serialize_questions
+from qti_export import write_qti_package
+from question_search import match_query, search_terms
+
+DEFAULT_STORE_PATH = os.path.join("output", "questions.sqlite")
+PAGE_KEYWORD = re.compile(r"\b(?:Seite|S\.|Page)\s*(\d+)", re.IGNORECASE)
+RESPONSE_FILE = re.compile(r"^(?P<document>.+)_response_(?P<response>\d+)(?P<variant>_[a-z]+)?\.txt$")
+PAGE_RANGE = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$")
+FACETS = {"type": "question_type", "subject": "subject", "level": "level", "page": "page", "document": "document"}
+
+def index_row(question):
+    # Full-text columns: title, stem plus answers, keywords
+    return search_terms(question.title), search_terms(question_text(question)), search_terms(question.keywords)
+
+def page_number(keywords):
+    # "Seite 12" in the Keywords line is how the prompts record the source page
+    match = PAGE_KEYWORD.search(keywords or "")
+    return int(match.group(1)) if match else None
+
+class ResultStore:
+    # One row per generated question with its provenance. Earlier runs of the same document and
+    # response are kept but marked superseded, so queries see the current bank by default.
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "id INTEGER PRIMARY KEY, document TEXT NOT NULL, response INTEGER NOT NULL, variant TEXT NOT NULL DEFAULT '', "
+            "run_id TEXT NOT NULL, current INTEGER NOT NULL DEFAULT 1, question_type TEXT NOT NULL, title TEXT, "
+            "question TEXT, page INTEGER, subject TEXT, level TEXT, keywords TEXT, model TEXT, points REAL, "
+            "valid INTEGER NOT NULL, body TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        # Every facet leads with "current", so filtering the live bank is a range scan on one index
+        for name, columns in (
+            ("questions_type", "current, question_type"),
+            ("questions_subject", "current, subject"),
+            ("questions_level", "current, level"),
+            ("questions_page", "current, page"),
+            ("questions_document", "document, response, variant, current")
+        ):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON questions ({columns})")
+        # Inverted index over the current bank only; rowid is the question id. Text is stemmed and folded
+        # before it gets here, so the tokenizer only has to split on spaces.
+        indexed = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").fetchone()
+        self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(title, text, keywords, tokenize='unicode61')")
+        if not indexed:
+            self._index("SELECT id, body FROM questions WHERE current = 1", ())
+        self.conn.commit()
+
+    def _index(self, sql, params):
+        rows = []
+        for question_id, body in self.conn.execute(sql, params).fetchall():
+            questions = parse_questions(body)
+            if questions:
+                rows.append((question_id, *index_row(questions[0])))
+        self.conn.executemany("INSERT INTO questions_fts (rowid, title, text, keywords) VALUES (?, ?, ?, ?)", rows)
+
+    def _insert(self, document, response, questions, variant, model, run_id, now):
+        self.conn.execute(
+            "DELETE FROM questions_fts WHERE rowid IN "
+            "(SELECT id FROM questions WHERE document = ? AND response = ? AND variant = ? AND current = 1)",
+            (document, response, variant)
+        )
+        self.conn.execute(
+            "UPDATE questions SET current = 0 WHERE document = ? AND response = ? AND variant = ? AND current = 1",
+            (document, response, variant)
+        )
+        rows = []
+        for question in questions:
+            cursor = self.conn.execute(
+                "INSERT INTO questions (document, response, variant, run_id, question_type, title, question, page, subject, "
+                "level, keywords, model, points, valid, body, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (document, response, variant, run_id, question.type, question.title, question.question, page_number(question.keywords),
+                 question.subject, question.level, question.keywords, model, question.points, not question.validate(),
+                 question.serialize(), now)
+            )
+            rows.append((cursor.lastrowid, *index_row(question)))
+        self.conn.executemany("INSERT INTO questions_fts (rowid, title, text, keywords) VALUES (?, ?, ?, ?)", rows)
+
+    def add_response(self, document, response, questions, variant="", model=None, run_id=None):
+        # Replaces the current questions of this document/response in a single transaction
+        return self.add_many([(document, response, questions, variant, model)], run_id)
+
+    def add_many(self, batches, run_id=None):
+        # batches: (document, response, questions, variant, model) tuples, all written in one transaction
+        run_id = run_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        count = 0
+        with self.lock:
+            try:
+                for document, response, questions, variant, model in batches:
+                    self._insert(document, response, questions, variant, model, run_id, now)
+                    count += len(questions)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return count
+
+    def version(self):
+        # Changes with every commit, ours (total_changes) or another process's (data_version); cheap to
+        # read on every page rerun, so cached query results can be keyed on it
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes
+
+    def _filter(self, question_types=None, subjects=None, levels=None, pages=None, documents=None, valid_only=False, include_superseded=False,
+                query=None):
+        # Returns the FROM and WHERE parts. With search words the inverted index drives the query and
+        # questions are looked up by id; only the current bank is in the full-text index.
+        source = "questions"
+        clauses = [] if include_superseded else ["current = 1"]
+        params = []
+        match = match_query(query)
+        if match:
+            source = "questions_fts CROSS JOIN questions ON questions.id = questions_fts.rowid"
+            clauses.insert(0, "questions_fts MATCH ?")
+            params.append(match)
+        for column, values in (("question_type", question_types), ("subject", subjects), ("level", levels), ("document", documents)):
+            if values:
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+        if pages:
+            clauses.append("page BETWEEN ? AND ?")
+            params.extend(pages)
+        if valid_only:
+            clauses.append("valid = 1")
+        return source, (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def select(self, limit=None, shuffle=False, **filters):
+        # filters: question_types, subjects, levels, documents (lists), pages ((first, last)), valid_only, include_superseded,
+        # query (full-text search words)
+        source, where, params = self._filter(**filters)
+        order = "random()" if shuffle else "document, response, variant, id"
+        sql = f"SELECT questions.* FROM {source}{where} ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def search(self, query, limit=20, **filters):
+        # Best matches first (bm25, title hits weigh most); facet filters as in select()
+        if not match_query(query):
+            return self.select(limit=limit, **filters)
+        source, where, params = self._filter(query=query, **filters)
+        sql = f"SELECT questions.*, bm25(questions_fts, 4.0, 1.0, 2.0) AS score FROM {source}{where} ORDER BY score LIMIT ?"
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, [*params, limit]).fetchall()]
+
+    def assemble_exam(self, counts, **filters):
+        # counts: {question type: number of questions}; each type is drawn at random from the filtered bank
+        rows = []
+        for question_type, count in counts.items():
+            rows.extend(self.select(limit=count, shuffle=True, **dict(filters, question_types=[question_type])))
+        return rows
+
+    def facet_counts(self, facet, **filters):
+        column = FACETS[facet]
+        source, where, params = self._filter(**filters)
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT questions.{column}, COUNT(*) FROM {source}{where} GROUP BY questions.{column} ORDER BY COUNT(*) DESC", params
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def rows_to_questions(rows):
+    questions = []
+    for row in rows:
+        questions.extend(parse_questions(row["body"]))
+    return questions
+
+def import_files(store, paths):
+    # Loads existing {prefix}_response_{i}[_suffix].txt files; one transaction for all of them
+    batches = []
+    for path in paths:
+        match = RESPONSE_FILE.match(os.path.basename(path))
+        if not match:
+            continue
+        with open(path, encoding='utf-8') as f:
+            questions = parse_questions(f.read())
+        batches.append((match["document"], int(match["response"]), questions, match["variant"] or "", None))
+    return len(batches), store.add_many(batches)
+
+def page_range(text):
+    # "12" is page 12 alone, "10-40" a range; None if the text is neither
+    match = PAGE_RANGE.match(text)
+    if not match:
+        return None
+    first, last = int(match[1]), int(match[2] or match[1])
+    return (first, last) if first <= last else None
+
+def filter_args(args):
+    return {
+        "question_types": args.type,
+        "subjects": args.subject,
+        "levels": args.level,
+        "documents": args.document,
+        "pages": args.pages,
+        "valid_only": args.valid_only,
+        "query": args.query
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and maintain the generated question store.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="SQLite question store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="Add existing response .txt files or folders")
+    load.add_argument("inputs", nargs="+")
+
+    for name, help_text in (
+        ("search", "Full-text search, best matches first"),
+        ("exam", "Draw a random exam from the bank"),
+        ("stats", "Count questions per facet")
+    ):
+        command = commands.add_parser(name, help=help_text)
+        if name == "search":
+            command.add_argument("query", help='Words to find (German stemming, "quoted phrase")')
+        else:
+            command.add_argument("--query", help="Only questions matching these words")
+        command.add_argument("--type", action="append", help="Question type, repeatable")
+        command.add_argument("--subject", action="append", help="Subject, repeatable")
+        command.add_argument("--level", action="append", help="Bloom level, repeatable")
+        command.add_argument("--document", action="append", help="Source document (file prefix), repeatable")
+        command.add_argument("--pages", help="Page or page range, e.g. 12 or 10-40")
+        command.add_argument("--valid-only", action="store_true", help="Skip questions that break the OLAT rules")
+
+    exam = commands.choices["exam"]
+    exam.add_argument("--count", action="append", required=True, metavar="TYPE=N", help="Questions per type, e.g. MC=5 (repeatable)")
+    exam.add_argument("-o", "--output", default="exam.txt", help="OLAT text file to write")
+    exam.add_argument("--qti", help="Also write a QTI 2.1 package")
+    commands.choices["search"].add_argument("--limit", type=int, default=20, help="Number of results")
+    commands.choices["search"].add_argument("--facets", action="store_true", help="Also count the matches per type, subject and level")
+    commands.choices["stats"].add_argument("--facet", choices=sorted(FACETS), action="append", help="Facet to count (default: type, subject, level)")
+    args = parser.parse_args()
+    if getattr(args, "pages", None):
+        pages = page_range(args.pages)
+        if pages is None:
+            parser.error(f"--pages expects a page or a range like 10-40, got '{args.pages}'")
+        args.pages = pages
+
+    store = ResultStore(args.store)
+    if args.command == "import":
+        paths = []
+        for entry in args.inputs:
+            if os.path.isdir(entry):
+                for root, dirs, files in os.walk(entry):
+                    dirs.sort()
+                    paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(".txt"))
+            else:
+                paths.append(entry)
+        files, count = import_files(store, paths)
+        print(f"Imported {count} questions from {files} response files")
+    elif args.command == "search":
+        started = time.perf_counter()
+        filters = filter_args(args)
+        rows = store.search(filters.pop("query"), args.limit, **filters)
+        print(f"{len(rows)} results in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for row in rows:
+            print(f"    [{row['question_type']}] {row['title']}  ({row['document']}_response_{row['response']}{row['variant']}, "
+                  f"{row['subject'] or '-'}, {row['level'] or '-'})")
+            print(f"        {row['question']}")
+        if args.facets:
+            for facet in ("type", "subject", "level"):
+                print(f"{facet}: " + ", ".join(f"{value or '-'} {count}" for value, count in store.facet_counts(facet, **filter_args(args))))
+    elif args.command == "exam":
+        counts = {}
+        for spec in args.count:
+            question_type, _, number = spec.partition("=")
+            counts[question_type] = int(number)
+        rows = store.assemble_exam(counts, **{key: value for key, value in filter_args(args).items() if key != "question_types"})
+        questions = rows_to_questions(rows)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(serialize_questions(questions))
+        print(f"Wrote {len(questions)} questions to {args.output}")
+        for question_type, count in counts.items():
+            found = sum(1 for row in rows if row["question_type"] == question_type)
+            if found < count:
+                print(f"    only {found} of {count} {question_type} questions match", file=sys.stderr)
+        if args.qti:
+            print(f"Wrote {write_qti_package(questions, args.qti)} items to {args.qti}")
+    else:
+        for facet in args.facet or ("type", "subject", "level"):
+            print(f"{facet}:")
+            for value, count in store.facet_counts(facet, **filter_args(args)):
+                print(f"    {count:>7}  {value if value not in (None, '') else '-'}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from response_cache import make_key
+
+DEFAULT_MANIFEST_PATH = os.path.join("output", "manifest.sqlite")
+
+def content_hash(value):
+    # Chunks are text or, for page images, a list of content parts referencing page hashes
+    data = value if isinstance(value, str) else json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def split_messages(chat_messages):
+    # The document chunk is the second-to-last message; everything else is the instruction
+    # (system prompt plus question-type prompt), hashed together as the prompt
+    return chat_messages[-2]["content"], chat_messages[:-2] + chat_messages[-1:]
+
+class RunManifest:
+    # Records which (document, chunk, prompt, model) produced which output, next to the output folder.
+    # The outputs themselves live only in the response cache (bounded, least recently used first);
+    # a row points at its cache key, so an unchanged chunk and prompt is a cache hit on the next run.
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            "document TEXT NOT NULL, response INTEGER NOT NULL, chunk INTEGER NOT NULL, "
+            "chunk_hash TEXT NOT NULL, prompt_hash TEXT NOT NULL, model TEXT NOT NULL, "
+            "cache_key TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (document, response, chunk))"
+        )
+        self.conn.commit()
+
+    def record(self, document, response, chunk, chunk_hash, prompt_hash, model, cache_key):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO outputs (document, response, chunk, chunk_hash, prompt_hash, model, cache_key, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (document, response, chunk, chunk_hash, prompt_hash, model, cache_key, time.time())
+            )
+            self.conn.commit()
+
+    def prune(self, document, chunk_count):
+        # Forget chunk positions the document no longer has
+        with self.lock:
+            self.conn.execute("DELETE FROM outputs WHERE document = ? AND chunk >= ?", (document, chunk_count))
+            self.conn.commit()
+
+    def document(self, name, chunk_count):
+        self.prune(name, chunk_count)
+        return DocumentRun(self, name)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class DocumentRun:
+    # One processing run of one document: records every output and counts response cache hits as reused.
+    # Outputs are matched by content, not position, so an inserted paragraph does not invalidate later chunks.
+    def __init__(self, manifest, name):
+        self.manifest = manifest
+        self.name = name
+        self.lock = threading.Lock()
+        self.reused = 0
+        self.generated = 0
+
+    def record(self, response, chunk_index, chat_messages, model, reused=False):
+        chunk_hash, prompt_hash = (content_hash(part) for part in split_messages(chat_messages))
+        with self.lock:
+            if reused:
+                self.reused += 1
+            else:
+                self.generated += 1
+        self.manifest.record(self.name, response, chunk_index, chunk_hash, prompt_hash, model, make_key(chat_messages, model))
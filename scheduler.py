@@ -0,0 +1,165 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+
+from chunking import estimate_tokens
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_RPM", 500))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TPM", 200000))
+COMPLETION_TOKEN_ESTIMATE = 1500
+IMAGE_TOKEN_ESTIMATE = 1100  # A downscaled page at high detail
+RETRYABLE_ERRORS = {"Timeout", "TryAgain", "APIConnectionError", "ServiceUnavailableError", "RateLimitError"}
+
+def content_tokens(content):
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    # Multimodal content: a list of text and image parts
+    return sum(estimate_tokens(part["text"]) if part.get("type") == "text" else IMAGE_TOKEN_ESTIMATE for part in content)
+
+def estimate_request_tokens(chat_messages, completion_tokens=COMPLETION_TOKEN_ESTIMATE):
+    # Budget the prompt plus room for the completion, which the quota also counts
+    return sum(content_tokens(m["content"]) + 4 for m in chat_messages) + completion_tokens
+
+def is_retryable(error):
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+def retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass  # HTTP-date values fall back to exponential backoff
+    return None
+
+class Cancelled(Exception):
+    pass
+
+class RequestScheduler:
+    # Admits calls in FIFO order within a sliding one-minute request and token budget
+    # and retries transient failures with jittered exponential backoff
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = deque()
+        self.window_tokens = 0
+        self.paused_until = 0.0
+        self.next_ticket = 0
+        self.serving = 0
+        self.abandoned = set()
+        self.condition = threading.Condition()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "waited_seconds": 0.0}
+
+    def _trim(self, now):
+        while self.window and now - self.window[0][0] >= 60:
+            self.window_tokens -= self.window.popleft()[1]
+
+    def _wait_time(self, tokens, now):
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._trim(now)
+        if not self.window:
+            return 0.0  # An oversized request still goes through on an empty window
+        # A limit of None leaves that dimension unmetered (e.g. a local model server)
+        requests_ok = self.requests_per_minute is None or len(self.window) < self.requests_per_minute
+        tokens_ok = self.tokens_per_minute is None or self.window_tokens + tokens <= self.tokens_per_minute
+        if requests_ok and tokens_ok:
+            return 0.0
+        return self.window[0][0] + 60 - now
+
+    def _advance(self):
+        # Tickets given up while queued are skipped once their turn comes
+        self.serving += 1
+        while self.serving in self.abandoned:
+            self.abandoned.remove(self.serving)
+            self.serving += 1
+        self.condition.notify_all()
+
+    def acquire(self, tokens, cancel=None):
+        started = time.monotonic()
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while True:
+                if cancel is not None and cancel.is_set():
+                    # A cancelled job gives up its place instead of waiting for rate budget
+                    if ticket == self.serving:
+                        self._advance()
+                    else:
+                        self.abandoned.add(ticket)
+                    raise Cancelled("cancelled before the request was sent")
+                if ticket != self.serving:
+                    self.condition.wait(0.5)  # Woken when the queue moves
+                    continue
+                now = time.monotonic()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    break
+                self.condition.wait(min(wait, 1.0))
+            self.window.append((now, tokens))
+            self.window_tokens += tokens
+            self.stats["requests"] += 1
+            self.stats["waited_seconds"] += now - started
+            self._advance()
+
+    def pause(self, seconds):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hinted = retry_after(error)
+        if hinted is not None:
+            # The server knows best; hold every caller back, not just this one
+            delay = max(delay, hinted)
+            self.pause(hinted)
+        return delay
+
+    def run(self, request, chat_messages, tokens=None, cancel=None):
+        # Once the cancel event is set, calls still queued (or backing off) raise Cancelled
+        tokens = tokens or estimate_request_tokens(chat_messages)
+        attempt = 0
+        while True:
+            self.acquire(tokens, cancel)
+            try:
+                return request(chat_messages)
+            except Exception as e:
+                retry = attempt < self.max_retries and is_retryable(e)
+                with self.condition:
+                    self.stats["retries" if retry else "failures"] += 1
+                if not retry:
+                    raise
+                delay = self.backoff(attempt, e)
+                if cancel is not None:
+                    cancel.wait(delay)  # The next acquire() raises Cancelled
+                else:
+                    time.sleep(delay)
+                attempt += 1
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_scheduler():
+    # One scheduler per process so every session and batch worker shares the same quota
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
+
+def configure_scheduler(**kwargs):
+    global _default_scheduler
+    with _default_lock:
+        _default_scheduler = RequestScheduler(**kwargs)
+        return _default_scheduler
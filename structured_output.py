@@ -0,0 +1,155 @@
+import json
+
+from chunking import merge_responses
+from question_model import (
+    Answer, ChoiceQuestion, DragDropQuestion, DragItem, EssayQuestion, Gap, GapQuestion, Statement, TrueFalseQuestion, serialize_questions
+)
+from transform_script_1 import COVERAGE, SUBJECT_ROOT, clean_json_string
+
+# All question types in one (or two) JSON answers instead of one free-text call per type.
+# The model only writes content and marks answers correct; points are filled in from the
+# //rules of each type, so the per-type outputs match what the separate prompts ask for.
+# Keys are the prompt template names.
+GROUPS = (("sc", "mc", "kprim", "truefalse", "dragdrop"), ("fib_json", "fib", "essay"))  # closed / open, for two calls
+# Models that accept a strict JSON schema; others get JSON mode with the schema in the prompt
+JSON_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4", "local:")
+FIB_ANSWER_SIZE = "150"
+
+def string():
+    return {"type": "string"}
+
+def array(items):
+    return {"type": "array", "items": items}
+
+def obj(**properties):
+    # Strict schemas need every property listed as required and no extra ones
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+def closed(**properties):
+    return array(obj(title=string(), question=string(), page_number=string(), subject=string(), bloom_level=string(), **properties))
+
+MARKED = array(obj(text=string(), correct={"type": "boolean"}))
+SCHEMAS = {
+    "sc": closed(answers=MARKED),
+    "mc": closed(answers=MARKED),
+    "kprim": closed(answers=MARKED),
+    "truefalse": closed(statements=MARKED),
+    "dragdrop": closed(categories=array(string()), items=array(obj(text=string(), category=string()))),
+    # The same items the FIB-JSON prompt asks for, so transform_script_1 reads them unchanged
+    "fib_json": array(obj(
+        page_number=string(), subject=string(), bloom_level=string(), text=string(), blanks=array(string()), wrong_substitutes=array(string())
+    )),
+    "fib": array(obj(title=string(), question=string(), answer=string(), bloom_level=string())),
+    "essay": array(obj(title=string(), question=string(), bloom_level=string()))
+}
+
+def groups(names, calls=1):
+    # One call for everything, or closed and open question types in two calls for models with a small output limit
+    if calls == 1:
+        return [list(names)]
+    split = [[name for name in names if name in group] for group in GROUPS]
+    split[0] += [name for name in names if not any(name in group for group in GROUPS)]
+    return [group for group in split if group]
+
+def response_schema(names):
+    return obj(**{name: SCHEMAS[name] for name in names})
+
+def uses_json_schema(model):
+    return model.startswith(JSON_SCHEMA_MODELS)
+
+def build_request(registry, names, model):
+    # Returns the instruction message and the response_format for one call
+    prompt = registry.structured + "\n\n//rules\n" + "\n".join(registry.fragment(f"structured_{name}").rstrip("\n") for name in names)
+    if uses_json_schema(model):
+        return prompt, {"type": "json_schema", "json_schema": {"name": "questions", "strict": True, "schema": response_schema(names)}}
+    prompt += "\n\n//JSON schema\n" + json.dumps(response_schema(names), ensure_ascii=False)
+    return prompt, {"type": "json_object"}
+
+def header(question, item):
+    question.keywords = f"Seite {item.get('page_number', '')}"
+    question.coverage = COVERAGE
+    question.subject = f"{SUBJECT_ROOT}{item.get('subject', '')}"
+    question.level = item.get("bloom_level", "")
+    question.title = item.get("title", "")
+    question.question = item.get("question", "")
+    return question
+
+def choice(question_type, item):
+    answers = item.get("answers") or []
+    correct = sum(1 for answer in answers if answer.get("correct"))
+    question = header(ChoiceQuestion(question_type), item)
+    if question_type == "SC":
+        question.points = 1
+        question.answers = [Answer(1 if answer.get("correct") else -0.5, answer.get("text", "")) for answer in answers]
+    elif question_type == "MC":
+        # Correct answers split the 3 points evenly, wrong ones cost 1
+        question.points = 3
+        question.max_answers, question.min_answers = 4, 0
+        question.answers = [Answer(3 / correct if answer.get("correct") else -1, answer.get("text", "")) for answer in answers]
+    else:
+        question.points = 5
+        question.answers = [Answer(1 if answer.get("correct") else -1, answer.get("text", "")) for answer in answers]
+    return question
+
+def truefalse(item):
+    question = header(TrueFalseQuestion("Truefalse"), item)
+    question.points = 2
+    question.columns = ["Unanswered", "Right", "Wrong"]
+    question.statements = [
+        Statement(statement.get("text", ""), 0, 0.5, -0.25) if statement.get("correct") else Statement(statement.get("text", ""), 0, -0.25, 0.5)
+        for statement in item.get("statements") or []
+    ]
+    return question
+
+def dragdrop(item):
+    question = header(DragDropQuestion("Drag&drop"), item)
+    question.categories = list(item.get("categories") or [])
+    for entry in item.get("items") or []:
+        scores = [1 if category == entry.get("category") else -0.5 for category in question.categories]
+        question.items.append(DragItem(entry.get("text", ""), scores))
+    question.points = sum(1 for entry in question.items if 1 in entry.scores)
+    return question
+
+def fib(item):
+    # The open FIB template: no header fields, the question as Text and the model answer as the gap
+    question = GapQuestion("FIB", type_key="Type", title=item.get("title", ""), points=3)
+    question.parts = [item.get("question", ""), Gap(3, item.get("answer", ""), size=FIB_ANSWER_SIZE)]
+    return question
+
+def essay(item):
+    return EssayQuestion("ESSAY", title=item.get("title", ""), question=item.get("question", ""), points=5, min_chars=200, max_chars=2000)
+
+BUILDERS = {
+    "sc": lambda item: choice("SC", item),
+    "mc": lambda item: choice("MC", item),
+    "kprim": lambda item: choice("KPRIM", item),
+    "truefalse": truefalse,
+    "dragdrop": dragdrop,
+    "fib": fib,
+    "essay": essay
+}
+
+def to_response(name, items):
+    # One list of the JSON answer -> the text the type's own prompt would have produced
+    if name == "fib_json":
+        return json.dumps(items, ensure_ascii=False, indent=2)
+    questions = [BUILDERS[name](item) for item in items if isinstance(item, dict)]
+    return serialize_questions(questions) if questions else ""
+
+def split_response(text, names):
+    # {name: response text} for every name; raises ValueError if the answer is not the expected JSON object
+    try:
+        data = json.loads(clean_json_string(text))
+    except ValueError as e:
+        raise ValueError(f"structured answer is not valid JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError("structured answer is not a JSON object")
+    missing = [name for name in names if not isinstance(data.get(name), list)]
+    if len(missing) == len(names):
+        raise ValueError(f"structured answer has none of the lists {', '.join(names)}")
+    return {name: to_response(name, data[name] if name not in missing else []) for name in names}
+
+def merge_chunks(parts):
+    # Per-chunk texts of one type -> one response, as the per-type chunked path does
+    parts = [part for part in parts if part.strip()]
+    return merge_responses(parts) if parts else ""
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the top-level modules (and benchmarks.fake_openai_server); this is the only
+# place the repository root goes on the path, so test files need no sys.path lines of their own
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
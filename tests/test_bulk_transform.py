@@ -0,0 +1,26 @@
+import json
+
+from bulk_transform import convert_file
+from question_model import correct_german_chars
+from transform_script_1 import transform_output
+
+def test_bulk_output_matches_the_app_transformed_file(tmp_path):
+    # One blank and no wrong substitutes keep the shuffled Inlinechoice options deterministic
+    response = json.dumps([{"page_number": "3", "subject": "Strassenbau", "text": "Die Grösse der Straße", "blanks": ["Straße"]}], ensure_ascii=False)
+    path = tmp_path / "doc_response_5.txt"
+    path.write_text(response, encoding='utf-8')
+    output = tmp_path / "doc_response_5_transformed.txt"
+
+    result = convert_file((str(path), str(output), None, 0, {}))
+    assert result["items"] == 1 and result["errors"] == 0
+    # app.transform_response saves with save_response, which folds ß
+    assert output.read_text(encoding='utf-8') == correct_german_chars(transform_output(response))
+    assert "ß" not in output.read_text(encoding='utf-8')
+
+def test_an_empty_array_converts_to_an_empty_file(tmp_path):
+    path = tmp_path / "doc_response_5.txt"
+    path.write_text("[]", encoding='utf-8')
+    output = tmp_path / "doc_response_5_transformed.txt"
+    result = convert_file((str(path), str(output), None, 0, {}))
+    assert (result["items"], result["errors"]) == (0, 0)
+    assert output.read_text(encoding='utf-8') == transform_output("[]")
@@ -0,0 +1,18 @@
+from chunking import merge_responses, split_questions
+
+def truefalse(title, page, statement):
+    return (
+        f"Typ\tTruefalse\nKeywords\tSeite {page}\nTitle\t{title}\n"
+        f"Question\tSind die folgenden Aussagen richtig oder falsch?\nPoints\t2\n"
+        f"\tUnanswered\tRight\tWrong\n{statement}\t0\t0.5\t-0.25\n"
+    )
+
+def test_merge_keeps_questions_with_the_same_stem():
+    first = "\n".join(truefalse(f"A{n}", 1, f"Aussage A{n}") for n in range(5))
+    second = "\n".join(truefalse(f"B{n}", 2, f"Aussage B{n}") for n in range(5))
+    assert len(split_questions(merge_responses([first, second]))) == 10
+
+def test_merge_drops_a_question_repeated_with_another_page():
+    first = truefalse("A", 1, "Aussage A") + "\n" + truefalse("B", 1, "Aussage B")
+    second = truefalse("A", 2, "Aussage A")
+    assert len(split_questions(merge_responses([first, second]))) == 2
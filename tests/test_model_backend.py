@@ -0,0 +1,11 @@
+from benchmarks.fake_openai_server import FakeOpenAIState, start_server
+from model_backend import HTTPBackend
+
+def test_a_stream_closed_after_the_backend_does_not_raise():
+    server, base = start_server(FakeOpenAIState(latency=0, jitter=0, responses=["x" * 64]))
+    backend = HTTPBackend(base, "key")
+    texts = backend.open_stream([{"role": "user", "content": "Hallo"}], "fake", {})
+    assert next(texts) == "x" * 16
+    backend.close()
+    texts.close()
+    server.shutdown()
@@ -0,0 +1,67 @@
+import app
+from prompt_registry import load_registry
+from question_model import parse_questions
+from repair import repair_response
+from response_cache import ResponseCache
+
+def mc(title, points):
+    return (
+        f"Typ\tMC\nKeywords\tSeite 3\nTitle\t{title}\nQuestion\tFrage {title}?\nMax answers\t4\nMin answers\t0\nPoints\t3\n"
+        + "".join(f"{p}\t{title} A{k}\n" for k, p in enumerate(points))
+    )
+
+GOOD = [1.5, 1.5, -1, -1]
+BAD = [1, 1, -1, -1]
+
+def test_mc_rules():
+    assert parse_questions(mc("G", GOOD))[0].validate() == []
+    assert parse_questions(mc("B", BAD))[0].validate() == ["MC correct answers must split 3 points evenly, got ['1', '1']"]
+    assert "MC needs 4 answers, got 3" in parse_questions(mc("B", GOOD[:3]))[0].validate()
+
+def test_only_broken_questions_are_sent_and_fixes_replace_them_in_place():
+    prompts = []
+
+    def complete(prompt, usage):
+        prompts.append(prompt)
+        usage.update(source="API", prompt_tokens=10, completion_tokens=5)
+        return mc("B", GOOD)
+
+    text, report = repair_response(mc("G1", GOOD) + mc("B", BAD) + mc("G2", GOOD), "rules", complete)
+    assert [q.title for q in parse_questions(text)] == ["G1", "B", "G2"]
+    assert all(not q.validate() for q in parse_questions(text))
+    assert "Title\tB" in prompts[0] and "Title\tG1" not in prompts[0]
+    assert report["broken"] == report["repaired"] == report["requests"] == 1
+    assert report["prompt_tokens"] == 10
+
+def test_rejected_fix_goes_round_again_and_replayed_replies_are_not_counted():
+    replies = [mc("B", BAD), mc("B", GOOD)]
+
+    def complete(prompt, usage):
+        if len(replies) == 2:
+            usage["source"] = "API"
+        return replies.pop(0)
+
+    text, report = repair_response(mc("B", BAD), "rules", complete)
+    assert report["repaired"] == 1 and report["requests"] == 1
+    assert not parse_questions(text)[0].validate()
+
+def test_second_round_reaches_the_api_with_the_cache_on(monkeypatch, tmp_path):
+    calls = []
+
+    def request_completion(chat_messages, model=app.MODEL, usage=None, **kwargs):
+        calls.append(chat_messages)
+        usage["source"] = "API"
+        if len(calls) == 1:
+            return mc("G", GOOD) + mc("B", BAD)
+        return mc("B", BAD if len(calls) == 2 else GOOD)
+
+    monkeypatch.setattr(app, "request_completion", request_completion)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    results = app.run_pipeline(["Ein Text."], [load_registry().by_name["mc"]], [app.MODEL], output_folder=str(tmp_path), cache=cache,
+                               parallel=False)
+    entry, text = next(results)
+    # Round 2 sends the same prompt as round 1; it must not be answered with round 1's cached reply
+    assert len(calls) == 3 and calls[1] == calls[2]
+    assert entry["repair"]["requests"] == 2 and entry["repair"]["repaired"] == 1
+    assert not any(q.validate() for q in parse_questions(text))
+    cache.close()
@@ -0,0 +1,32 @@
+from question_model import parse_questions
+from result_store import ResultStore, page_range
+
+def essay(title, page):
+    return f"Typ\tESSAY\nKeywords\tSeite {page}\nTitle\t{title}\nQuestion\tBeschreiben Sie den Föderalismus.\nPoints\t4\n"
+
+def test_page_range():
+    assert page_range("12") == (12, 12)
+    assert page_range(" 10 - 40 ") == (10, 40)
+    assert page_range("40-10") is None
+    assert page_range("1-2-3") is None
+    assert page_range("zwölf") is None
+
+def test_single_page_filter(tmp_path):
+    store = ResultStore(str(tmp_path / "questions.sqlite"))
+    store.add_response("doc", 7, parse_questions(essay("A", 11) + essay("B", 12) + essay("C", 13)))
+    assert [row["title"] for row in store.search("Föderalismus", pages=page_range("12"))] == ["B"]
+    assert dict(store.facet_counts("page", pages=page_range("12-13"))) == {12: 1, 13: 1}
+    store.close()
+
+def test_version_moves_with_every_write(tmp_path):
+    path = str(tmp_path / "questions.sqlite")
+    store, other = ResultStore(path), ResultStore(path)
+    before = store.version()
+    assert store.version() == before
+    other.add_response("doc", 7, parse_questions(essay("A", 11)))
+    after = store.version()
+    assert after != before
+    store.add_response("doc", 7, parse_questions(essay("B", 12)))
+    assert store.version() != after
+    store.close()
+    other.close()
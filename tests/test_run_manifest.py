@@ -0,0 +1,30 @@
+import sqlite3
+
+import app
+from response_cache import ResponseCache
+from run_manifest import RunManifest
+
+def test_cache_hits_are_reused_and_every_output_is_recorded(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    messages = app.build_base_messages("Ein Text.") + [{"role": "user", "content": "prompt"}]
+    app.cached_completion(messages, cache, request=lambda chat_messages: "cached earlier")
+
+    # A fresh manifest has no row for the output; the cache hit alone makes it reused
+    manifest = RunManifest(str(tmp_path / "manifest.sqlite"))
+    run = manifest.document("doc", 1)
+    calls = []
+    text = app.cached_completion(messages, cache, request=lambda chat_messages: calls.append(1) or "new", run=run)
+    assert text == "cached earlier" and not calls
+    assert (run.reused, run.generated) == (1, 0)
+
+    run = manifest.document("doc", 1)
+    assert app.cached_completion(messages, None, request=lambda chat_messages: "new", run=run) == "new"
+    assert (run.reused, run.generated) == (0, 1)
+    manifest.close()
+    assert sqlite3.connect(tmp_path / "manifest.sqlite").execute("SELECT document, response, chunk FROM outputs").fetchall() == [("doc", 1, 0)]
+    cache.close()
+
+def test_opening_the_manifest_leaves_the_output_folder_alone(tmp_path):
+    (tmp_path / ".pieces").mkdir()
+    RunManifest(str(tmp_path / "manifest.sqlite")).close()
+    assert (tmp_path / ".pieces").is_dir()
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+import scheduler
+from benchmarks.fake_openai_server import FakeOpenAIState, start_server
+from model_backend import BackendError, HTTPBackend
+from scheduler import RequestScheduler
+
+MESSAGES = [{"role": "user", "content": "Hallo"}]
+
+class ScriptedState(FakeOpenAIState):
+    # Answers with the given statuses first, then 200
+    def __init__(self, statuses, **kwargs):
+        super().__init__(latency=0, jitter=0, **kwargs)
+        self.statuses = list(statuses)
+
+    def decide(self):
+        with self.lock:
+            self.counts["requests"] += 1
+            return self.statuses.pop(0) if self.statuses else 200
+
+def test_retry_after_from_the_server_holds_the_retry_back():
+    state = ScriptedState([429], retry_after=0.5)
+    server, base = start_server(state)
+    backend = HTTPBackend(base, "key")
+    limiter = RequestScheduler(requests_per_minute=None, tokens_per_minute=None, base_delay=0.001)
+    started = time.monotonic()
+    text, usage = limiter.run(lambda messages: backend.complete(messages, "fake"), MESSAGES)
+    assert text.startswith("Echo: Hallo")
+    assert time.monotonic() - started >= 0.5
+    assert state.counts["requests"] == 2 and limiter.stats["retries"] == 1
+    # Every caller is paused, not only the one that got the 429
+    assert limiter.paused_until >= started + 0.5
+    backend.close()
+    server.shutdown()
+
+def test_backoff_doubles_and_gives_up_after_max_retries(monkeypatch):
+    delays = []
+    monkeypatch.setattr(scheduler.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(scheduler.time, "sleep", delays.append)
+
+    def failing(messages):
+        raise BackendError("HTTP 500: Internal error", 500)
+
+    limiter = RequestScheduler(requests_per_minute=None, tokens_per_minute=None, max_retries=3, base_delay=0.1, max_delay=0.3)
+    with pytest.raises(BackendError):
+        limiter.run(failing, MESSAGES)
+    assert delays == [0.1, 0.2, 0.3]
+    assert (limiter.stats["retries"], limiter.stats["failures"]) == (3, 1)
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def rejected(messages):
+        calls.append(1)
+        raise BackendError("HTTP 400: bad request", 400)
+
+    limiter = RequestScheduler(requests_per_minute=None, tokens_per_minute=None)
+    with pytest.raises(BackendError):
+        limiter.run(rejected, MESSAGES)
+    assert len(calls) == 1 and limiter.stats["failures"] == 1
+
+def test_request_and_token_limits_hold_calls_until_the_window_slides():
+    limiter = RequestScheduler(requests_per_minute=2, tokens_per_minute=None)
+    limiter.acquire(10)
+    limiter.acquire(10)
+    now = time.monotonic()
+    assert 59 < limiter._wait_time(10, now) <= 60
+    assert limiter._wait_time(10, now + 60) == 0
+
+    limiter = RequestScheduler(requests_per_minute=None, tokens_per_minute=1000)
+    limiter.acquire(600)
+    now = time.monotonic()
+    assert limiter._wait_time(400, now) == 0
+    assert limiter._wait_time(500, now) > 59
+    assert limiter._wait_time(500, now + 60) == 0
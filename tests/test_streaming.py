@@ -0,0 +1,31 @@
+import os
+
+import app
+
+def stream_then_fail(chat_messages, model=app.MODEL, usage=None, **kwargs):
+    yield "Typ\tMC\n"
+    raise ConnectionError("stream broke")
+
+def stream_ok(chat_messages, model=app.MODEL, usage=None, **kwargs):
+    yield "Typ\tMC\n"
+    yield "Title\tNeu\n"
+
+def run(tmp_path):
+    events = app.generate_streaming_responses(app.build_base_messages("Ein Text."), ["prompt"], file_prefix="doc", output_folder=str(tmp_path))
+    return [event for event in events if event[0] == "done"]
+
+def test_broken_stream_keeps_the_previous_response(monkeypatch, tmp_path):
+    path = app.response_path(1, file_prefix="doc", output_folder=str(tmp_path))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("previous run")
+    monkeypatch.setattr(app, "stream_completion", stream_then_fail)
+    [(_, _, content, error, _, _)] = run(tmp_path)
+    assert content is None and isinstance(error, ConnectionError)
+    assert open(path, encoding='utf-8').read() == "previous run"
+    assert os.listdir(tmp_path) == ["doc_response_1.txt"]
+
+def test_finished_stream_replaces_the_response(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "stream_completion", stream_ok)
+    [(_, _, content, error, _, path)] = run(tmp_path)
+    assert error is None and open(path, encoding='utf-8').read() == content == "Typ\tMC\nTitle\tNeu\n"
+    assert os.listdir(tmp_path) == ["doc_response_1.txt"]
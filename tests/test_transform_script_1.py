@@ -0,0 +1,37 @@
+import json
+
+from transform_script_1 import iter_json_items, transform_output
+
+ITEMS = [
+    {"page_number": str(n), "subject": "Fächer", "text": f"Die Zelle {n} – „Kern“", "blanks": ["Zelle"], "ok": n % 2 == 0, "none": None}
+    for n in range(6)
+]
+
+def test_chunk_boundaries_inside_escapes_and_literals_keep_every_item():
+    data = json.dumps(ITEMS)
+    for size in range(1, len(data) // 2):
+        errors = []
+        assert list(iter_json_items([data[k:k + size] for k in range(0, len(data), size)], errors)) == ITEMS, size
+        assert errors == [], size
+
+def test_malformed_item_is_skipped_and_reported():
+    data = '[{"a": 1}, {"a": tru}, {"a": 3}]'
+    for size in (1, 3, 7, 100):
+        errors = []
+        assert list(iter_json_items([data[k:k + size] for k in range(0, len(data), size)], errors)) == [{"a": 1}, {"a": 3}]
+        assert len(errors) == 1 and errors[0].startswith("Malformed")
+
+def test_transform_output_reports_skipped_items():
+    errors = []
+    transform_output('[{"text": "Die Zelle", "blanks": ["Zelle"]}, {"text": "abgeschnit', errors)
+    assert len(errors) == 1 and errors[0].startswith("Truncated")
+
+def test_an_empty_array_is_zero_questions_not_an_error():
+    for text in ('[]', '```json\n[ ]\n```'):
+        errors = []
+        assert transform_output(text, errors) == "\n---\n"
+        assert errors == []
+    assert transform_output("Keine Fragen.").startswith("Error parsing JSON: No JSON array found")
+    assert transform_output("[").startswith("Error parsing JSON: Unterminated JSON array")
+    # The closing bracket was skipped while resyncing, so only the malformed item is reported
+    assert "Unterminated" not in transform_output('[{"a": tru}]')
@@ -0,0 +1,139 @@
+import os
+import re
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
+from xml.etree.ElementTree import iterparse
+
+DOCUMENT_XML = "word/document.xml"
+# Headers go before the body and footers after it, as docx2txt did: the prompts read the
+# subject from the top of the text and the page number from the bottom
+HEADER_XML = re.compile(r"word/header\d*\.xml$")
+FOOTER_XML = re.compile(r"word/footer\d*\.xml$")
+PAGE_BREAK = "\f"  # chunking.split_sections treats a form feed as a page boundary
+DEFAULT_CACHE_CHARS = 50_000_000
+
+def local_name(tag):
+    # Matches both transitional and strict OOXML namespaces
+    return tag.rpartition("}")[2]
+
+def attribute(element, name):
+    for key, value in element.attrib.items():
+        if local_name(key) == name:
+            return value
+    return None
+
+def iter_xml_blocks(xml):
+    # Streams one WordprocessingML part and yields one string per paragraph, or PAGE_BREAK.
+    # Finished paragraphs are cleared so memory stays flat for long documents.
+    stack = []  # Paragraphs can nest, e.g. inside text boxes
+    page_has_text = False
+    for event, element in iterparse(xml, events=("start", "end")):
+        name = local_name(element.tag)
+        if event == "start":
+            if name == "p":
+                stack.append([])
+            continue
+
+        if name == "t" and stack:
+            stack[-1].append(element.text or "")
+        elif name == "tab" and stack:
+            stack[-1].append("\t")
+        elif name in ("br", "cr", "lastRenderedPageBreak") and stack:
+            if name == "cr" or (name == "br" and attribute(element, "type") != "page"):
+                stack[-1].append("\n")
+            elif page_has_text or any(stack[-1]):
+                # Text before the break stays on the old page; repeated breaks collapse
+                before = "".join(stack[-1])
+                if before.strip():
+                    yield before
+                stack[-1].clear()
+                yield PAGE_BREAK
+                page_has_text = False
+        elif name == "p" and stack:
+            paragraph = "".join(stack.pop())
+            if paragraph.strip():
+                page_has_text = True
+                yield paragraph
+            element.clear()
+        elif name in ("tbl", "sdt", "txbxContent"):
+            element.clear()
+
+def iter_docx_blocks(file, headers=True):
+    # Yields one string per paragraph, or PAGE_BREAK. Each section can have its own header
+    # and footer part; parts repeating an earlier one's text are left out, headers=False drops them all.
+    with zipfile.ZipFile(file) as docx:
+        names = docx.namelist()
+        seen = set()
+
+        def parts(pattern):
+            for name in names:
+                if headers and pattern.match(name):
+                    with docx.open(name) as xml:
+                        paragraphs = [block for block in iter_xml_blocks(xml) if block != PAGE_BREAK]
+                    if paragraphs and tuple(paragraphs) not in seen:
+                        seen.add(tuple(paragraphs))
+                        yield from paragraphs
+
+        yield from parts(HEADER_XML)
+        with docx.open(DOCUMENT_XML) as xml:
+            yield from iter_xml_blocks(xml)
+        yield from parts(FOOTER_XML)
+
+def extract_docx_text(file, headers=True):
+    pages = [[]]
+    for block in iter_docx_blocks(file, headers):
+        if block == PAGE_BREAK:
+            pages.append([])
+        else:
+            pages[-1].append(block)
+    return f"\n{PAGE_BREAK}\n".join("\n\n".join(page) for page in pages if page)
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    # Extracted text keyed by content hash, evicted least recently used by total size
+    def __init__(self, max_chars=DEFAULT_CACHE_CHARS):
+        self.max_chars = max_chars
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is not None:
+                self.entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = text
+            self.size += len(text)
+            while self.size > self.max_chars and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+_cache = ExtractionCache()
+
+def extract_text(file, name, cache=_cache):
+    # Streamlit reruns the script on every widget change; the same upload is parsed only once
+    key = f"{os.path.splitext(name)[1].lower()}:{content_hash(file)}"
+    text = cache.get(key) if cache is not None else None
+    if text is None:
+        if name.lower().endswith('.docx'):
+            text = extract_docx_text(file)
+        else:
+            text = file.read().decode('utf-8')
+        if cache is not None:
+            cache.put(key, text)
+    return text
@@ -0,0 +1,188 @@
+import io
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# USD per million tokens: (prompt, cached prompt, completion)
+PRICES = {
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00)
+}
+METRIC_PREFIX = "olat_generator"
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    # Unknown models are not guessed at; they report no cost rather than a wrong one
+    prices = PRICES.get(model)
+    if prices is None:
+        for name in sorted(PRICES, key=len, reverse=True):
+            if model.startswith(name):
+                prices = PRICES[name]
+                break
+        else:
+            return None
+    prompt_price, cached_price, completion_price = prices
+    return ((prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
+            + completion_tokens * completion_price) / 1e6
+
+class Span:
+    __slots__ = ("stage", "attributes", "started", "duration", "prompt_tokens", "cached_tokens",
+                 "completion_tokens", "cost", "error")
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+        self.started = time.time()
+        self.duration = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cost = None
+        self.error = None
+
+    def add_usage(self, usage, model):
+        # usage is the dict filled by app.request_completion/stream_completion; without
+        # a "source" the response came from the local cache and cost nothing
+        self.attributes["source"] = usage.get("source", "cache")
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.cached_tokens += usage.get("cached_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        if usage.get("source"):
+            cost = estimate_cost(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("cached_tokens", 0))
+            if cost is not None:
+                self.cost = (self.cost or 0.0) + cost
+            self.attributes["model"] = model
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            **self.attributes,
+            "started": self.started,
+            "duration": round(self.duration, 6),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": self.cost,
+            "error": self.error
+        }
+
+class Tracer:
+    # Collects spans from the Streamlit thread and the prompt workers of one run
+    def __init__(self, question_types=None):
+        self.question_types = question_types or {}
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        response = attributes.get("response")
+        if response in self.question_types:
+            attributes["question_type"] = self.question_types[response]
+        span = Span(stage, attributes)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            with self.lock:
+                self.spans.append(span)
+
+    def summary(self):
+        # One row per (stage, response), in pipeline order
+        rows = {}
+        for span in sorted(self.spans, key=lambda s: s.started):
+            key = (span.stage, span.attributes.get("response"))
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {
+                    "Stage": span.stage,
+                    "Response": "" if key[1] is None else str(key[1]),
+                    "Question type": span.attributes.get("question_type", ""),
+                    "Model": span.attributes.get("model", ""),
+                    "Calls": 0,
+                    "Seconds": 0.0,
+                    "Prompt tokens": 0,
+                    "Cached prompt tokens": 0,
+                    "Completion tokens": 0,
+                    "Cost (USD)": 0.0,
+                    "Errors": 0
+                }
+            row["Calls"] += 1
+            row["Seconds"] += span.duration
+            row["Prompt tokens"] += span.prompt_tokens
+            row["Cached prompt tokens"] += span.cached_tokens
+            row["Completion tokens"] += span.completion_tokens
+            row["Cost (USD)"] += span.cost or 0.0
+            row["Errors"] += span.error is not None
+        for row in rows.values():
+            row["Seconds"] = round(row["Seconds"], 3)
+            row["Cost (USD)"] = round(row["Cost (USD)"], 6)
+        return list(rows.values())
+
+    def totals(self, stage=None):
+        spans = [s for s in self.spans if stage is None or s.stage == stage]
+        return {
+            "prompt_tokens": sum(s.prompt_tokens for s in spans),
+            "cached_tokens": sum(s.cached_tokens for s in spans),
+            "completion_tokens": sum(s.completion_tokens for s in spans),
+            "cost": sum(s.cost or 0.0 for s in spans)
+        }
+
+    def to_jsonl(self):
+        with self.lock:
+            spans = list(self.spans)
+        return "".join(json.dumps(span.to_dict(), ensure_ascii=False) + "\n" for span in spans)
+
+    def to_prometheus(self):
+        # Text exposition format, e.g. for the node_exporter textfile collector
+        metrics = {}
+        for span in self.spans:
+            labels = {"stage": span.stage}
+            if span.attributes.get("question_type"):
+                labels["question_type"] = span.attributes["question_type"]
+            if span.attributes.get("model"):
+                labels["model"] = span.attributes["model"]
+            key = tuple(sorted(labels.items()))
+            m = metrics.setdefault(key, {"sum": 0.0, "count": 0, "errors": 0, "prompt": 0, "cached": 0, "completion": 0, "cost": 0.0})
+            m["sum"] += span.duration
+            m["count"] += 1
+            m["errors"] += span.error is not None
+            m["prompt"] += span.prompt_tokens
+            m["cached"] += span.cached_tokens
+            m["completion"] += span.completion_tokens
+            m["cost"] += span.cost or 0.0
+
+        out = io.StringIO()
+        families = [
+            ("stage_duration_seconds", "summary", "Time spent per pipeline stage", [("_sum", "sum", None), ("_count", "count", None)]),
+            ("stage_errors_total", "counter", "Failed stage executions", [("", "errors", None)]),
+            ("tokens_total", "counter", "Tokens reported by the API", [("", "prompt", "prompt"), ("", "cached", "cached_prompt"), ("", "completion", "completion")]),
+            ("cost_usd_total", "counter", "Estimated API cost in US dollars", [("", "cost", None)])
+        ]
+        for name, metric_type, help_text, samples in families:
+            out.write(f"# HELP {METRIC_PREFIX}_{name} {help_text}\n")
+            out.write(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}\n")
+            for key, m in sorted(metrics.items()):
+                for suffix, field, kind in samples:
+                    labels = dict(key, kind=kind) if kind else dict(key)
+                    rendered = ",".join(f'{label}="{escape_label(value)}"' for label, value in labels.items())
+                    out.write(f"{METRIC_PREFIX}_{name}{suffix}{{{rendered}}} {m[field]}\n")
+        return out.getvalue()
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+@contextmanager
+def trace(tracer, stage, **attributes):
+    # Lets callers instrument unconditionally; without a tracer the span is simply dropped
+    if tracer is None:
+        yield Span(stage, attributes)
+        return
+    with tracer.span(stage, **attributes) as span:
+        yield span
@@ -1,92 +1,264 @@
-import json
-import random
-
-def clean_json_string(s):
-    # Remove any leading/trailing whitespace and special characters
-    s = s.strip()
-    s = s.lstrip('```json').rstrip('```')
-    return s
-
-def convert_json_to_text_format(json_input):
-    if isinstance(json_input, str):
-        data = json.loads(json_input)
-    else:
-        data = json_input
-
-    fib_output = []
-    ic_output = []
-
-    for item in data:
-        page_number = item.get('page_number', 'N/A')
-        subject = item.get('subject', 'N/A')
-        bloom_level = item.get('bloom_level', 'N/A')
-        text = item.get('text', '')
-        blanks = item.get('blanks', [])
-        wrong_substitutes = item.get('wrong_substitutes', [])
-
-        num_blanks = len(blanks)
-
-        common_header = [
-            f"Keywords\tSeite {page_number}",
-            "Coverage\tLehrmittel Allgemeinbildung",
-            f"Subject\t/Allgemeinbildung/{subject}",
-            f"Level\t{bloom_level}"
-        ]
-
-        # Fill-in-the-Blanks format
-        fib_lines = [
-            "Type\tFIB",
-            *common_header,
-            "Title\t✏✏Vervollständigen Sie die Lücken mit dem korrekten Begriff.✏✏",
-            f"Points\t{num_blanks}"
-        ]
-
-        for blank in blanks:
-            text = text.replace(blank, f"{{blank}}", 1)
-
-        parts = text.split("{blank}")
-        for index, part in enumerate(parts):
-            fib_lines.append(f"Text\t{part.strip()}")
-            if index < len(blanks):
-                fib_lines.append(f"1\t{blanks[index]}\t20")
-
-        fib_output.append('\n'.join(fib_lines))
-
-        # Inline Choice format
-        ic_lines = [
-            "Type\tInlinechoice",
-            *common_header,
-            "Title\tWörter einordnen",
-            "Question\t✏✏Wählen Sie die richtigen Wörter.✏✏",
-            f"Points\t{num_blanks}"
-        ]
-
-        all_options = blanks + wrong_substitutes
-        random.shuffle(all_options)
-
-        for index, part in enumerate(parts):
-            ic_lines.append(f"Text\t{part.strip()}")
-            if index < len(blanks):
-                options_str = '|'.join(all_options)
-                ic_lines.append(f"1\t{options_str}\t{blanks[index]}\t|")
-
-        ic_output.append('\n'.join(ic_lines))
-
-    return '\n\n'.join(fib_output), '\n\n'.join(ic_output)
-
-def transform_output(json_string):
-    try:
-        # Clean the JSON string
-        cleaned_json_string = clean_json_string(json_string)
-        
-        # Parse the cleaned JSON string
-        json_data = json.loads(cleaned_json_string)
-        
-        # Convert to text format
-        fib_output, ic_output = convert_json_to_text_format(json_data)
-        
-        return f"{ic_output}\n---\n{fib_output}"
-    except json.JSONDecodeError as e:
-        return f"Error parsing JSON: {e}\n\nCleaned input:\n{cleaned_json_string}\n\nOriginal input:\n{json_string}"
-    except Exception as e:
-        return f"Error processing input: {e}\n\nOriginal input:\n{json_string}"
+import io
+import json
+import random
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+NEXT_ITEM = re.compile(r',\s*\{')
+COVERAGE = "Lehrmittel Allgemeinbildung"
+SUBJECT_ROOT = "/Allgemeinbildung/"
+# A chunk boundary inside a literal or an escape (true, \ud83d\ude00) fails this close to the end
+TRUNCATION_MARGIN = 16
+
+def clean_json_string(s):
+    # Remove any leading/trailing whitespace and special characters
+    s = s.strip()
+    s = s.lstrip('```json').rstrip('```')
+    return s
+
+def trie_pattern(words):
+    # Alternation folded into a prefix trie, so the regex engine does not retry every word
+    # at every position; optional groups are greedy, so the longest word wins
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def to_regex(node):
+        branches = [re.escape(char) + to_regex(child) for char, child in node.items() if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f"(?:{body})?" if '' in node else body
+
+    return to_regex(trie)
+
+def locate_blanks(text, blanks):
+    # Single left-to-right scan for all blanks at once. A blank containing another one wins;
+    # each blank is used as often as it is listed.
+    remaining = Counter(blank for blank in blanks if blank)
+    if not remaining:
+        return []
+    total = sum(remaining.values())
+    pattern = re.compile(trie_pattern(remaining))
+
+    spans = []
+    for match in pattern.finditer(text):
+        blank = match.group()
+        if remaining[blank]:
+            remaining[blank] -= 1
+            spans.append((match.start(), match.end(), blank))
+            if len(spans) == total:
+                break
+    return spans
+
+def split_at_spans(text, spans):
+    parts = []
+    previous_end = 0
+    for start, end, _ in spans:
+        parts.append(text[previous_end:start])
+        previous_end = end
+    parts.append(text[previous_end:])
+    return parts
+
+def convert_item(item, coverage=COVERAGE, subject_root=SUBJECT_ROOT):
+    page_number = item.get('page_number', 'N/A')
+    subject = item.get('subject', 'N/A')
+    bloom_level = item.get('bloom_level', 'N/A')
+    text = item.get('text', '')
+    blanks = item.get('blanks', [])
+    wrong_substitutes = item.get('wrong_substitutes', [])
+
+    spans = locate_blanks(text, blanks)
+    parts = split_at_spans(text, spans)
+    num_blanks = len(spans)
+
+    common_header = [
+        f"Keywords\tSeite {page_number}",
+        f"Coverage\t{coverage}",
+        f"Subject\t{subject_root}{subject}",
+        f"Level\t{bloom_level}"
+    ]
+
+    # Fill-in-the-Blanks format
+    fib_lines = [
+        "Type\tFIB",
+        *common_header,
+        "Title\t✏✏Vervollständigen Sie die Lücken mit dem korrekten Begriff.✏✏",
+        f"Points\t{num_blanks}"
+    ]
+
+    for index, part in enumerate(parts):
+        fib_lines.append(f"Text\t{part.strip()}")
+        if index < len(spans):
+            fib_lines.append(f"1\t{spans[index][2]}\t20")
+
+    # Inline Choice format
+    ic_lines = [
+        "Type\tInlinechoice",
+        *common_header,
+        "Title\tWörter einordnen",
+        "Question\t✏✏Wählen Sie die richtigen Wörter.✏✏",
+        f"Points\t{num_blanks}"
+    ]
+
+    all_options = blanks + wrong_substitutes
+    random.shuffle(all_options)
+    options_str = '|'.join(all_options)
+
+    for index, part in enumerate(parts):
+        ic_lines.append(f"Text\t{part.strip()}")
+        if index < len(spans):
+            ic_lines.append(f"1\t{options_str}\t{spans[index][2]}\t|")
+
+    return '\n'.join(fib_lines), '\n'.join(ic_lines)
+
+def convert_json_to_text_format(json_input):
+    if isinstance(json_input, str):
+        data = json.loads(json_input)
+    else:
+        data = json_input
+
+    fib_output = []
+    ic_output = []
+
+    for item in data:
+        fib_text, ic_text = convert_item(item)
+        fib_output.append(fib_text)
+        ic_output.append(ic_text)
+
+    return '\n\n'.join(fib_output), '\n\n'.join(ic_output)
+
+def iter_json_items(chunks, errors=None):
+    # Yields each complete object of a top-level JSON array as soon as it has been read.
+    # Malformed items are skipped and a truncated tail is dropped; both are appended to `errors`,
+    # as is input without an opening bracket or one that ends before the closing bracket.
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    offset = 0
+    started = False
+    resync = False
+    exhausted = False
+    chunks = iter(chunks)
+
+    while True:
+        if resync:
+            # After a malformed item, the next object starts at a brace following a comma
+            match = NEXT_ITEM.search(buffer, pos)
+            if match:
+                pos = match.end() - 1
+                resync = False
+            else:
+                # Keep a trailing comma so the match can complete with the next chunk
+                comma = buffer.rfind(',', pos)
+                pos = comma if comma != -1 and not buffer[comma + 1:].strip() else len(buffer)
+
+        # Skip separators and everything up to the opening bracket (code fences, prose)
+        while not resync and pos < len(buffer):
+            char = buffer[pos]
+            if not started:
+                if char == '[':
+                    started = True
+                pos += 1
+            elif char in ' \t\r\n,':
+                pos += 1
+            elif char == ']':
+                return
+            elif char == '{':
+                break
+            else:
+                pos += 1
+
+        if not resync and pos < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                truncated = e.pos >= len(buffer) - (1 if exhausted else TRUNCATION_MARGIN) or e.msg.startswith("Unterminated string")
+                if exhausted or not truncated:
+                    if errors is not None:
+                        errors.append(f"{'Truncated' if truncated else 'Malformed'} item at offset {offset + pos}: {e.msg}")
+                    if truncated:
+                        return
+                    pos += 1
+                    resync = True
+                    continue
+            else:
+                yield item
+                pos = end
+                continue
+
+        if exhausted:
+            # A resync that ran to the end already reported its malformed item
+            if errors is not None and not resync:
+                errors.append(f"Unterminated JSON array at offset {offset + pos}" if started else "No JSON array found")
+            return
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            exhausted = True
+            continue
+        offset += pos
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def iter_file_chunks(f, size=65536):
+    return iter(lambda: f.read(size), '')
+
+def transform_stream(chunks, fib_out, ic_out, errors=None, fold=None, **header):
+    # Converts items as they are parsed; returns the number of converted items.
+    # fold(text) is applied to every written block; header overrides the OLAT header
+    # fields of convert_item (coverage, subject_root).
+    count = 0
+    for item in iter_json_items(chunks, errors):
+        if not isinstance(item, dict):
+            if errors is not None:
+                errors.append(f"Skipped non-object item: {item!r}")
+            continue
+        fib_text, ic_text = convert_item(item, **header)
+        if fold:
+            fib_text, ic_text = fold(fib_text), fold(ic_text)
+        separator = '\n\n' if count else ''
+        fib_out.write(separator + fib_text)
+        ic_out.write(separator + ic_text)
+        count += 1
+    return count
+
+def transform_file(input_path, output_path, errors=None, fib_path=None, fold=None, **header):
+    # With fib_path the FIB blocks get their own file. Otherwise they are spooled to a temporary
+    # file and appended after the Inlinechoice blocks, as in transform_output. Either way
+    # neither input nor output is held in memory.
+    with open(input_path, encoding='utf-8') as f_in, \
+            open(output_path, 'w', encoding='utf-8') as ic_out, \
+            (open(fib_path, 'w', encoding='utf-8') if fib_path else tempfile.TemporaryFile('w+', encoding='utf-8')) as fib_out:
+        count = transform_stream(iter_file_chunks(f_in), fib_out, ic_out, errors, fold, **header)
+        if not fib_path:
+            ic_out.write("\n---\n")
+            fib_out.seek(0)
+            shutil.copyfileobj(fib_out, ic_out)
+    return count
+
+def transform_output(json_string, errors=None):
+    # Items skipped on the way are appended to `errors` when some others were converted.
+    # An empty array is a valid answer with zero questions.
+    try:
+        # Clean the JSON string
+        cleaned_json_string = clean_json_string(json_string)
+
+        # Parse item by item so a truncated or malformed tail keeps every complete item
+        problems = []
+        fib_out = io.StringIO()
+        ic_out = io.StringIO()
+        count = transform_stream([cleaned_json_string], fib_out, ic_out, problems)
+        if problems and not count:
+            return f"Error parsing JSON: {'; '.join(problems)}\n\nCleaned input:\n{cleaned_json_string}\n\nOriginal input:\n{json_string}"
+        if errors is not None:
+            errors.extend(problems)
+
+        return f"{ic_out.getvalue()}\n---\n{fib_out.getvalue()}"
+    except Exception as e:
+        return f"Error processing input: {e}\n\nOriginal input:\n{json_string}"
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+
+import openai
+
+from app import MODEL, build_chunks, finish_run, question_templates, run_pipeline
+from dedup import QuestionIndex
+from model_backend import BACKEND_TYPES, DEFAULT_BACKEND, DEFAULT_LOCAL_BASE, configure_backends
+from run_manifest import DEFAULT_MANIFEST_PATH, RunManifest
+from result_store import DEFAULT_STORE_PATH, ResultStore
+from chunking import DEFAULT_CHUNK_TOKENS
+from job_queue import DEFAULT_QUEUE_PATH, JobQueue
+from page_ingestion import DEFAULT_PAGES_PER_REQUEST, Page
+from response_cache import DEFAULT_CACHE_PATH, ResponseCache
+from scheduler import configure_scheduler
+from tracing import Tracer
+
+JOBS_OUTPUT = os.path.join("output", "jobs")
+HEARTBEAT_SECONDS = 10
+CANCEL_POLL_SECONDS = 1
+
+def watch_cancel(queue, job_id, cancel, done):
+    # Responses can take minutes, so the flag is polled here rather than between responses
+    while not done.wait(CANCEL_POLL_SECONDS):
+        if queue.cancel_requested(job_id):
+            cancel.set()
+            return
+
+def run_job(job, queue, cache=None, manifest=None, store=None):
+    # Headless version of the "Process" button in app.main(). Progress is written to the queue
+    # after every response, so the page can poll it and nothing is lost on a refresh.
+    params = job["params"]
+    cache = cache if params.get("use_cache", True) else None
+    output_folder = os.path.join(JOBS_OUTPUT, job["id"])
+    os.makedirs(output_folder, exist_ok=True)
+    file_prefix = params.get("file_prefix", "manual_input")
+
+    templates = question_templates(bool(params.get("structured_calls")))
+    models = params.get("models") or [template.model or MODEL for template in templates]
+    tracer = Tracer()
+    pages = [Page(number, page_hash) for number, page_hash in params["pages"]] if params.get("pages") else None
+    chunks = build_chunks(
+        params.get("content", ""), pages, params.get("split_long", True), params.get("chunk_tokens", DEFAULT_CHUNK_TOKENS),
+        params.get("pages_per_request") or DEFAULT_PAGES_PER_REQUEST
+    )
+    document_run = manifest.document(file_prefix, len(chunks)) if manifest else None
+    question_index = QuestionIndex(params["course"]) if params.get("course") else None
+
+    progress = {"total": len(templates) + bool(params.get("send_initial")), "done": 0, "responses": []}
+    questions = []
+    cancel = threading.Event()
+    done = threading.Event()
+    threading.Thread(target=watch_cancel, args=(queue, job["id"], cancel, done), daemon=True).start()
+    results = run_pipeline(
+        chunks, templates, models, file_prefix, output_folder, cache=cache, tracer=tracer, document_run=document_run, pages=bool(pages),
+        parallel=params.get("parallel", True), send_initial=params.get("send_initial", False), structured_calls=params.get("structured_calls"),
+        repair=params.get("repair", True), question_index=question_index, store=store, run_id=job["id"], questions=questions, cancel=cancel
+    )
+    try:
+        for entry, _ in results:
+            progress["done"] += 1
+            progress["responses"].append(entry)
+            queue.update_progress(job["id"], progress)
+            if queue.cancel_requested(job["id"]):
+                cancel.set()
+                break
+    finally:
+        # Unsent requests are dropped; ones already in flight finish in the background
+        results.close()
+        done.set()
+    cancelled = cancel.is_set()
+
+    if question_index is not None:
+        question_index.close()
+    return finish_run(progress["responses"], questions, tracer, document_run, output_folder, file_prefix), cancelled
+
+def keep_alive(queue, job_id, worker_id, stop):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        queue.heartbeat(job_id, worker_id)
+
+def worker_loop(worker_id, queue_path, cache_path, poll_seconds, requests_per_minute, tokens_per_minute, api_base, manifest_path=DEFAULT_MANIFEST_PATH,
+                backend=None, local_base=None, store_path=DEFAULT_STORE_PATH):
+    # Streamlit warns about missing script context in every thread; irrelevant here
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    if api_base:
+        openai.api_base = api_base
+    queue = JobQueue(queue_path)
+    cache = ResponseCache(cache_path) if cache_path else None
+    manifest = RunManifest(manifest_path)
+    store = ResultStore(store_path)
+    configure_scheduler(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    configure_backends(default=backend, local_base=local_base)
+    print(f"{worker_id}: waiting for jobs in {queue_path}", flush=True)
+
+    while True:
+        queue.heartbeat(worker_id=worker_id)
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_seconds)
+            continue
+
+        # One job at a time per process, so the global API key belongs to this job only
+        openai.api_key = job["secret"] or os.environ.get("OPENAI_API_KEY")
+        stop = threading.Event()
+        threading.Thread(target=keep_alive, args=(queue, job["id"], worker_id, stop), daemon=True).start()
+        started = time.monotonic()
+        print(f"{worker_id}: job {job['id']} ({job['label']}) started, attempt {job['attempts']}", flush=True)
+        try:
+            result, cancelled = run_job(job, queue, cache, manifest, store)
+            if cancelled:
+                queue.mark_cancelled(job["id"], result)
+            else:
+                # Partial failures are reported per response; the job only fails if nothing came back
+                failed = [entry for entry in result["responses"] if entry["error"]]
+                all_failed = failed and len(failed) == len(result["responses"])
+                queue.finish(job["id"], result, f"all {len(failed)} responses failed: {failed[0]['error']}" if all_failed else None)
+            print(f"{worker_id}: job {job['id']} {'cancelled' if cancelled else 'finished'} in {time.monotonic() - started:.1f}s", flush=True)
+        except Exception as e:
+            queue.finish(job["id"], None, str(e))
+            print(f"{worker_id}: job {job['id']} failed: {e}", file=sys.stderr, flush=True)
+        finally:
+            stop.set()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued question generation jobs submitted from the Streamlit app.")
+    parser.add_argument("--processes", type=int, default=2, help="Jobs processed at the same time")
+    parser.add_argument("--queue-path", default=DEFAULT_QUEUE_PATH, help="SQLite job queue location")
+    parser.add_argument("--poll", type=float, default=2.0, help="Seconds between checks of an empty queue")
+    parser.add_argument("--rpm", type=int, default=500, help="Requests-per-minute budget shared by all processes")
+    parser.add_argument("--tpm", type=int, default=200000, help="Tokens-per-minute budget shared by all processes")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached responses")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite response cache location")
+    parser.add_argument("--manifest-path", default=DEFAULT_MANIFEST_PATH, help="Run manifest shared with the app")
+    parser.add_argument("--store-path", default=DEFAULT_STORE_PATH, help="SQLite question store shared with the app")
+    parser.add_argument("--backend", choices=sorted(BACKEND_TYPES), default=DEFAULT_BACKEND,
+                        help="Client for models without a backend prefix: the openai SDK or a pooled aiohttp client")
+    parser.add_argument("--local-base", default=DEFAULT_LOCAL_BASE, help="OpenAI-compatible local server for 'local:<model>' names")
+    parser.add_argument("--api-base", default=os.environ.get("OPENAI_API_BASE"), help="OpenAI-compatible endpoint")
+    args = parser.parse_args()
+
+    cache_path = None if args.no_cache else args.cache_path
+    processes = max(1, args.processes)
+    # Each process schedules its own requests, so the account budget is split between them
+    worker_args = (args.queue_path, cache_path, args.poll, max(1, args.rpm // processes), max(1, args.tpm // processes), args.api_base, args.manifest_path,
+                   args.backend, args.local_base, args.store_path)
+    host = socket.gethostname()
+    if processes == 1:
+        worker_loop(f"{host}-{os.getpid()}-0", *worker_args)
+        return
+
+    children = [
+        multiprocessing.Process(target=worker_loop, args=(f"{host}-{os.getpid()}-{n}",) + worker_args, daemon=True)
+        for n in range(processes)
+    ]
+    for child in children:
+        child.start()
+    # Daemon children are terminated when the parent exits, including on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()